@@ -0,0 +1,342 @@
+from __future__ import annotations
+
+try:
+    import os, re, time, zlib, socket, sqlite3, tempfile, threading
+    from functools import lru_cache
+    from contextlib import contextmanager
+    from datetime import datetime, date
+    import pymssql
+    from pymssql import OperationalError, InterfaceError, DatabaseError, ProgrammingError, IntegrityError
+except ImportError as error:
+    print(error)
+
+class MSSQLBackend:
+    """ This class connects DB to TMS on the MS Server through pymssql.
+    ## Methods (3)
+    - connect : host (str), user (str), password (str), database (str) -> Connection
+    - resolve : host (str), port (int) -> str
+    - reachable : address (str), port (int) -> bool
+    """
+
+    name = 'mssql'
+
+    def connect(self, host:str, user:str, password:str, database:str):
+        """ Open a connection to the MS Server
+        ### Parameters
+        - host (str) : host name of the MS Server
+        - user (str) : user name
+        - password (str) : password
+        - database (str) : name of the TMS database
+        ### Returns
+        - Connection : new pymssql connection
+        """
+        return pymssql.connect(host, user, password, database)
+
+    def resolve(self, host:str, port:int) -> str:
+        """ Resolve the host name of the MS Server
+        ### Parameters
+        - host (str) : host name
+        - port (int) : port number
+        ### Returns
+        - str : address of the host
+        """
+        return socket.getaddrinfo(host, port)[0][4][0]
+
+    def reachable(self, address:str, port:int) -> bool:
+        """ Check the MS Server accepts connections on its port
+        ### Parameters
+        - address (str) : address returned by resolve
+        - port (int) : port number
+        ### Returns
+        - bool : True if the port is open
+        """
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            return sock.connect_ex((address, port)) == 0
+
+# T-SQL CONSTRUCTS THE TOOL SENDS, REWRITTEN FOR SQLITE IN THIS ORDER
+REWRITES = [
+    (re.compile(r"IF OBJECT_ID\('tempdb\.\.#(\w+)'\) IS NOT NULL DROP TABLE #\w+", re.I), r'DROP TABLE IF EXISTS temp.\1'),
+    (re.compile(r"IF NOT EXISTS \(SELECT \* FROM dbo\.sysobjects\b.*?\) BEGIN (CREATE TABLE) (.*) END\s*$", re.I | re.S), r'\1 IF NOT EXISTS \2'),
+    (re.compile(r'CREATE TABLE #(\w+)', re.I), r'CREATE TEMP TABLE \1'),
+    (re.compile(r'^\s*SELECT (.*?) INTO #(\w+) FROM ', re.I | re.S), r'CREATE TEMP TABLE \2 AS SELECT \1 FROM '),
+    (re.compile(r'CROSS APPLY \(SELECT TOP 1 [^()]*? FROM (\w+) WHERE ([^()]*?) ORDER BY (\w+)\) (\w+)', re.I), r'JOIN \1 \4 ON \4.\3 = (SELECT \3 FROM \1 WHERE \2 ORDER BY \3 LIMIT 1)'),
+    (re.compile(r'\bdbo\.\[?(\w+)\]?', re.I), r'\1'),
+    (re.compile(r'#(\w+)'), r'\1'),
+    (re.compile(r'NVARCHAR\(MAX\)', re.I), 'NVARCHAR'),
+    (re.compile(r'^\s*SELECT TOP (\d+) (.*)$', re.I | re.S), r'SELECT \2 LIMIT \1'),
+    (re.compile(r'%[sd]'), '?'),
+]
+OUTPUT = re.compile(r'\s*OUTPUT ((?:INSERTED\.\[?\w+\]?(?:,\s*)?)+) INTO (?:dbo\.)?\[?(\w+)\]?', re.I)
+UPDATEJOIN = re.compile(r'^\s*UPDATE (\w+) SET (.*?) FROM (\w+) (\w+) JOIN (#?\w+) (\w+) ON (.*?)(?: WHERE (.*))?$', re.I | re.S)
+
+@lru_cache(maxsize=256)
+def translate(query:str) -> tuple:
+    """ Rewrite a T-SQL statement sent by DB for SQLite
+    ### Parameters
+    - query (str) : T-SQL statement with pymssql placeholders
+    ### Returns
+    - tuple : SQLite statement, and the table and columns of an OUTPUT ... INTO clause or None
+    """
+    output = None
+    match = OUTPUT.search(query)
+    if match:
+        # OUTPUT INSERTED ... INTO BECOMES RETURNING; THE CURSOR COPIES THE RETURNED ROWS INTO THE TABLE
+        columns = tuple(re.sub(r'INSERTED\.\[?(\w+)\]?', r'\1', c.strip(), flags=re.I) for c in match.group(1).split(','))
+        output = (match.group(2), columns)
+        query = query[:match.start()] + query[match.end():] + f' RETURNING {", ".join(columns)}'
+    match = UPDATEJOIN.match(query)
+    if match and match.group(1) == match.group(4):
+        table, alias = match.group(3), match.group(4)
+        assignments = re.sub(rf'(^|,\s*){alias}\.', r'\1', match.group(2))
+        where = match.group(7) + (f' AND ({match.group(8)})' if match.group(8) else '')
+        query = f'UPDATE {table} AS {alias} SET {assignments} FROM {match.group(5)} AS {match.group(6)} WHERE {where}'
+    for pattern, replacement in REWRITES:
+        query = pattern.sub(replacement, query)
+    return query, output
+
+def binaryChecksum(*values) -> int:
+    """ Stand in for BINARY_CHECKSUM: a signed 32 bit checksum over the values of a row """
+    crc = zlib.crc32('\x1f'.join(repr(v) for v in values).encode('utf8'))
+    return crc - 2**32 if crc >= 2**31 else crc
+
+class ChecksumAgg:
+    """ Stand in for CHECKSUM_AGG: combines the checksums of a group so any changed row changes the result """
+
+    def __init__(self):
+        self.value = None
+
+    def step(self, checksum) -> None:
+        if checksum is not None: self.value = (self.value or 0) ^ checksum
+
+    def finalize(self) -> int:
+        return self.value
+
+@contextmanager
+def mssqlErrors():
+    """ Raise SQLite errors as the pymssql errors DB catches """
+    try:
+        yield
+    except sqlite3.IntegrityError as error:
+        raise IntegrityError(str(error)) from error
+    except sqlite3.OperationalError as error:
+        raise OperationalError(str(error)) from error
+    except (sqlite3.ProgrammingError, sqlite3.InterfaceError) as error:
+        raise ProgrammingError(str(error)) from error
+    except sqlite3.Error as error:
+        raise DatabaseError(str(error)) from error
+
+class SQLiteCursor:
+    """ This class gives a SQLite cursor the parts of the pymssql cursor that DB uses. Statements are translated from T-SQL and every round trip is charged the latency of the backend.
+    ## Methods (8)
+    - values : params (tuple) -> tuple
+    - execute : query (str), params (tuple) -> None
+    - executemany : query (str), params (list) -> None
+    - fetchone : () -> tuple/dict
+    - fetchmany : size (int) -> list
+    - fetchall : () -> list
+    - row : values (tuple) -> tuple/dict
+    - close : () -> None
+    """
+
+    def __init__(self, backend:SQLiteBackend, cursor:sqlite3.Cursor, asDict:bool=False):
+        self.backend = backend
+        self.cursor = cursor
+        self.asDict = asDict
+        self.rows = None    # ROWS HELD BACK BY AN OUTPUT ... INTO STATEMENT
+        self.rowcount = -1
+
+    @staticmethod
+    def values(params) -> tuple:
+        """ Bind parameters the way pymssql accepts them: None, a single value or a sequence """
+        if params is None: return ()
+        if not isinstance(params, (tuple, list)): params = (params,)
+        return tuple(p.isoformat(sep=' ') if isinstance(p, datetime) else p.isoformat() if isinstance(p, date) else p for p in params)
+
+    def execute(self, query:str, params=None) -> None:
+        """ Run one statement in one round trip
+        ### Parameters
+        - query (str) : T-SQL statement
+        - params (tuple) : parameters for the statement (default=None)
+        """
+        self.backend.trip()
+        sql, output = translate(query)
+        with mssqlErrors():
+            self.cursor.execute(sql, self.values(params))
+            self.rows = None
+            if output is not None:
+                table, columns = output
+                returned = self.cursor.fetchall()
+                self.cursor.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', returned)
+                self.rows = []
+                self.rowcount = len(returned)
+            else:
+                self.rowcount = self.cursor.rowcount
+
+    def executemany(self, query:str, params:list) -> None:
+        """ Run one statement per set of parameters; pymssql sends each of them in its own round trip
+        ### Parameters
+        - query (str) : T-SQL statement
+        - params (list) : parameters for each run
+        """
+        rowcount = 0
+        for values in params:
+            self.execute(query, values)
+            rowcount += max(self.rowcount, 0)
+        self.rowcount = rowcount
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size:int=1) -> list:
+        """ Fetch up to size rows of the last SELECT
+        ### Parameters
+        - size (int) : number of rows (default=1)
+        ### Returns
+        - list : rows as tuples, or dictionaries for a cursor opened with as_dict
+        """
+        if self.cursor.description is None: raise OperationalError('Statement not executed or executed statement has no resultset')
+        with mssqlErrors():
+            return [self.row(r) for r in self.cursor.fetchmany(size)]
+
+    def fetchall(self) -> list:
+        """ Fetch the remaining rows of the last SELECT
+        ### Returns
+        - list : rows as tuples, or dictionaries for a cursor opened with as_dict
+        """
+        if self.rows is not None or self.cursor.description is None: raise OperationalError('Statement not executed or executed statement has no resultset')
+        with mssqlErrors():
+            return [self.row(r) for r in self.cursor.fetchall()]
+
+    def row(self, values:tuple):
+        """ Shape a row like pymssql does """
+        if not self.asDict: return values
+        return { d[0] : v for d, v in zip(self.cursor.description, values) }
+
+    def close(self) -> None:
+        self.cursor.close()
+
+class SQLiteConnection:
+    """ This class gives a SQLite connection the parts of the pymssql connection that DB and ConnectionPool use.
+    ## Methods (4)
+    - cursor : as_dict (bool) -> SQLiteCursor
+    - commit : () -> None
+    - rollback : () -> None
+    - close : () -> None
+    """
+
+    def __init__(self, backend:SQLiteBackend, conn:sqlite3.Connection):
+        self.backend = backend
+        self.conn = conn
+
+    def cursor(self, as_dict:bool=False) -> SQLiteCursor:
+        return SQLiteCursor(self.backend, self.conn.cursor(), as_dict)
+
+    def commit(self) -> None:
+        self.backend.trip()
+        with mssqlErrors():
+            self.conn.commit()
+
+    def rollback(self) -> None:
+        self.backend.trip()
+        with mssqlErrors():
+            self.conn.rollback()
+
+    def close(self) -> None:
+        self.conn.close()
+
+class SQLiteBackend:
+    """ This class stands in for TMS on the MS Server with a SQLite file that holds the tables the tool touches: MediaRenditions, MediaFormats, MediaFiles, MediaExtensions and the scratch table. The T-SQL that DB sends is translated, and a latency can be charged per round trip to model a slow link, so whole runs can be timed without a server.
+    ## Methods (7)
+    - connect : host (str), user (str), password (str), database (str) -> SQLiteConnection
+    - resolve : host (str), port (int) -> str
+    - reachable : address (str), port (int) -> bool
+    - trip : () -> None
+    - create : () -> None
+    - seed : catalog (dict) -> None
+    - close : () -> None
+    """
+
+    name = 'sqlite'
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS MediaRenditions (RenditionID INTEGER PRIMARY KEY, MediaMasterID INT, RenditionNumber NVARCHAR(450), PrimaryFileID INT, ThumbPathID INT, ThumbFileName NVARCHAR, ThumbExtensionID INT)',
+        'CREATE INDEX IF NOT EXISTS MediaRenditionsNumber ON MediaRenditions (RenditionNumber)',
+        'CREATE INDEX IF NOT EXISTS MediaRenditionsMaster ON MediaRenditions (MediaMasterID)',
+        'CREATE TABLE IF NOT EXISTS MediaFormats (FormatID INTEGER PRIMARY KEY, Format NVARCHAR(450), MediaTypeID INT)',
+        'CREATE INDEX IF NOT EXISTS MediaFormatsFormat ON MediaFormats (Format)',
+        'CREATE TABLE IF NOT EXISTS MediaFiles (FileID INTEGER PRIMARY KEY AUTOINCREMENT, RenditionID INT, PathID INT, FileName NVARCHAR, FormatID INT, LoginID NVARCHAR(32), ArchIDNum NVARCHAR(450), EnteredDate DATETIME)',
+        'CREATE TABLE IF NOT EXISTS MediaExtensions (ExtensionID INTEGER PRIMARY KEY, FormatID INT, Extension NVARCHAR(32), LoginID NVARCHAR(32), EnteredDate DATETIME)',
+    ]
+
+    def __init__(self, path:str=None, latency:float=0.0):
+        """
+        ### Parameters
+        - path (str) : SQLite file holding the TMS tables (default=None, a new temporary file)
+        - latency (float) : seconds charged per round trip (default=0.0)
+        """
+        self.temporary = path is None
+        self.path = path or os.path.join(tempfile.mkdtemp(prefix='offloader-tms-'), 'tms.db')
+        self.latency = latency
+        self.roundTrips = 0
+        self.lock = threading.Lock()
+        self.create()
+
+    def connect(self, host:str=None, user:str=None, password:str=None, database:str=None) -> SQLiteConnection:
+        """ Open a connection to the SQLite file; the login is ignored
+        ### Returns
+        - SQLiteConnection : connection that behaves like a pymssql connection
+        """
+        self.trip()
+        with mssqlErrors():
+            conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False)
+            conn.create_function('GETDATE', 0, lambda: datetime.now().isoformat(sep=' '))
+            conn.create_function('BINARY_CHECKSUM', -1, binaryChecksum, deterministic=True)
+            conn.create_aggregate('CHECKSUM_AGG', 1, ChecksumAgg)
+        return SQLiteConnection(self, conn)
+
+    def resolve(self, host:str, port:int) -> str:
+        """ The stand-in runs locally; no name is looked up
+        ### Returns
+        - str : loopback address
+        """
+        return '127.0.0.1'
+
+    def reachable(self, address:str, port:int) -> bool:
+        """ The stand-in is reachable if its file can be opened
+        ### Returns
+        - bool : True if the SQLite file exists
+        """
+        return os.path.isfile(self.path)
+
+    def trip(self) -> None:
+        """ Count a round trip and wait out the latency of the link """
+        with self.lock:
+            self.roundTrips += 1
+        if self.latency > 0: time.sleep(self.latency)
+
+    def create(self) -> None:
+        """ Create the TMS tables if the file does not have them yet """
+        with sqlite3.connect(self.path) as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            for statement in self.SCHEMA: conn.execute(statement)
+        conn.close()
+
+    def seed(self, catalog:dict) -> None:
+        """ Replace MediaRenditions and MediaFormats with a catalog in the form DB downloads them, as made by benchmark.generateCatalog
+        ### Parameters
+        - catalog (dict) : MMIDS and MTIDS records
+        """
+        with sqlite3.connect(self.path) as conn:
+            conn.execute('DELETE FROM MediaRenditions')
+            conn.execute('DELETE FROM MediaFormats')
+            conn.executemany('INSERT INTO MediaRenditions (RenditionNumber, MediaMasterID, RenditionID, PrimaryFileID) VALUES (:RenditionNumber, :MediaMasterID, :RenditionID, :PrimaryFileID)', catalog.get('MMIDS', []))
+            conn.executemany('INSERT INTO MediaFormats (Format, FormatID, MediaTypeID) VALUES (:Format, :FormatID, :MediaTypeID)', catalog.get('MTIDS', []))
+        conn.close()
+
+    def close(self) -> None:
+        """ Delete the SQLite file if the backend made it """
+        if self.temporary:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.isfile(self.path + suffix): os.remove(self.path + suffix)
+            try: os.rmdir(os.path.dirname(self.path))
+            except OSError: pass
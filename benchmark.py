@@ -0,0 +1,629 @@
+from __future__ import annotations
+
+try:
+    import os, sys, json, time, random, shutil, argparse, platform, tempfile, statistics, subprocess, multiprocessing
+    from datetime import datetime
+
+    # PROGRAM DEPENDENCIES
+    from extractor import Extractor
+    from errorHandler import ErrorHandler
+    from logger import Logger
+    from joiner import Joiner
+    from pipeline import Pipeline
+    from workers import WorkerPool, updateItem, updateFileID, verifyItem
+    from db import DB
+    from store import SQLiteStore
+    from scheduler import Scheduler
+    from backends import SQLiteBackend
+except ImportError as error:
+    print(error)
+
+HEADER = ['OBJ-ID', 'OBJ-DELIV-URN', 'OBJ-OSN', 'OBJ-TYPE', 'FILE-OSN', 'FILE-DELIV-URN', 'FILE-ROLE', 'FILE-TYPE', 'FILE-MIMETYPE', 'FILE-ID', 'FILE-NAME', 'FILE-FORMAT', 'FILE-SIZE', 'FILE-STATUS', 'FILE-CHECKSUM']
+FORMATS = [('JPEG2000', 45, 1), ('TIFF', 12, 1), ('XML', 60, 3), ('PDF', 30, 2)]   # FORMAT, FORMATID, MEDIATYPEID
+MISSRATE = 0.02     # SHARE OF ITEMS WITHOUT A RENDITION IN THE CATALOG, SO PROBLEM RECORDS ARE TIMED TOO
+EXTRA = 1.0         # RENDITIONS IN THE CATALOG THAT NO REPORT MENTIONS, AS A SHARE OF THE ITEMS
+STAGES = ['extract', 'join', 'fileIDs', 'compile', 'verify']
+
+def parseSize(text:str) -> int:
+    """
+    Read a row count such as 1000, 100k or 1M
+
+    Args:
+        text (str): row count with an optional k or M suffix
+
+    Returns:
+        int: number of rows
+    """
+    text = str(text).strip()
+    scale = { 'k' : 1000, 'K' : 1000, 'm' : 1000000, 'M' : 1000000 }.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+def renditionNumber(n:int) -> str:
+    """
+    Name the rendition of the nth synthetic item the way TMS numbers Giza renditions
+
+    Args:
+        n (int): number of the item
+
+    Returns:
+        str: rendition number
+    """
+    return f'AAW{n:07d}'
+
+def missing(n:int, missRate:float=MISSRATE) -> bool:
+    """
+    Decide whether the catalog leaves out the rendition of the nth item; the choice is spread evenly and does not depend on the seed
+
+    Args:
+        n (int): number of the item
+        missRate (float, optional): share of items to leave out. Defaults to MISSRATE.
+
+    Returns:
+        bool: True if the item has no rendition in the catalog
+    """
+    return (n * 2654435761) % 10000 < missRate * 10000
+
+def generateReport(path:str, rows:int, seed:int=0, header:bool=True) -> int:
+    """
+    Write a tab-separated DRS report in the layout Extractor.parse reads. Every item is deposited twice, once as XML without a file name and once as JPEG2000, so half of the rows are dropped during extraction as in real reports
+
+    Args:
+        path (str): path of the report
+        rows (int): number of data rows; rounded down to an even number
+        seed (int, optional): seed for sizes and IDs. Defaults to 0.
+        header (bool, optional): start with the two header rows Extractor skips. Defaults to True.
+
+    Returns:
+        int: number of items in the report
+    """
+    rng = random.Random(seed)
+    items = rows // 2
+    with open(path, 'w', encoding='utf8', newline='\n') as f:
+        if header:
+            f.write('\t'.join(HEADER) + '\n')
+            f.write('\t'.join('-' * len(h) for h in HEADER) + '\n')
+        lines = []
+        for n in range(items):
+            name = renditionNumber(n)
+            objID = 400000000 + n
+            fileID = 800000000 + 2 * n
+            urn = f'urn-3:FHCL:{100000000 + n}'
+            lines.append(f'{objID}\t{urn}\t{name}\timage\t{name}\turn-3:FHCL:{200000000 + 2 * n}\tARCHIVE\ttext\ttext/xml\t{fileID}\t\tXML xml\t{rng.randint(2000, 9000)}\tok\t{rng.getrandbits(64):016x}\n')
+            lines.append(f'{objID}\t{urn}\t{name}\timage\t{name}\turn-3:FHCL:{200000001 + 2 * n}\tDELIVERABLE\timage\timage/jp2\t{fileID + 1}\t{name}.jp2\tJPEG2000 jp2\t{rng.randint(200000, 9000000)}\tok\t{rng.getrandbits(64):016x}\n')
+            # WRITE IN BLOCKS SO A MILLION ROWS NEVER SIT IN MEMORY AT ONCE
+            if len(lines) >= 20000:
+                f.writelines(lines)
+                lines = []
+        f.writelines(lines)
+    return items
+
+def generateCatalog(items:int, seed:int=0, missRate:float=MISSRATE, extra:float=EXTRA) -> dict:
+    """
+    Make the MediaRenditions and MediaFormats records that match a synthetic report, as DB downloads them into MMIDS and MTIDS
+
+    Args:
+        items (int): number of items in the report
+        seed (int, optional): seed for the order of the renditions. Defaults to 0.
+        missRate (float, optional): share of the items left out of the catalog. Defaults to MISSRATE.
+        extra (float, optional): renditions no report mentions, as a share of the items. Defaults to EXTRA.
+
+    Returns:
+        dict: MMIDS and MTIDS records
+    """
+    renditions = [{ 'RenditionNumber' : renditionNumber(n), 'MediaMasterID' : 500000 + n, 'RenditionID' : 1000000 + n, 'PrimaryFileID' : 2000000 + n }
+                  for n in range(int(items * (1 + extra))) if n >= items or not missing(n, missRate)]
+    # TMS DOES NOT RETURN RENDITIONS IN THE ORDER OF THE REPORTS
+    random.Random(seed).shuffle(renditions)
+    return {
+        'MMIDS' : renditions,
+        'MTIDS' : [{ 'Format' : f, 'FormatID' : formatID, 'MediaTypeID' : mediaTypeID } for f, formatID, mediaTypeID in FORMATS],
+    }
+
+def insertedFiles(items:list, catalog:dict) -> tuple:
+    """
+    Stand in for the MS Server between the stages: give every matched item a new FileID, as the scratch table would, and point its rendition at it, as getVerification would find it
+
+    Args:
+        items (list): items resolved by the join
+        catalog (dict): MMIDS and MTIDS records
+
+    Returns:
+        tuple: IIDS records and the MMIDS records after the update
+    """
+    files = [{ 'RenditionID' : item['RenditionID'], 'FileID' : 3000000 + i } for i, item in enumerate(items)]
+    fileIDs = { f['RenditionID'] : f['FileID'] for f in files }
+    verify = [dict(r, PrimaryFileID=fileIDs.get(r['RenditionID'], r['PrimaryFileID'])) for r in catalog['MMIDS']]
+    return files, verify
+
+def timed(func, *args) -> tuple:
+    """
+    Call a function and measure its wall time
+
+    Args:
+        func (function): function to call
+        args (Any): arguments for func
+
+    Returns:
+        tuple: seconds and the value returned by func
+    """
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+def joinOn(workers:WorkerPool, joiner:Joiner, func, items:list) -> tuple:
+    """
+    Run one join stage on the worker pool the way Pipeline does: share the indexes, load them into every worker and process the items in chunks
+
+    Args:
+        workers (WorkerPool): running worker pool
+        joiner (Joiner): indexed join engine
+        func (function): updateItem, updateFileID or verifyItem
+        items (list): items to process
+
+    Returns:
+        tuple: matched items and problem items
+    """
+    tables = joiner.share()
+    try:
+        workers.load(tables)
+        return workers.run(func, items)
+    finally:
+        tables.release()
+
+def benchmarkSize(rows:int, workers:WorkerPool, repeat:int, dataDir:str, seed:int=0) -> dict:
+    """
+    Time each stage on a report of the given size. Every repetition starts from a fresh extraction because the joins update the items in place
+
+    Args:
+        rows (int): data rows in the report
+        workers (WorkerPool): worker pool shared by all sizes
+        repeat (int): number of timed repetitions
+        dataDir (str): folder for the generated report
+        seed (int, optional): seed for the synthetic data. Defaults to 0.
+
+    Returns:
+        dict: sizes, counts and timings of each stage
+    """
+    report = os.path.join(dataDir, f'drs_bench_{rows}_{seed}.txt')
+    generated = None
+    if os.path.isfile(report):
+        items = rows // 2
+    else:
+        generated, items = timed(generateReport, report, rows, seed)
+    catalog = generateCatalog(items, seed)
+
+    logger = Logger()
+    errorHandler = ErrorHandler()
+    errorHandler.setLogger(logger)
+    extractor = Extractor()
+    extractor.setLogger(logger)
+    extractor.setErrorHandler(errorHandler)
+    extractor.setHeader(True)
+    extractor.setBackup(False)
+    pipeline = Pipeline()
+
+    timings = { stage : [] for stage in STAGES }
+    for _ in range(repeat):
+        seconds, results = timed(extractor.extractAll, [report], workers.pool)
+        extracted = results[report]
+        timings['extract'].append(seconds)
+
+        def join():
+            joiner = Joiner()
+            joiner.indexRenditions(catalog['MMIDS'])
+            joiner.indexFormats(catalog['MTIDS'])
+            return joinOn(workers, joiner, updateItem, extracted)
+        seconds, (matched, problems) = timed(join)
+        timings['join'].append(seconds)
+
+        files, verify = insertedFiles(matched, catalog)
+
+        def fileIDs():
+            joiner = Joiner()
+            joiner.indexFiles(files)
+            return joinOn(workers, joiner, updateFileID, matched)
+        seconds, (withIDs, _) = timed(fileIDs)
+        timings['fileIDs'].append(seconds)
+
+        seconds, _ = timed(lambda: (pipeline.mediaFileRecords(matched), pipeline.renditionRecords(withIDs)))
+        timings['compile'].append(seconds)
+
+        def verified():
+            joiner = Joiner()
+            joiner.indexRenditions(verify)
+            return joinOn(workers, joiner, verifyItem, withIDs)
+        seconds, (good, bad) = timed(verified)
+        timings['verify'].append(seconds)
+
+    counts = { 'extract' : rows, 'join' : len(extracted), 'fileIDs' : len(matched), 'compile' : len(matched) + len(withIDs), 'verify' : len(withIDs) }
+    return {
+        'rows' : rows,
+        'items' : len(extracted),
+        'matched' : len(matched),
+        'problems' : len(problems),
+        'verified' : len(good),
+        'reportBytes' : os.path.getsize(report),
+        'generateSeconds' : generated,
+        'stages' : summarise(timings, counts),
+    }
+
+def summarise(timings:dict, counts:dict) -> dict:
+    """
+    Reduce the timings of each stage to the figures that are compared
+
+    Args:
+        timings (dict): stage -> seconds of each repetition
+        counts (dict): stage -> rows or items the stage handled
+
+    Returns:
+        dict: stage -> seconds, best, median and rows per second
+    """
+    return { stage : {
+        'seconds' : seconds,
+        'best' : min(seconds),
+        'median' : statistics.median(seconds),
+        'perSecond' : counts[stage] / min(seconds) if counts.get(stage) and min(seconds) > 0 else None,
+    } for stage, seconds in timings.items() if seconds }
+
+def benchmarkPipeline(rows:int, workers:WorkerPool, repeat:int, dataDir:str, seed:int=0, latency:float=0.0, serverMatching:bool=False) -> dict:
+    """
+    Time a whole run, from the downloads to verification, against the SQLite stand-in of TMS. Every repetition starts from a freshly seeded stand-in and local store, because a run changes both
+
+    Args:
+        rows (int): data rows in the report
+        workers (WorkerPool): worker pool shared by all sizes
+        repeat (int): number of timed repetitions
+        dataDir (str): folder for the generated report, stand-in and local store
+        seed (int, optional): seed for the synthetic data. Defaults to 0.
+        latency (float, optional): seconds charged per round trip to the stand-in. Defaults to 0.0.
+        serverMatching (bool, optional): match the items on the stand-in instead of downloading the tables. Defaults to False.
+
+    Returns:
+        dict: sizes, counts, round trips and timings of each stage
+    """
+    report = os.path.join(dataDir, f'drs_bench_{rows}_{seed}.txt')
+    items = rows // 2 if os.path.isfile(report) else generateReport(report, rows, seed)
+    catalog = generateCatalog(items, seed)
+
+    logger = Logger()
+    errorHandler = ErrorHandler()
+    errorHandler.setLogger(logger)
+    errorHandler.setVerbosity(False)
+    logger.setErrorHandler(errorHandler)
+    logger.outputToConsole(lambda msg, res='normal': None)
+    extractor = Extractor()
+    extractor.setLogger(logger)
+    extractor.setErrorHandler(errorHandler)
+    extractor.setHeader(True)
+    extractor.setBackup(False)
+
+    timings, trips, summary, total = {}, [], {}, []
+    for _ in range(repeat):
+        backend = SQLiteBackend(latency=latency)
+        backend.seed(catalog)
+        storePath = os.path.join(dataDir, 'bench_store.db')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.isfile(storePath + suffix): os.remove(storePath + suffix)
+
+        verified = []
+        db = DB()
+        db.setLogger(logger)
+        db.setErrorHandler(errorHandler)
+        db.notifyUser(lambda msg: None)
+        db.verification(verified.append)
+        db.outputToConsole(lambda steps=None: None, lambda msg, res='normal': None)
+        db.setHost('localhost')
+        db.setUser('offloader')
+        db.setName('TMS')
+        db.setScratchTable('OffloaderScratch')
+        db.setDBUpdate(True)
+        db.setStore(SQLiteStore(storePath))
+        db.setSyncMode('full')
+        db.setBackend(backend)
+        pipeline = Pipeline()
+        pipeline.setDB(db)
+        pipeline.setExtractor(extractor)
+        pipeline.setLogger(logger)
+        pipeline.setWorkers(workers)
+        pipeline.outputToConsole(lambda steps=None: None, lambda msg, res='normal': None)
+        try:
+            db.checkTinyDB()
+            db.checkAccess('')
+            if verified[-1:] != [True]: raise RuntimeError('the SQLite stand-in could not be prepared')
+            pipeline.setInput([report])
+            pipeline.setFlags(False, serverMatching)
+            scheduler = pipeline.build(Scheduler())
+            failed = []
+            scheduler.onDone(failed.extend)
+            start = time.perf_counter()
+            scheduler.run()
+            scheduler.wait()
+            total.append(time.perf_counter() - start)
+            if failed: raise RuntimeError(f'{", ".join(s.name for s in failed)} failed')
+            for timing in scheduler.timings():
+                if timing['seconds'] is not None: timings.setdefault(timing['name'], []).append(timing['seconds'])
+            trips.append(backend.roundTrips)
+            summary = pipeline.summary()
+        finally:
+            db.close()
+            backend.close()
+
+    timings['total'] = total
+    counts = { stage : items for stage in timings }
+    counts['extract'] = rows
+    return {
+        'rows' : rows,
+        'items' : items,
+        'matched' : summary.get('updated'),
+        'problems' : summary.get('problems'),
+        'latency' : latency,
+        'serverMatching' : serverMatching,
+        'roundTrips' : max(trips) if trips else None,
+        'reportBytes' : os.path.getsize(report),
+        'stages' : summarise(timings, counts),
+    }
+
+def checkOverlap(rows:int, dataDir:str, seed:int=0, latency:float=0.02, delay:float=0.5) -> dict:
+    """
+    Check that getTables downloads MediaFormats and MediaRenditions side by side. Every round trip to the SQLite stand-in is charged the latency and every batch a download fetches the delay, so each download takes at least the delay; the downloads into the staging files must overlap in time, and only loading them into the store may wait on its lock
+
+    Args:
+        rows (int): data rows of the report the catalog is made for
+        dataDir (str): folder for the local store
+        seed (int, optional): seed for the synthetic data. Defaults to 0.
+        latency (float, optional): seconds charged per round trip to the stand-in. Defaults to 0.02.
+        delay (float, optional): seconds added to every batch fetched by a download. Defaults to 0.5.
+
+    Returns:
+        dict: start and end of each download, their overlap and the wall time of getTables, in seconds
+    """
+    catalog = generateCatalog(rows // 2, seed)
+    logger = Logger()
+    errorHandler = ErrorHandler()
+    errorHandler.setLogger(logger)
+    errorHandler.setVerbosity(False)
+    logger.setErrorHandler(errorHandler)
+    logger.outputToConsole(lambda msg, res='normal': None)
+
+    backend = SQLiteBackend(latency=latency)
+    backend.seed(catalog)
+    storePath = os.path.join(dataDir, 'bench_tables.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.isfile(storePath + suffix): os.remove(storePath + suffix)
+    verified = []
+    db = DB()
+    db.setLogger(logger)
+    db.setErrorHandler(errorHandler)
+    db.notifyUser(lambda msg: None)
+    db.verification(verified.append)
+    db.outputToConsole(lambda steps=None: None, lambda msg, res='normal': None)
+    db.setHost('localhost')
+    db.setUser('offloader')
+    db.setName('TMS')
+    db.setScratchTable('OffloaderScratch')
+    db.setStore(SQLiteStore(storePath))
+    db.setSyncMode('full')
+    db.setBackend(backend)
+    db.checkAccess('')
+    if verified[-1:] != [True]: raise RuntimeError('the SQLite stand-in could not be prepared')
+
+    # SLOW DOWN EVERY BATCH OF A DOWNLOAD AND TIME HOW LONG EACH TABLE STREAMS FROM THE STAND-IN
+    origin = time.perf_counter()
+    downloads = {}
+    streamQuery = db.streamQuery
+    def slowStream(query, *args):
+        table = 'MTIDS' if 'MediaFormats' in query else 'MMIDS'
+        start = time.perf_counter() - origin
+        try:
+            for rows in streamQuery(query, *args):
+                time.sleep(delay)
+                yield rows
+        finally:
+            downloads[table] = (round(start, 3), round(time.perf_counter() - origin, 3))
+    db.streamQuery = slowStream
+
+    try:
+        result = db.getTables()
+        seconds = time.perf_counter() - origin
+    finally:
+        db.close()
+        db.store.close()
+        backend.close()
+    if result is False or set(downloads) != { 'MTIDS', 'MMIDS' }: raise RuntimeError('getTables failed on the SQLite stand-in')
+    overlap = min(end for start, end in downloads.values()) - max(start for start, end in downloads.values())
+    return { 'rows' : rows, 'latency' : latency, 'delay' : delay, 'downloads' : downloads, 'overlap' : round(overlap, 3), 'seconds' : round(seconds, 3) }
+
+def version() -> str:
+    """
+    Describe the checked out commit, so results can be told apart
+
+    Returns:
+        str: output of git describe, or None outside a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args:argparse.Namespace) -> int:
+    """
+    Benchmark every requested size, stage by stage or as whole runs against the SQLite stand-in, and write the results as JSON
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+
+    Returns:
+        int: exit code
+    """
+    dataDir = args.data or tempfile.mkdtemp(prefix='offloader-bench-')
+    os.makedirs(dataDir, exist_ok=True)
+    workers = WorkerPool(args.workers)
+    results = {
+        'benchmark' : 'offloader' if args.command == 'run' else 'offloader-pipeline',
+        'created' : datetime.now().isoformat(timespec='seconds'),
+        'version' : version(),
+        'python' : platform.python_version(),
+        'platform' : platform.platform(),
+        'cpus' : multiprocessing.cpu_count(),
+        'workers' : workers.processes,
+        'repeat' : args.repeat,
+        'seed' : args.seed,
+        'runs' : [],
+    }
+    try:
+        workers.start()
+        for rows in args.rows:
+            print(f'BENCHMARK: {rows} rows...', file=sys.stderr)
+            if args.command == 'pipeline':
+                results['runs'].append(benchmarkPipeline(rows, workers, args.repeat, dataDir, args.seed, args.latency, args.server_matching))
+            else:
+                results['runs'].append(benchmarkSize(rows, workers, args.repeat, dataDir, args.seed))
+    finally:
+        workers.close()
+        if args.data is None: shutil.rmtree(dataDir, ignore_errors=True)
+
+    for result in results['runs']:
+        trips = f', {result["roundTrips"]} round trips' if result.get('roundTrips') is not None else ''
+        print(f'{result["rows"]} rows, {result["items"]} items, {result["problems"]} problems, {result["reportBytes"] / 1048576:.1f} MB{trips}')
+        for stage, timing in result['stages'].items():
+            print(f'  {stage:<22}{timing["best"]:>10.4f} s{timing["median"]:>10.4f} s median{timing["perSecond"] or 0:>14,.0f} rows/s')
+    with open(args.out, 'w', encoding='utf8') as f:
+        json.dump(results, f, indent=2)
+    print(f'BENCHMARK: Results written to {args.out}', file=sys.stderr)
+    return 0
+
+def compare(args:argparse.Namespace) -> int:
+    """
+    Compare the best time of each stage between two result files
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+
+    Returns:
+        int: exit code; 1 if a stage got slower by more than the threshold
+    """
+    with open(args.old, encoding='utf8') as f: old = json.load(f)
+    with open(args.new, encoding='utf8') as f: new = json.load(f)
+    before = { r['rows'] : r for r in old['runs'] }
+    print(f'{old.get("version")} -> {new.get("version")}')
+    slower = 0
+    for result in new['runs']:
+        previous = before.get(result['rows'])
+        if previous is None: continue
+        print(f'{result["rows"]} rows')
+        for stage in result['stages']:
+            a = previous['stages'].get(stage, {}).get('best')
+            b = result['stages'].get(stage, {}).get('best')
+            if not a or b is None: continue
+            ratio = b / a
+            verdict = 'slower' if ratio > 1 + args.threshold else 'faster' if ratio < 1 - args.threshold else ''
+            if verdict == 'slower': slower += 1
+            print(f'  {stage:<22}{a:>10.4f} s{b:>10.4f} s{ratio:>8.2f}x  {verdict}')
+    return 1 if slower else 0
+
+def tables(args:argparse.Namespace) -> int:
+    """
+    Check that the MediaFormats and MediaRenditions downloads overlap against a slow SQLite stand-in of TMS
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+
+    Returns:
+        int: exit code; 1 if the downloads ran one after the other
+    """
+    dataDir = args.data or tempfile.mkdtemp(prefix='offloader-bench-')
+    os.makedirs(dataDir, exist_ok=True)
+    try:
+        result = checkOverlap(args.rows, dataDir, args.seed, args.latency, args.delay)
+    finally:
+        if args.data is None: shutil.rmtree(dataDir, ignore_errors=True)
+    for table, (start, end) in result['downloads'].items():
+        print(f'  {table:<8}{start:>8.3f} s to {end:.3f} s')
+    print(f'getTables took {result["seconds"]:.3f} s; the downloads overlap by {max(result["overlap"], 0):.3f} s')
+    return 0 if result['overlap'] > 0 else 1
+
+def generate(args:argparse.Namespace) -> int:
+    """
+    Write a synthetic report and its catalog for use outside the benchmark
+
+    Args:
+        args (argparse.Namespace): parsed arguments
+
+    Returns:
+        int: exit code
+    """
+    os.makedirs(args.out, exist_ok=True)
+    for rows in args.rows:
+        report = os.path.join(args.out, f'drs_bench_{rows}_{args.seed}.txt')
+        items = generateReport(report, rows, args.seed, not args.no_header)
+        catalog = generateCatalog(items, args.seed)
+        with open(os.path.join(args.out, f'catalog_{rows}_{args.seed}.json'), 'w', encoding='utf8') as f:
+            json.dump(catalog, f)
+        print(f'BENCHMARK: Wrote {report} with {items} items and its catalog')
+        if args.tms:
+            path = os.path.join(args.out, f'tms_{rows}_{args.seed}.db')
+            SQLiteBackend(path).seed(catalog)
+            print(f'BENCHMARK: Wrote the SQLite stand-in {path}')
+    return 0
+
+def parseArgs(argv:list=None) -> argparse.Namespace:
+    """
+    Read the command line
+
+    Args:
+        argv (list, optional): arguments without the program name. Defaults to None (sys.argv).
+
+    Returns:
+        argparse.Namespace: parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmark', description='Benchmark the processing stages on synthetic DRS reports')
+    commands = parser.add_subparsers(dest='command', required=True)
+    bench = commands.add_parser('run', help='time extraction, join, record compilation and verification')
+    bench.add_argument('--rows', nargs='+', type=parseSize, default=[parseSize('1k'), parseSize('100k')], help='report sizes in rows, e.g. 1k 100k 1M (default: 1k 100k)')
+    bench.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='worker processes (default: all CPUs)')
+    bench.add_argument('--repeat', type=int, default=3, help='timed repetitions per size; the best is compared (default: 3)')
+    bench.add_argument('--seed', type=int, default=0, help='seed for the synthetic data (default: 0)')
+    bench.add_argument('--data', help='folder to keep the generated reports in for later runs (default: a temporary folder)')
+    bench.add_argument('--out', default='benchmark.json', help='file for the JSON results (default: benchmark.json)')
+    full = commands.add_parser('pipeline', help='time whole runs against the SQLite stand-in of TMS')
+    full.add_argument('--rows', nargs='+', type=parseSize, default=[parseSize('1k'), parseSize('100k')], help='report sizes in rows, e.g. 1k 100k 1M (default: 1k 100k)')
+    full.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='worker processes (default: all CPUs)')
+    full.add_argument('--repeat', type=int, default=1, help='timed repetitions per size; the best is compared (default: 1)')
+    full.add_argument('--latency', type=float, default=0.0, help='seconds charged per round trip to model the link to TMS (default: 0)')
+    full.add_argument('--server-matching', action='store_true', help='match the items on the stand-in instead of downloading the tables')
+    full.add_argument('--seed', type=int, default=0, help='seed for the synthetic data (default: 0)')
+    full.add_argument('--data', help='folder to keep the generated reports in for later runs (default: a temporary folder)')
+    full.add_argument('--out', default='benchmark.json', help='file for the JSON results (default: benchmark.json)')
+    diff = commands.add_parser('compare', help='compare two result files')
+    diff.add_argument('old', help='results of the baseline')
+    diff.add_argument('new', help='results of the change')
+    diff.add_argument('--threshold', type=float, default=0.10, help='relative change reported as slower or faster (default: 0.10)')
+    overlap = commands.add_parser('tables', help='check that the table downloads overlap against a slow SQLite stand-in of TMS')
+    overlap.add_argument('--rows', type=parseSize, default=parseSize('20k'), help='report size in rows the catalog is made for (default: 20k)')
+    overlap.add_argument('--latency', type=float, default=0.02, help='seconds charged per round trip (default: 0.02)')
+    overlap.add_argument('--delay', type=float, default=0.5, help='seconds added to every batch a download fetches (default: 0.5)')
+    overlap.add_argument('--seed', type=int, default=0, help='seed for the synthetic data (default: 0)')
+    overlap.add_argument('--data', help='folder for the local store (default: a temporary folder)')
+    gen = commands.add_parser('generate', help='write synthetic reports and catalogs')
+    gen.add_argument('--rows', nargs='+', type=parseSize, default=[parseSize('1k')], help='report sizes in rows (default: 1k)')
+    gen.add_argument('--seed', type=int, default=0, help='seed for the synthetic data (default: 0)')
+    gen.add_argument('--no-header', action='store_true', help='leave out the header rows')
+    gen.add_argument('--tms', action='store_true', help='also write a SQLite stand-in of TMS seeded with the catalog, for python -m offloader run --dsn sqlite:///...')
+    gen.add_argument('--out', default='.', help='folder to write to (default: current folder)')
+    return parser.parse_args(argv)
+
+def main(argv:list=None) -> int:
+    """
+    Entry point of python -m benchmark
+
+    Args:
+        argv (list, optional): arguments without the program name. Defaults to None (sys.argv).
+
+    Returns:
+        int: exit code
+    """
+    args = parseArgs(argv)
+    return { 'run' : run, 'pipeline' : run, 'compare' : compare, 'tables' : tables, 'generate' : generate }[args.command](args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,66 @@
+class ChunkSizer:
+    """ This class picks how many rows go into the next chunk of a write, so that each chunk commits in about the target time. Locks on MediaFiles and MediaRenditions are then held for a bounded time, whatever the latency to the MS Server. Chunks grow at most twofold after a fast commit and shrink at once after a slow one; a lock wait halves them.
+    ## Methods (4)
+    - observe : rows (int), seconds (float) -> int
+    - contended : () -> int
+    - resize : size (float) -> None
+    - summary : () -> dict
+    """
+
+    def __init__(self, size:int=500, minSize:int=1, maxSize:int=1000, target:float=0.5, adaptive:bool=True):
+        """
+        ### Parameters
+        - size (int) : rows in the first chunk (default=500)
+        - minSize (int) : fewest rows in a chunk (default=1)
+        - maxSize (int) : most rows in a chunk (default=1000)
+        - target (float) : seconds a chunk should take from execute to commit (default=0.5)
+        - adaptive (bool) : adapt the size; False keeps every chunk at size (default=True)
+        """
+        self.minSize = max(1, int(minSize))
+        self.maxSize = max(self.minSize, int(maxSize))
+        self.size = max(self.minSize, min(int(size), self.maxSize))
+        self.target = target
+        self.adaptive = adaptive
+        self.chunks = 0
+        self.lockWaits = 0
+        self.sizes = [self.size, self.size]    # SMALLEST AND LARGEST SIZE USED
+
+    def observe(self, rows:int, seconds:float) -> int:
+        """ Adapt the size to the time a chunk took
+        ### Parameters
+        - rows (int) : rows in the chunk
+        - seconds (float) : time from execute to commit
+        ### Returns
+        - int : rows in the next chunk
+        """
+        self.chunks += 1
+        if not self.adaptive or rows <= 0 or not self.target: return self.size
+        ideal = rows * self.target / max(seconds, 1e-6)
+        # A SHORT CHUNK AT THE END OF THE RECORDS SAYS LITTLE ABOUT A FULL ONE
+        if ideal > self.size and rows < self.size: return self.size
+        self.resize(min(ideal, self.size * 2))
+        return self.size
+
+    def contended(self) -> int:
+        """ Halve the size after a chunk ran into a lock held by another session
+        ### Returns
+        - int : rows in the next chunk
+        """
+        self.lockWaits += 1
+        if self.adaptive: self.resize(self.size // 2)
+        return self.size
+
+    def resize(self, size:float) -> None:
+        """ Set the size within the bounds
+        ### Parameters
+        - size (float) : new size
+        """
+        self.size = max(self.minSize, min(int(size), self.maxSize))
+        self.sizes = [min(self.sizes[0], self.size), max(self.sizes[1], self.size)]
+
+    def summary(self) -> dict:
+        """ Describe how the chunks were sized
+        ### Returns
+        - dict : chunks committed, lock waits, and the last, smallest and largest size
+        """
+        return { 'chunks' : self.chunks, 'lockWaits' : self.lockWaits, 'size' : self.size, 'smallest' : self.sizes[0], 'largest' : self.sizes[1] }
@@ -0,0 +1,163 @@
+import time, threading
+from contextlib import contextmanager
+
+class PoolTimeout(TimeoutError):
+    """ Raised when no connection becomes available in time """
+
+class ConnectionPool:
+    """ This class keeps a thread-safe pool of open database connections so queries reuse connections instead of logging in again every time.
+    ## Methods (8)
+    - open : () -> None
+    - checkout : timeout (float) -> Any
+    - checkin : conn (Any), discard (bool) -> None
+    - connection : () -> Any
+    - healthy : conn (Any) -> bool
+    - prune : () -> None
+    - discard : conn (Any) -> None
+    - close : () -> None
+    """
+
+    def __init__(self, factory, minSize:int=1, maxSize:int=8, idleTimeout:float=300, checkAfter:float=30, checkoutTimeout:float=60):
+        """
+        ### Parameters
+        - factory (function) : opens a new connection
+        - minSize (int) : connections kept open while idle (default=1)
+        - maxSize (int) : maximum number of open connections (default=8)
+        - idleTimeout (float) : seconds before an idle connection above minSize is closed (default=300)
+        - checkAfter (float) : seconds a connection may sit idle before it is health checked on checkout (default=30)
+        - checkoutTimeout (float) : seconds to wait for a free connection (default=60)
+        """
+        self.factory = factory
+        self.minSize = minSize
+        self.maxSize = max(maxSize, minSize, 1)
+        self.idleTimeout = idleTimeout
+        self.checkAfter = checkAfter
+        self.checkoutTimeout = checkoutTimeout
+        self.idle = []      # [connection, time returned] PAIRS, MOST RECENT LAST
+        self.size = 0       # OPEN CONNECTIONS, IDLE AND CHECKED OUT
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def open(self) -> None:
+        """ Open connections up to minSize """
+        while True:
+            with self.condition:
+                if self.closed or self.size >= self.minSize: return
+                self.size += 1
+            try:
+                conn = self.factory()
+            except:
+                with self.condition:
+                    self.size -= 1
+                    self.condition.notify()
+                raise
+            self.checkin(conn)
+
+    def checkout(self, timeout:float=None):
+        """ Take a connection from the pool, opening a new one if the pool is not full
+        ### Parameters
+        - timeout (float) : seconds to wait for a free connection (default=checkoutTimeout)
+        ### Returns
+        - Any : open connection
+        """
+        timeout = self.checkoutTimeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            conn, returned = None, None
+            with self.condition:
+                if self.closed: raise PoolTimeout('Connection pool is closed')
+                self.prune()
+                while not self.idle and self.size >= self.maxSize:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0: raise PoolTimeout(f'No connection available after {timeout} seconds')
+                    self.condition.wait(remaining)
+                if self.idle:
+                    conn, returned = self.idle.pop()
+                else:
+                    self.size += 1
+            if conn is None:
+                try:
+                    return self.factory()
+                except:
+                    with self.condition:
+                        self.size -= 1
+                        self.condition.notify()
+                    raise
+            if time.monotonic() - returned < self.checkAfter or self.healthy(conn):
+                return conn
+            self.discard(conn)
+
+    def checkin(self, conn, discard:bool=False) -> None:
+        """ Return a connection to the pool
+        ### Parameters
+        - conn (Any) : connection taken with checkout
+        - discard (bool) : close the connection instead of keeping it (default=False)
+        """
+        if discard or self.closed: return self.discard(conn)
+        with self.condition:
+            self.idle.append([conn, time.monotonic()])
+            self.condition.notify()
+
+    @contextmanager
+    def connection(self):
+        """ Check out a connection for the duration of a with block. The connection is discarded if it fails a health check after an error """
+        conn = self.checkout()
+        try:
+            yield conn
+        except:
+            try:
+                conn.rollback()
+                broken = not self.healthy(conn)
+            except:
+                broken = True
+            self.checkin(conn, broken)
+            raise
+        else:
+            self.checkin(conn)
+
+    def healthy(self, conn) -> bool:
+        """ Check a connection still answers
+        ### Parameters
+        - conn (Any) : connection to check
+        ### Returns
+        - bool : True if the connection can run a query
+        """
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.fetchall()
+            cur.close()
+            return True
+        except:
+            return False
+
+    def prune(self) -> None:
+        """ Close connections that have been idle longer than idleTimeout while keeping minSize open. Call with the condition held """
+        now = time.monotonic()
+        while self.idle and self.size > self.minSize and now - self.idle[0][1] > self.idleTimeout:
+            conn, _ = self.idle.pop(0)
+            self.size -= 1
+            try: conn.close()
+            except: pass
+
+    def discard(self, conn) -> None:
+        """ Close a connection and free its place in the pool
+        ### Parameters
+        - conn (Any) : connection to close
+        """
+        try: conn.close()
+        except: pass
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+    def close(self) -> None:
+        """ Close all idle connections and refuse new checkouts; checked out connections are closed when they are returned """
+        with self.condition:
+            self.closed = True
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+            self.condition.notify_all()
+        for conn, _ in idle:
+            try: conn.close()
+            except: pass
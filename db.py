@@ -1,22 +1,33 @@
+from __future__ import annotations
+
 try:
-    import sys, os, pymssql, codecs, random, time
+    import sys, os, pymssql, codecs, random, time, sqlite3, threading
     import socket, urllib3, requests, inspect
     from json import JSONDecodeError
     from socket import gaierror
     from multiprocessing import Queue
     from multiprocessing.pool import ThreadPool
-    from pymssql import OperationalError, InterfaceError, DatabaseError, ProgrammingError
+    from pymssql import OperationalError, InterfaceError, DatabaseError, ProgrammingError, IntegrityError, DataError
     from datetime import datetime, date
     from tkinter import filedialog, messagebox
     from tinydb import TinyDB, where, Query
     from tinydb.storages import JSONStorage
     from tinydb.middlewares import CachingMiddleware
+    from store import SQLiteStore, TinyDBStore, Staging
+    from connectionpool import ConnectionPool, PoolTimeout
+    from backends import MSSQLBackend
+    from metrics import Metrics, payload
+    from tracer import Tracer
+    from chunksizer import ChunkSizer
 except ImportError as error:
     print(error)
 
+# SERVER ERRORS CAUSED BY THE VALUES OF A ROW: NULL IN A NOT NULL COLUMN, CONSTRAINT AND KEY VIOLATIONS, TRUNCATION, CONVERSION AND OVERFLOW
+ROWERRORS = (515, 547, 2601, 2627, 2628, 8152, 241, 242, 245, 248, 8114, 8115, 220, 232, 517)
+
 class DB:
     """ This class controls TMS database interactions
-    ## Methods (31)
+    ## Methods (65)
     - setLogger : logger (Logger) -> None
     - setErrorHandler : errorHandler (ErrorHandler) -> None
     - outputToConsole : pbar (function), outputToConsole (function) -> None
@@ -25,39 +36,91 @@ class DB:
     - setUser : user (str) -> None
     - setScratchTable : table (str) -> None
     - setDBUpdate : flag (str) -> None
+    - setStore : store (SQLiteStore/TinyDBStore) -> None
+    - setBackend : backend (MSSQLBackend/SQLiteBackend) -> None
+    - setSyncMode : mode (str) -> None
+    - setPoolSize : minSize (int), maxSize (int) -> None
+    - setBulkMode : flag (bool), chunkSize (int), commitPerChunk (bool) -> None
+    - setJournal : journal (Journal) -> None
+    - setResume : flag (bool) -> None
+    - setMetrics : metrics (Metrics) -> None
+    - setTracer : tracer (Tracer) -> None
+    - setChunking : adaptive (bool), target (float) -> None
     - askQuestion : askQuestion (askQuestion) -> None
     - notifyUser : notify (bool) -> None
     - verification : verifyConnection (function) -> None
     - checkTinyDB : () -> None
     - removeTinyDB : () -> None
+    - releaseStore : () -> None
     - getDB : () -> None
     - checkAccess : password (str) -> None
     - dropScratchTable : () -> None
     - makeScratchTable : () -> None
-    - queryBuilder : query (str), param (str) -> None
-    - getMMIDs : verification (bool) -> str
-    - getMTIDs : () -> str
-    - getIIDs : () -> str
+    - queryBuilder : query (str), param (str), stage (str), key (function) -> None
+    - execute : cur (Cursor), query (str), param (tuple/list) -> Cursor
+    - fetch : cur (Cursor), size (int) -> list
+    - streamQuery : query (str), param (tuple), size (int) -> generator
+    - stage : table (str), query (str), param (tuple), staging (Staging) -> Staging
+    - streamInto : table (str), query (str), param (tuple), replace (bool) -> int
+    - getMMIDs : verification (bool), full (bool) -> bool
+    - getChecksums : () -> dict
+    - syncMMIDs : () -> int
+    - getMTIDs : () -> bool
+    - getIIDs : () -> bool
+    - getVerification : () -> bool
+    - getTables : tables (list) -> dict
     - getAllMMIDS : () -> None
     - getAllMTIDS : () -> None
     - getAllIIDS : () -> None
+    - getAllVERIFY : () -> None
     - find : table (str), field (str), id (str) -> list
     - count : table (str), field (str), id (str) -> int
-    - addMediaFiles : records (list) -> None
-    - updateMediaRenditions : records (list) -> None
-    - connect : idx (int) -> None
-    - close : idx (int) -> None
-    - commit : idx (int) -> None
+    - bulkInsert : prefix (str), row (str), records (list), stage (str) -> int
+    - insertChunks : conn (Connection), cur (Cursor), prefix (str), row (str), records (list), stage (str), rejectAs (str) -> int
+    - writeChunks : conn (Connection), cur (Cursor), units (list), write (function), sizer (ChunkSizer), committed (function), stage (str), record (function) -> tuple
+    - attempt : conn (Connection), cur (Cursor), chunk (list), write (function), sizer (ChunkSizer) -> int
+    - bisect : conn (Connection), cur (Cursor), chunk (list), write (function), sizer (ChunkSizer), error (Exception), offset (int), committed (function), stage (str), record (function) -> tuple
+    - rowError : error (Exception) -> bool
+    - lockWait : error (Exception) -> bool
+    - reject : stage (str), rejected (list) -> None
+    - rejects : stage (str) -> list
+    - addMediaFiles : records (list) -> bool
+    - matchOnServer : items (list), pathID (int) -> tuple
+    - updateMediaRenditions : records (list) -> bool
+    - bulkUpdateMediaRenditions : records (list) -> int
+    - getPool : () -> ConnectionPool
+    - connect : () -> Connection
+    - cursor : conn (Connection) -> Cursor
+    - commit : conn (Connection) -> None
+    - close : () -> None
     """
 
     def __init__(self):
         self.port = 1433
-        self.connections = {}
-        self.usedStrings = []
+        self.pool = None
+        self.poolLock = threading.Lock()   # STAGES IN PARALLEL THREADS MUST NOT START A POOL EACH
+        self.poolSize = (1, 8)
+        self.bulk = True
+        self.chunkSize = 500        # ROWS PER MULTI-ROW INSERT; SQL SERVER ALLOWS AT MOST 1000
+        self.commitPerChunk = True
+        self.updateRangeSize = 4000 # ROWS PER SET-BASED UPDATE; SQL SERVER ESCALATES TO A TABLE LOCK AROUND 5000 ROW LOCKS
         self.items = []
         self.mmids = []
         self.mtids = []
-        self.dbPath = os.path.join(os.getcwd(), 'offloader.json')
+        self.dbPath = os.path.join(os.getcwd(), 'offloader.db')
+        self.store = SQLiteStore(self.dbPath)
+        self.syncMode = 'incremental'
+        self.bucketSize = 1000  # RENDITIONIDS PER CHECKSUMMED KEY RANGE
+        self.fetchSize = 5000   # ROWS PER FETCHMANY WHEN STREAMING A SELECT
+        self.journal = None     # RECORDS THE CHUNKS COMMITTED ON THE MS SERVER
+        self.backend = MSSQLBackend()
+        self.resume = False
+        self.metrics = Metrics()  # ROUND TRIPS, ROWS AND BYTES OF THE STAGE RUNNING IN EACH THREAD
+        self.tracer = Tracer()    # TIME SPENT PER STATEMENT TEMPLATE AND THE SLOW-QUERY LOG
+        self.adaptiveChunks = True
+        self.chunkTarget = 0.5      # SECONDS FROM EXECUTE TO COMMIT OF A CHUNK; BOUNDS HOW LONG LOCKS ARE HELD
+        self.lockRetries = 5        # RETRIES OF A CHUNK THAT HIT A DEADLOCK OR LOCK TIMEOUT
+        self.rejected = {}          # STAGE -> (RECORD, ERROR) FOR ROWS THE MS SERVER REJECTED
 
     def setLogger(self, logger) -> None:
         """
@@ -119,6 +182,85 @@ class DB:
         """
         self.update = flag
 
+    def setStore(self, store) -> None:
+        """ Set the backend for the local copies of the TMS tables
+        ### Parameters
+        - store (SQLiteStore/TinyDBStore) : local store instance
+        """
+        self.store = store
+        self.dbPath = store.path
+
+    def setBackend(self, backend) -> None:
+        """ Choose what DB connects to: TMS on the MS Server, or a local stand-in for runs without a server
+        ### Parameters
+        - backend (MSSQLBackend/SQLiteBackend) : backend instance
+        """
+        self.close()
+        self.backend = backend
+
+    def setSyncMode(self, mode:str) -> None:
+        """ Choose how MediaRenditions is refreshed in the local store
+        ### Parameters
+        - mode (str) : 'incremental' to refetch only changed key ranges, 'full' to refetch the whole table
+        """
+        self.syncMode = mode
+
+    def setPoolSize(self, minSize:int, maxSize:int) -> None:
+        """ Set how many connections to the MS Server are kept open
+        ### Parameters
+        - minSize (int) : connections kept open while idle
+        - maxSize (int) : maximum number of connections open at once
+        """
+        self.poolSize = (minSize, maxSize)
+
+    def setBulkMode(self, flag:bool, chunkSize:int=None, commitPerChunk:bool=None) -> None:
+        """ Send inserts as chunked multi-row statements instead of one round trip per row
+        ### Parameters
+        - flag (bool) : use bulk inserts
+        - chunkSize (int) : rows per statement, at most 1000 (default=None keeps the current size)
+        - commitPerChunk (bool) : commit after every chunk instead of once at the end (default=None keeps the current setting)
+        """
+        self.bulk = flag
+        if chunkSize is not None: self.chunkSize = max(1, min(int(chunkSize), 1000))
+        if commitPerChunk is not None: self.commitPerChunk = commitPerChunk
+
+    def setJournal(self, journal) -> None:
+        """ Assign the run journal to this class. Chunked inserts and updates record each committed chunk in it and skip the chunks a resumed run already committed
+        ### Parameters
+        - journal (Journal) : Journal instance
+        """
+        self.journal = journal
+
+    def setResume(self, flag:bool) -> None:
+        """ Keep the scratch table of an unfinished run, so the FileIDs it already inserted are not lost
+        ### Parameters
+        - flag (bool) : resume (True) or start over (False)
+        """
+        self.resume = flag
+
+    def setMetrics(self, metrics) -> None:
+        """ Assign the run metrics to this class. Round trips, rows and bytes moved are counted towards the stage running in the calling thread
+        ### Parameters
+        - metrics (Metrics) : Metrics instance
+        """
+        self.metrics = metrics
+
+    def setTracer(self, tracer) -> None:
+        """ Assign the tracer to this class. Every connect, execute, fetch and commit is timed per statement template
+        ### Parameters
+        - tracer (Tracer) : Tracer instance
+        """
+        self.tracer = tracer
+
+    def setChunking(self, adaptive:bool, target:float=None) -> None:
+        """ Choose how many rows are written and committed at a time. Adaptive chunks grow or shrink so that each one commits in about the target time, and shrink after a lock wait
+        ### Parameters
+        - adaptive (bool) : adapt the size of the chunks; False keeps chunkSize rows per chunk
+        - target (float) : seconds a chunk should take (default=None keeps the current target)
+        """
+        self.adaptiveChunks = adaptive
+        if target is not None: self.chunkTarget = target
+
     def askQuestion(self, askQuestion:function) -> None:
         """ Binds the askQuestion method to this class
         ### Parameters
@@ -141,11 +283,11 @@ class DB:
         self.verify = verifyConnection
 
     def checkTinyDB(self) -> None:
-        """ Read the TinyDB instance to verify it works. The result will be presented to the user via the notify method. """
+        """ Read the local store to verify it works. The result will be presented to the user via the notify method. """
         try:
-            if os.path.isfile(self.dbPath): # TinyDB exists
+            if os.path.isfile(self.dbPath): # Local store exists
                 if self.getDB(): # Attempt to read; remove if exception
-                    os.remove(self.dbPath)
+                    self.store.remove()
                     self.getDB()
                     res = {}
                     res['res'] = None
@@ -157,23 +299,29 @@ class DB:
             self.errorHandler.handle(error)
 
     def removeTinyDB(self) -> None:
-        """ Delete the TinyDB method """
+        """ Delete the local store """
         try:
-            if os.path.isfile(self.dbPath): os.remove(self.dbPath)
+            self.store.remove()
         except OSError as error:
             self.errorHandler.handle(error)
 
+    def releaseStore(self) -> None:
+        """ Clean up the local store after a run. The MediaRenditions snapshot is kept for the next incremental sync; the copy of the scratch table is always dropped """
+        if self.syncMode == 'full': return self.removeTinyDB()
+        try:
+            self.store.purge('IIDS')
+            self.store.purge('VERIFY')
+            self.store.close()
+        except (OSError, sqlite3.DatabaseError) as error:
+            self.errorHandler.handle(error)
+
 
-    def getDB(self, table:str="MMIDS") -> None:
-        """ Load and set the TinyDB instance on this class
-        ### Parameters
-        - table (str) : table name for TinyDB (default MMIDS)
+    def getDB(self) -> bool:
+        """ Open the local store and check it can be read
+        ### Returns
+        - bool : True if the local store is corrupted
         """
-        try: 
-            self.tinyDB = TinyDB(self.dbPath, default_table=table, sort_keys=True, indent=4, separators=(',', ': '))
-            return False
-        except :
-            return True
+        return self.store.check()
         
     def checkAccess(self, password:str) -> None:
         """ Check if the application has access to the TMS server. Variables are set on the class whereby only the password has to be passed to this function.
@@ -183,37 +331,42 @@ class DB:
         self.password = password
         try: 
             localhost = socket.gethostbyname(socket.gethostname())
-            self.outputToConsole(f'DB.CHECKACCESS: Localhost is {localhost}')
+            self.output(f'DB.CHECKACCESS: Localhost is {localhost}')
             self.updatePBar()
             
-            exthost = socket.getaddrinfo(self.host, self.port)
-            exthost = exthost[0][4][0]
-            self.outputToConsole(f'DB.CHECKACCESS: External host resolved to {exthost}')
+            exthost = self.backend.resolve(self.host, self.port)
+            self.output(f'DB.CHECKACCESS: External host resolved to {exthost}')
             self.updatePBar()
             
             try:
-                self.outputToConsole(f'DB.CHECKACCESS: Attempting to connect to {exthost} on port number {self.port}; this may take a moment...')
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                # portResult = sock.connect_ex((exthost, self.port))
-
-                if sock.connect_ex((exthost, self.port)) == 0:
-                    self.outputToConsole(f'DB.CHECKACCESS: Host {self.host} ({exthost}) is available on port number {self.port}')
+                self.output(f'DB.CHECKACCESS: Attempting to connect to {exthost} on port number {self.port}; this may take a moment...')
+                if self.backend.reachable(exthost, self.port):
+                    self.output(f'DB.CHECKACCESS: Host {self.host} ({exthost}) is available on port number {self.port}')
                     self.updatePBar()
-                    self.outputToConsole(f'DB.CHECKACCESS: Establishing connection to {self.host} ({exthost}) on port number {self.port}. This may take a minute...')
-                    if self.dropScratchTable():
-                        self.outputToConsole(f'DB.CHECKACCESS: Scratch table "{self.tempTable}" dropped')
+                    self.output(f'DB.CHECKACCESS: Establishing connection to {self.host} ({exthost}) on port number {self.port}. This may take a minute...')
+                    if self.resume:
+                        # THE SCRATCH TABLE HOLDS THE FILEIDS THE UNFINISHED RUN ALREADY INSERTED
+                        if self.makeScratchTable():
+                            self.output(f'DB.CHECKACCESS: Kept scratch table "{self.tempTable}" to resume the unfinished run')
+                            self.verify(True)
+                        else:
+                            self.output(f'DB.CHECKACCESS: Could not open scratch table "{self.tempTable}"')
+                            self.verify(False)
+                    elif self.dropScratchTable():
+                        self.output(f'DB.CHECKACCESS: Scratch table "{self.tempTable}" dropped')
                         if self.makeScratchTable(): 
                             self.prepareNewMediaExtension()
-                            self.outputToConsole(f'DB.CHECKACCESS: Prepared new scratch table "{self.tempTable}"')
+                            self.output(f'DB.CHECKACCESS: Prepared new scratch table "{self.tempTable}"')
                             self.verify(True)
                         else:
-                            self.outputToConsole(f'DB.CHECKACCESS: Could not prepare new scratch table "{self.tempTable}"')
+                            self.output(f'DB.CHECKACCESS: Could not prepare new scratch table "{self.tempTable}"')
                             self.verify(False)
                     else:
-                        self.outputToConsole(f'DB.CHECKACCESS: Could not drop scratch table "{self.tempTable}"')
+                        self.output(f'DB.CHECKACCESS: Could not drop scratch table "{self.tempTable}"')
                         self.verify(False)
                 else:
-                    return self.errorHandler.error('ConnectionError')
+                    self.output(f'DB.CHECKACCESS: Error connecting to {exthost} aka {self.host} on port {self.port}. Are you in the right domain/is your VPN active?', False)
+                    self.verify(False)
             except OSError as error:
                 return self.errorHandler.handle(error)
         except gaierror as error:
@@ -239,204 +392,687 @@ class DB:
         """ Add the NRS Media Extension (http://nrs.harvard.edu) in the TMS table on the MS Server """
         self.queryBuilder(f"INSERT IGNORE INTO MediaExtensions (ExtensionID, FormatID, Extension, LoginID, EnteredDate) VALUES(44, 45, 0, '', 'offloader', datetime.now())")
 
-    def getRandInt(self) -> None:
-        """ Get a random integer
-        ### Returns
-        - int : Random integer between 1-100000
-        """
-        return random.randint(1, 100000)
-
-    def queryBuilder(self, query:str, param:list=None) -> None:
-        """ Builds a SQL query to run on the MS Server. The query is supplied, modified based on param, and prepared for commit.
+    def queryBuilder(self, query:str, param:list=None, stage:str=None, key:function=None) -> None:
+        """ Builds a SQL query to run on the MS Server. The query is supplied, modified based on param, and prepared for commit. An INSERT or UPDATE with a list of parameters is written in chunks that are committed one by one; rows the server rejects are left out and recorded under stage.
         ### Parameters
         - query (str) : SQL query
         - param (list) : List of parameters to update the SQL query (default=None)
+        - stage (str) : name under which committed chunks are journalled and rejected rows recorded (default=None)
+        - key (function) : gives the key of a parameter row; the journal then keeps the last key committed instead of a row count, and param must be sorted on it (default=None)
         """
         try:
-            connID = self.getRandInt()
-            while connID not in self.usedStrings:
-                self.usedStrings.append(connID)
-                cur = self.cursor(connID)
-                if type(param) is list:
-                    cur.executemany(query, param)
-                    if 'INSERT' in query or 'UPDATE' in query:
-                        self.commit(connID)
+            with self.getPool().connection() as conn:
+                cur = self.cursor(conn)
+                try:
+                    if type(param) is list and ('INSERT' in query or 'UPDATE' in query):
+                        journal = self.journal if stage is not None else None
+                        if key is None:
+                            start = journal.progress(stage, 0) if journal is not None else 0
+                            units = param[start:]
+                            committed = lambda end: journal.advance(stage, start + end)
+                        else:
+                            last = journal.progress(stage) if journal is not None else None
+                            units = [p for p in param if last is None or key(p) > last]
+                            committed = lambda end: journal.advance(stage, key(units[end - 1]))
+
+                        def write(cur, chunk):
+                            self.execute(cur, query, chunk)
+                            return len(chunk)
+
+                        sizer = ChunkSizer(self.chunkSize, maxSize=self.updateRangeSize, target=self.chunkTarget, adaptive=self.adaptiveChunks)
+                        self.writeChunks(conn, cur, units, write, sizer, committed if journal is not None else None, stage)
                         return True
-                else:
-                    cur.execute(query, param)
-                    if 'DROP' in query or 'CREATE' in query:
-                        self.commit(connID)
+                    self.execute(cur, query, param)
+                    if type(param) is not list and ('DROP' in query or 'CREATE' in query):
+                        self.commit(conn)
                         return True
-                try: 
-                    row = cur.fetchall()
-                    self.close(connID)
-                    return row
-                except:
-                    self.close(connID)
-                    # return None
-        except (InterfaceError, OperationalError, DatabaseError, ProgrammingError) as error:
+                    try: 
+                        return self.fetch(cur)
+                    except:
+                        conn.rollback() # Connection goes back to the pool; leave no open transaction behind
+                finally:
+                    cur.close()
+        except (InterfaceError, OperationalError, DatabaseError, ProgrammingError, PoolTimeout) as error:
             return self.errorHandler.handle(error)
 
-    def getMMIDs(self, verification:bool=None) -> str:
-        """ Downloading MediaRenditions table from MS Server and store it in TinyDB.
+    def execute(self, cur, query:str, param=None):
+        """ Run a statement on an open cursor and count its round trips and the bytes sent towards the running stage. A list of parameters runs the statement once per row, as pymssql does with executemany
+        ### Parameters
+        - cur (Cursor) : cursor on a pooled connection
+        - query (str) : SQL query
+        - param (tuple/list) : parameters for the SQL query, or a list of them (default=None)
+        ### Returns
+        - Cursor : cur
+        """
+        with self.tracer.span('execute', query) as span:
+            if type(param) is list:
+                cur.executemany(query, param)
+                span.rows = len(param)
+                self.metrics.add('rows', len(param))
+                self.metrics.transfer(param, len(param), len(query) * len(param))
+            else:
+                cur.execute(query, param)
+                span.rows = max(cur.rowcount, 0)
+                self.metrics.transfer(trips=1, sent=len(query) + (payload([param]) if param else 0))
+        return cur
+
+    def fetch(self, cur, size:int=None) -> list:
+        """ Fetch the rows of the last statement on a cursor; the fetch is traced with that statement
+        ### Parameters
+        - cur (Cursor) : cursor with a result set
+        - size (int) : rows to fetch (default=None, all rows)
+        ### Returns
+        - list : rows, empty once the result set is exhausted
+        """
+        with self.tracer.span('fetch') as span:
+            rows = cur.fetchall() if size is None else cur.fetchmany(size)
+            span.rows = len(rows)
+        self.metrics.transfer(rows)
+        return rows
+
+    def streamQuery(self, query:str, param:tuple=None, size:int=None):
+        """ Run a SELECT on a pooled connection and yield its rows in batches, so a large result is never held in memory at once. The connection stays checked out until the generator is exhausted or closed
+        ### Parameters
+        - query (str) : SQL query
+        - param (tuple) : parameters for the SQL query (default=None)
+        - size (int) : rows per batch (default=fetchSize)
+        ### Returns
+        - generator : lists of up to size row tuples
+        """
+        with self.getPool().connection() as conn:
+            cur = conn.cursor()
+            try:
+                self.execute(cur, query, param)
+                while True:
+                    rows = self.fetch(cur, size or self.fetchSize)
+                    if not rows: break
+                    yield rows
+            finally:
+                cur.close()
+
+    def stage(self, table:str, query:str, param:tuple=None, staging:Staging=None) -> Staging:
+        """ Stream the result of a SELECT batch by batch into a staging file. The lock of the local store is not taken, so downloads of several tables overlap. The query must select the columns of the table in order
+        ### Parameters
+        - table (str) : name of the table in the local store
+        - query (str) : SQL query
+        - param (tuple) : parameters for the SQL query (default=None)
+        - staging (Staging) : staging file to add the rows to (default=None, a new one)
+        ### Returns
+        - Staging : the staging file; the caller loads it into the store and closes it
+        """
+        new = staging is None
+        if new: staging = Staging(table)
+        try:
+            for rows in self.streamQuery(query, param): staging.insert(rows)
+        except BaseException:
+            if new: staging.close()
+            raise
+        return staging
+
+    def streamInto(self, table:str, query:str, param:tuple=None, replace:bool=False) -> int:
+        """ Download the result of a SELECT into a staging file, then load it into a table of the local store in one short transaction. A download that breaks off leaves the table as it was
+        ### Parameters
+        - table (str) : name of the table in the local store
+        - query (str) : SQL query
+        - param (tuple) : parameters for the SQL query (default=None)
+        - replace (bool) : purge the table in the same transaction (default=False)
+        ### Returns
+        - int : number of rows stored
+        """
+        staging = self.stage(table, query, param)
+        try:
+            with self.store.transaction():
+                if replace: self.store.purge(table)
+                stored = self.store.load(table, staging)
+        finally:
+            staging.close()
+        self.metrics.add('rows', stored)
+        return stored
+
+    def getMMIDs(self, verification:bool=None, full:bool=None) -> bool:
+        """ Downloading MediaRenditions table from MS Server and store it in the local store. In incremental mode only the key ranges that changed since the last sync are downloaded.
         ### Parameters
         - verification (bool) : controls output to user when this method is called for a second time in the process (default=None)
+        - full (bool) : force a full refresh of the table (default=None)
         ### Returns
-        - str : updateItems to start the next step in the processing stage
+        - bool : True if the local table is up to date
         """
         try:
-            table = self.tinyDB.table('MMIDS')
-            self.tinyDB.purge_table('MMIDS')
             if verification:
-                self.outputToConsole(">>>>>> VERIFYING UPDATES <<<<<<", True)
-                self.outputToConsole("OFFLOADER: Reacquiring MediaRenditions...")
-            self.outputToConsole(f'DB.GETMMIDS: Cloning MediaRenditions table...')
-            mmids = self.queryBuilder(f'SELECT RenditionNumber, MediaMasterID, RenditionID, PrimaryFileID FROM MediaRenditions')
-            table.insert_multiple({ 'RenditionNumber' : s["RenditionNumber"], 'MediaMasterID' : s["MediaMasterID"], 'RenditionID' : s["RenditionID"], 'PrimaryFileID' : s["PrimaryFileID"] } for s in mmids)
-            return 'updateItems' if verification is None else 'verified'
-        except (JSONDecodeError, OSError, ValueError) as error:
-            return self.errorHandler.handle(error)
+                self.output(">>>>>> VERIFYING UPDATES <<<<<<", True)
+                self.output("OFFLOADER: Reacquiring MediaRenditions...")
+            if full or self.syncMode == 'full' or not self.store.count('SYNC', 'TableName', 'MMIDS'):
+                self.output(f'DB.GETMMIDS: Cloning MediaRenditions table...')
+                checksums = self.getChecksums()
+                staging = self.stage('MMIDS', f'SELECT RenditionNumber, MediaMasterID, RenditionID, PrimaryFileID FROM MediaRenditions')
+                try:
+                    # CLEAR THE CHECKSUMS FIRST AND SWAP THE SNAPSHOT IN ONE TRANSACTION, SO CHECKSUMS NEVER CLAIM A PARTIAL TABLE IS CURRENT
+                    with self.store.transaction():
+                        self.store.delete('SYNC', 'TableName', 'MMIDS')
+                        self.store.purge('MMIDS')
+                        self.metrics.add('rows', self.store.load('MMIDS', staging))
+                        self.store.insert('SYNC', checksums.values())
+                finally:
+                    staging.close()
+            else:
+                self.output(f'DB.GETMMIDS: Synchronising MediaRenditions table...')
+                rows = self.syncMMIDs()
+                self.output(f'DB.GETMMIDS: Synchronised {rows} changed {"row" if rows == 1 else "rows"} of MediaRenditions')
+            return True
+        except (JSONDecodeError, OSError, ValueError, TypeError, sqlite3.DatabaseError, InterfaceError, OperationalError, DatabaseError, ProgrammingError, PoolTimeout) as error:
+            self.errorHandler.handle(error)
+            return False
+
+    def getChecksums(self) -> dict:
+        """ Checksum MediaRenditions on the MS Server per range of bucketSize RenditionIDs
+        ### Returns
+        - dict : bucket -> SYNC record with the checksum and row count of the range
+        """
+        rows = self.queryBuilder(f'SELECT RenditionID / {int(self.bucketSize)} AS Bucket, CHECKSUM_AGG(BINARY_CHECKSUM(RenditionNumber, MediaMasterID, RenditionID, PrimaryFileID)) AS Checksum, COUNT(*) AS [Rows] FROM MediaRenditions GROUP BY RenditionID / {int(self.bucketSize)}')
+        return { r['Bucket'] : { 'TableName' : 'MMIDS', 'Bucket' : r['Bucket'], 'Checksum' : r['Checksum'], 'Rows' : r['Rows'] } for r in rows }
 
-    def getMTIDs(self) -> str:
-        """ Downloading MediaFormats table from MS Server and store it in TinyDB.
+    def syncMMIDs(self) -> int:
+        """ Bring the local MediaRenditions snapshot up to date by comparing checksums per key range and refetching only the ranges that differ
         ### Returns
-        - str : getMMIDs to start the next step in the processing stage
+        - int : number of rows downloaded
         """
+        remote = self.getChecksums()
+        local = { r['Bucket'] : r for r in self.store.find('SYNC', 'TableName', 'MMIDS') }
+        changed = sorted(b for b in remote.keys() | local.keys() if remote.get(b, {}).get('Checksum') != local.get(b, {}).get('Checksum') or remote.get(b, {}).get('Rows') != local.get(b, {}).get('Rows'))
+
+        # MERGE ADJACENT BUCKETS INTO RANGES TO KEEP THE NUMBER OF QUERIES DOWN
+        ranges = []
+        for bucket in changed:
+            if ranges and ranges[-1][1] == bucket: ranges[-1][1] = bucket + 1
+            else: ranges.append([bucket, bucket + 1])
+
+        ranges = [(lo * self.bucketSize, hi * self.bucketSize) for lo, hi in ranges]
+        staging = Staging('MMIDS')
         try:
-            table = self.tinyDB.table('MTIDS') 
-            self.tinyDB.purge_table('MTIDS')
-            self.outputToConsole(f'DB.GETMTIDS: Cloning MediaFormats table...')
-            mtids = self.queryBuilder("SELECT * FROM MediaFormats WHERE Format LIKE %s", "JPEG2000")
-            table.insert_multiple({ 'Format' : t["Format"], 'FormatID' : t["FormatID"], "MediaTypeID" : t["MediaTypeID"] } for t in mtids)
-            return 'getMMIDs'
-        except OSError as error:
-            return self.errorHandler.handle(error)
+            for lo, hi in ranges:
+                self.stage('MMIDS', f'SELECT RenditionNumber, MediaMasterID, RenditionID, PrimaryFileID FROM MediaRenditions WHERE RenditionID >= %d AND RenditionID < %d', (lo, hi), staging)
+
+            # THE CHANGED RANGES AND THEIR CHECKSUMS ARE SWAPPED IN TOGETHER ONCE ALL OF THEM ARE DOWNLOADED
+            with self.store.transaction():
+                for lo, hi in ranges: self.store.delete('MMIDS', 'RenditionID', lo, hi)
+                downloaded = self.store.load('MMIDS', staging)
+                self.store.delete('SYNC', 'TableName', 'MMIDS')
+                self.store.insert('SYNC', remote.values())
+        finally:
+            staging.close()
+        self.metrics.add('rows', downloaded)
+        return downloaded
+
+    def getMTIDs(self) -> bool:
+        """ Downloading MediaFormats table from MS Server and store it in the local store.
+        ### Returns
+        - bool : True if the local table is up to date
+        """
+        try:
+            self.output(f'DB.GETMTIDS: Cloning MediaFormats table...')
+            self.streamInto('MTIDS', "SELECT Format, FormatID, MediaTypeID FROM MediaFormats WHERE Format LIKE %s", ("JPEG2000",), replace=True)
+            return True
+        except (OSError, sqlite3.DatabaseError, InterfaceError, OperationalError, DatabaseError, ProgrammingError, PoolTimeout) as error:
+            self.errorHandler.handle(error)
+            return False
 
-    def getIIDs(self) -> str:
-        """ Downloading ScratchTable from MS Server and store it in TinyDB.
+    def getIIDs(self) -> bool:
+        """ Downloading ScratchTable from MS Server and store it in the local store.
         ### Returns
-        - str : batchUpdate to start the next step in the processing stage
+        - bool : True if the local table is up to date
         """
         try:
-            table = self.tinyDB.table('IIDS')
-            self.tinyDB.purge_table('IIDS')
             # self.outputToConsole(f'DB.{self.getIIDs.__name__.upper()}: Refreshing local table "IIDS" in {self.dbPath}')
-            self.outputToConsole(f'DB.GETIIDS: Cloning {self.tempTable} table...')
-            iids = self.queryBuilder(f'SELECT RenditionID, FileID FROM {self.tempTable}')
-            table.insert_multiple({ 'RenditionID' : t["RenditionID"], 'FileID' : t["FileID"] } for t in iids)
-            return 'batchUpdate'
-        except OSError as error:
-            return self.errorHandler.handle(error)
+            self.output(f'DB.GETIIDS: Cloning {self.tempTable} table...')
+            self.streamInto('IIDS', f'SELECT RenditionID, FileID FROM {self.tempTable}', replace=True)
+            return True
+        except (OSError, sqlite3.DatabaseError, InterfaceError, OperationalError, DatabaseError, ProgrammingError, PoolTimeout) as error:
+            self.errorHandler.handle(error)
+            return False
+
+    def getVerification(self) -> bool:
+        """ Download the MediaRenditions rows of the renditions that received a new MediaFile in this run. The RenditionIDs are taken from the scratch table on the server, so only as many rows as the batch holds come back.
+        ### Returns
+        - bool : True if the updated renditions were downloaded
+        """
+        try:
+            self.output(">>>>>> VERIFYING UPDATES <<<<<<", True)
+            self.output(f'DB.GETVERIFICATION: Reacquiring updated renditions from MediaRenditions...')
+            rows = self.streamInto('VERIFY', f'SELECT r.RenditionNumber, r.MediaMasterID, r.RenditionID, r.PrimaryFileID FROM MediaRenditions r WHERE r.RenditionID IN (SELECT s.RenditionID FROM {self.tempTable} s)', replace=True)
+            self.output(f'DB.GETVERIFICATION: Reacquired {rows} {"rendition" if rows == 1 else "renditions"}')
+            return True
+        except (OSError, TypeError, sqlite3.DatabaseError, InterfaceError, OperationalError, DatabaseError, ProgrammingError, PoolTimeout) as error:
+            self.errorHandler.handle(error)
+            return False
+
+    def getTables(self, tables:list=('MTIDS', 'MMIDS')) -> dict:
+        """ Download several reference tables at the same time, each on its own pooled connection, and read them back from the local store once all downloads have finished
+        ### Parameters
+        - tables (list) : local tables to refresh; MTIDS, MMIDS and/or IIDS (default=('MTIDS', 'MMIDS'))
+        ### Returns
+        - dict : table -> list of records, or False if a download failed
+        """
+        downloads = { 'MTIDS' : self.getMTIDs, 'MMIDS' : self.getMMIDs, 'IIDS' : self.getIIDs }
 
-    def getAllMMIDS(self) -> list: return self.tinyDB.table('MMIDS').all()
-    def getAllMTIDS(self) -> list: return self.tinyDB.table('MTIDS').all()
-    def getAllIIDS(self) -> list: return self.tinyDB.table('IIDS').all()
+        def download(table):
+            # EACH DOWNLOAD IS MEASURED AS A STAGE OF ITS OWN IN ITS POOL THREAD
+            with self.metrics.stage(downloads[table].__name__) as record:
+                result = downloads[table]()
+                if result is False: record.status = 'failed'
+                return result
+
+        self.output(f'DB.GETTABLES: Downloading {", ".join(tables)} concurrently...')
+        with ThreadPool(len(tables)) as pool:
+            results = pool.map(download, tables)
+        if not all(results): return False
+        return { table : self.store.all(table) for table in tables }
+
+    def getAllMMIDS(self) -> list: return self.store.all('MMIDS')
+    def getAllMTIDS(self) -> list: return self.store.all('MTIDS')
+    def getAllIIDS(self) -> list: return self.store.all('IIDS')
+    def getAllVERIFY(self) -> list: return self.store.all('VERIFY')
 
     def find(self, table, field, id) -> list: 
-        """ Find value in TinyDB
+        """ Find value in the local store
         ### Parameters
         - table (str) : name of the table
         - field (str) : name of the field
         - id (str) : name of the query parameter
         ### Returns
-        - list[documents] : list with TinyDB documents
+        - list[documents] : list with matching records
         """
         try: 
-            return self.tinyDB.table(table).search(where(field) == id)
-        except JSONDecodeError:
+            return self.store.find(table, field, id)
+        except (JSONDecodeError, sqlite3.DatabaseError):
             res = {}
             res['res'] = False
             res['msg'] = 'Local scratch table was corrupted and has to be refreshed. Please restart the program.'
             self.notify(res)
 
     def count(self, table, field, id) -> int:
-        """ Count values in TinyDB
+        """ Count values in the local store
         ### Parameters
         - table (str) : name of the table
         - field (str) : name of the field
         - id (str) : name of the query parameter
         ### Returns
-        - int : number of relevant TinyDB documents
+        - int : number of relevant records
         """
-        return self.tinyDB.table(table).count(where(field) == id)
+        return self.store.count(table, field, id)
     
-    def addMediaFiles(self, records:list) -> str:
+    def addMediaFiles(self, records:list) -> bool:
         """ Add new MediaFile records to the MediaFiles table
         ### Parameters
         - records (list) : list with new records to be added
         ### Returns
-        - str : getIIDs to start the next step in the processing stage
+        - bool : True if the records were inserted
         """
+        self.rejected['addMediaFiles'] = self.journal.rejects().get('addMediaFiles', []) if self.journal is not None else []
         try:
-            self.queryBuilder(f"INSERT INTO MediaFiles (RenditionID, PathID, FileName, FormatID, LoginID, ArchIDNum, EnteredDate) OUTPUT INSERTED.[RenditionID], INSERTED.[FileID] INTO dbo.{self.tempTable} VALUES(%d, %d, %s, %d, %s, %s, %d)", records)
-            return 'getIIDs'
-        except:
-            print('error')
+            query = f"INSERT INTO MediaFiles (RenditionID, PathID, FileName, FormatID, LoginID, ArchIDNum, EnteredDate) OUTPUT INSERTED.[RenditionID], INSERTED.[FileID] INTO dbo.{self.tempTable} VALUES"
+            if self.bulk:
+                self.output(f'DB.ADDMEDIAFILES: Inserting {len(records)} {"record" if len(records) == 1 else "records"} in chunks of {self.chunkSize}...')
+                return isinstance(self.bulkInsert(query, "(%d, %d, %s, %d, %s, %s, %d)", records, 'addMediaFiles'), int)
+            return self.queryBuilder(f"{query}(%d, %d, %s, %d, %s, %s, %d)", records, 'addMediaFiles') is True
+        except (InterfaceError, OperationalError, DatabaseError, ProgrammingError, PoolTimeout) as error:
+            self.errorHandler.handle(error)
+            return False
 
-    def updateMediaRenditions(self, records:list) -> str:
-        """ Updates the MediaRenditions table to set new MediaFile for thumbnails
+    def matchOnServer(self, items:list, pathID:int=2327) -> tuple:
+        """ Match DRS items against MediaRenditions and MediaFormats on the MS Server and add their MediaFiles set-based, so the catalog never has to be downloaded. The items are uploaded to a staging table, resolved with a join, and MediaFiles are inserted with INSERT ... SELECT per range of rows. Only the IDs of the matched items come back.
         ### Parameters
-        - records (list) : list with new records to be updated
+        - items (list) : items extracted from the DRS reports
+        - pathID (int) : PathID of the new MediaFiles (default=2327)
         ### Returns
-        - str : verify to start the next step in the processing stage
+        - tuple : matched items updated with their rendition and format IDs, and problem items. After an error only the items whose MediaFiles were committed are matched
         """
+        rows = [(idx, item['RenditionNumber'], item['Format'], item['FileName'], item['File-ID']) for idx, item in enumerate(items)]
+        self.rejected['matchOnServer'] = self.journal.rejects().get('matchOnServer', []) if self.journal is not None else []
+        resolved = []
+        through = self.journal.progress('matchOnServer', -1) if self.journal is not None else -1   # LAST ROWID WHOSE MEDIAFILE IS COMMITTED
         try:
-            self.queryBuilder(f"UPDATE MediaRenditions SET PrimaryFileID = %s, ThumbPathID = %s, ThumbFileName = %s, ThumbExtensionID = %s WHERE MediaMasterID = %s", records)
-            return 'verify'
-        except:
-            print('error')
+            with self.getPool().connection() as conn:
+                cur = conn.cursor()
+                try:
+                    self.execute(cur, "IF OBJECT_ID('tempdb..#DRSItems') IS NOT NULL DROP TABLE #DRSItems")
+                    self.execute(cur, "IF OBJECT_ID('tempdb..#Resolved') IS NOT NULL DROP TABLE #Resolved")
+                    self.execute(cur, "CREATE TABLE #DRSItems (RowID INT PRIMARY KEY, RenditionNumber NVARCHAR(450), Format NVARCHAR(450), FileName NVARCHAR(MAX), ArchIDNum NVARCHAR(450))")
+                    self.insertChunks(conn, cur, "INSERT INTO #DRSItems (RowID, RenditionNumber, Format, FileName, ArchIDNum) VALUES", "(%d, %s, %s, %s, %s)", rows, rejectAs='matchOnServer')
+                    self.commit(conn)
+
+                    # THE FIRST RENDITION FOR A RENDITIONNUMBER WINS, AS IT DOES WHEN MATCHING LOCALLY
+                    self.execute(cur, "SELECT d.RowID, d.FileName, d.ArchIDNum, r.MediaMasterID, r.RenditionID, r.PrimaryFileID, f.FormatID, f.MediaTypeID INTO #Resolved FROM #DRSItems d CROSS APPLY (SELECT TOP 1 MediaMasterID, RenditionID, PrimaryFileID FROM MediaRenditions WHERE RenditionNumber = d.RenditionNumber ORDER BY RenditionID) r CROSS APPLY (SELECT TOP 1 FormatID, MediaTypeID FROM MediaFormats WHERE Format = d.Format AND Format LIKE %s ORDER BY FormatID) f", ("JPEG2000",))
+                    self.execute(cur, "SELECT RowID, MediaMasterID, RenditionID, PrimaryFileID, FormatID, MediaTypeID FROM #Resolved ORDER BY RowID")
+                    resolved = self.fetch(cur)
+                    self.commit(conn)
+
+                    keys = [r[0] for r in resolved if r[0] > through]
+
+                    def insert(cur, chunk):
+                        self.execute(cur, f"INSERT INTO MediaFiles (RenditionID, PathID, FileName, FormatID, LoginID, ArchIDNum, EnteredDate) OUTPUT INSERTED.[RenditionID], INSERTED.[FileID] INTO dbo.{self.tempTable} SELECT RenditionID, %d, FileName, FormatID, %s, ArchIDNum, GETDATE() FROM #Resolved WHERE RowID BETWEEN %d AND %d", (pathID, 'Offloader', chunk[0], chunk[-1]))
+                        return len(chunk)
 
-    def connect(self, idx:int) -> None:
-        """ Sets up a new database connection to the MS Server on the class
+                    def committed(end):
+                        nonlocal through
+                        through = keys[end - 1]
+                        if self.journal is not None: self.journal.advance('matchOnServer', through)
+
+                    sizer = ChunkSizer(self.updateRangeSize, maxSize=self.updateRangeSize, target=self.chunkTarget, adaptive=self.adaptiveChunks)
+                    self.writeChunks(conn, cur, keys, insert, sizer, committed, 'matchOnServer', lambda key: rows[key])
+
+                    self.execute(cur, "DROP TABLE #Resolved")
+                    self.execute(cur, "DROP TABLE #DRSItems")
+                    self.commit(conn)
+                finally:
+                    cur.close()
+        except (InterfaceError, OperationalError, DatabaseError, ProgrammingError, PoolTimeout) as error:
+            self.errorHandler.handle(error)
+            if through < 0: return [], items
+            # CHUNKS COMMITTED BEFORE THE ERROR HAVE THEIR MEDIAFILES ON THE SERVER, SO THEIR ITEMS ARE MATCHED
+            resolved = [r for r in resolved if r[0] <= through]
+            self.output(f'DB.MATCHONSERVER: MediaFiles were committed up to row {through} of {len(items)} before the error; {len(resolved)} items are kept as matched', False)
+            self.logger.logToSystemLog(f'DB.MATCHONSERVER: Partial insert into MediaFiles up to RowID {through}; {len(resolved)} matched items were resolved in this run')
+
+        # REJECTED ITEMS ARE REPORTED BY THE PIPELINE WITH THE ERROR OF THE SERVER
+        rejected = { record[0] for record, error in self.rejects('matchOnServer') }
+        matched = []
+        for rowID, mediaMasterID, renditionID, primaryFileID, formatID, mediaTypeID in resolved:
+            if rowID in rejected: continue
+            item = items[rowID]
+            item.update({ 'MediaMasterID' : mediaMasterID, 'RenditionID' : renditionID, 'PrimaryFileID' : primaryFileID, 'FormatID' : formatID, 'MediaTypeID' : mediaTypeID })
+            matched.append(item)
+        found = { r[0] for r in resolved }
+        return matched, [item for idx, item in enumerate(items) if idx not in found and idx not in rejected]
+
+    def bulkInsert(self, prefix:str, row:str, records:list, stage:str=None) -> int:
+        """ Insert records with chunked multi-row VALUES lists on a single pooled connection
         ### Parameters
-        - idx (int) : random number for connection
+        - prefix (str) : INSERT statement up to and including VALUES
+        - row (str) : placeholders for a single row, e.g. (%d, %s)
+        - records (list) : tuples with the values for each row
+        - stage (str) : name under which the committed rows are recorded in the journal (default=None, not recorded)
+        ### Returns
+        - int : number of rows inserted
         """
         try:
-            cnx = f'connection{idx}'
-            conn = pymssql.connect(self.host, self.user, self.password, self.db)
-            setattr(self, cnx, conn)
-        except InterfaceError as error: return self.errorHandler.handle(error, 'MSSQLDriverException')
-        except DatabaseError as error: return self.errorHandler.handle(error, 'MSSQLDatabaseException')
-    
-    def cursor(self, idx:int) -> None:
-        """ Opens a database connection to the MS Server on the class
+            with self.getPool().connection() as conn:
+                cur = conn.cursor()
+                try:
+                    inserted = self.insertChunks(conn, cur, prefix, row, records, stage)
+                    if not self.commitPerChunk:
+                        self.commit(conn)
+                        if stage is not None and self.journal is not None: self.journal.advance(stage, len(records))
+                    return inserted
+                finally:
+                    cur.close()
+        except (InterfaceError, OperationalError, DatabaseError, ProgrammingError, PoolTimeout) as error:
+            return self.errorHandler.handle(error)
+
+    def insertChunks(self, conn, cur, prefix:str, row:str, records:list, stage:str=None, rejectAs:str=None) -> int:
+        """ Run multi-row INSERT statements on an open cursor. With commitPerChunk the chunks are sized by a ChunkSizer and committed one by one, and a chunk the server rejects is bisected so the other rows still land. With a stage, the rows a resumed run already committed are skipped and every committed chunk is recorded in the journal
+        ### Parameters
+        - conn (Connection) : connection checked out from the pool
+        - cur (Cursor) : cursor on conn
+        - prefix (str) : INSERT statement up to and including VALUES
+        - row (str) : placeholders for a single row
+        - records (list) : tuples with the values for each row
+        - stage (str) : name under which the committed rows are recorded in the journal (default=None, not recorded)
+        - rejectAs (str) : stage under which rejected rows are recorded (default=None, stage)
+        ### Returns
+        - int : number of rows inserted
+        """
+        journal = self.journal if stage is not None else None
+        start = journal.progress(stage, 0) if journal is not None else 0
+        if start: self.output(f'DB.INSERTCHUNKS: Skipping {start} {"row" if start == 1 else "rows"} committed by the unfinished run')
+
+        def write(cur, chunk):
+            self.execute(cur, f'{prefix} {", ".join([row] * len(chunk))}', tuple(value for record in chunk for value in record))
+            return len(chunk)
+
+        if not self.commitPerChunk:
+            # ONE TRANSACTION FOR ALL CHUNKS; A REJECTED ROW ROLLS BACK THE WHOLE INSERT
+            inserted = sum(write(cur, records[i:i + self.chunkSize]) for i in range(start, len(records), self.chunkSize))
+        else:
+            sizer = ChunkSizer(self.chunkSize, maxSize=1000, target=self.chunkTarget, adaptive=self.adaptiveChunks)
+            inserted, rejected = self.writeChunks(conn, cur, records[start:], write, sizer, (lambda end: journal.advance(stage, start + end)) if journal is not None else None, rejectAs or stage)
+        self.metrics.add('rows', inserted)
+        return inserted
+
+    def writeChunks(self, conn, cur, units:list, write:function, sizer:ChunkSizer, committed:function=None, stage:str=None, record:function=None) -> tuple:
+        """ Write units, such as records or keys of a range update, in chunks that are committed one by one. The ChunkSizer picks the size of each chunk from how long the last ones took. A chunk the server rejects is rolled back and bisected, so only the units that fail are left out. The rejected rows are recorded under stage before committed is called, so the journal never moves past a rejected row it does not know about
+        ### Parameters
+        - conn (Connection) : connection checked out from the pool
+        - cur (Cursor) : cursor on conn
+        - units (list) : units to write, in order
+        - write (function) : called with cur and a chunk of units; writes them without committing and returns the number of rows written
+        - sizer (ChunkSizer) : sizes the chunks
+        - committed (function) : called with the number of units handled so far after each commit (default=None)
+        - stage (str) : stage under which rejected rows are recorded (default=None)
+        - record (function) : gives the record of a rejected unit, such as the record of a key (default=None, the unit itself)
+        ### Returns
+        - tuple : rows written, and (record, error) for every unit the server rejected
+        """
+        written, rejected, i = 0, [], 0
+        while i < len(units):
+            chunk = units[i:i + sizer.size]
+            try:
+                written += self.attempt(conn, cur, chunk, write, sizer)
+            except (IntegrityError, DataError, OperationalError) as error:
+                # A DROPPED LINK OR DEAD CONNECTION IS NOT A BAD ROW; THE CHUNK IS NOT MARKED AS HANDLED
+                if not self.rowError(error): raise
+                n, bad = self.bisect(conn, cur, chunk, write, sizer, error, i, committed, stage, record)
+                written += n
+                rejected.extend(bad)
+            i += len(chunk)
+            if committed is not None: committed(i)
+        if rejected: self.output(f'DB: The TMS server rejected {len(rejected)} {"row" if len(rejected) == 1 else "rows"} in {stage}; the other rows have been written', False)
+        if sizer.chunks: self.logger.logToSystemLog(f'DB.WRITECHUNKS: {written} rows in {sizer.chunks} chunks of {sizer.sizes[0]} to {sizer.sizes[1]} rows, {sizer.lockWaits} lock waits, {len(rejected)} rejected')
+        return written, rejected
+
+    def attempt(self, conn, cur, chunk:list, write:function, sizer:ChunkSizer) -> int:
+        """ Write and commit one chunk. A chunk that waited on a lock held by another session is rolled back and retried after a pause, and later chunks are made smaller. If the rollback fails the connection is gone, and an InterfaceError is raised so the chunk is neither retried nor bisected
+        ### Parameters
+        - conn (Connection) : connection checked out from the pool
+        - cur (Cursor) : cursor on conn
+        - chunk (list) : units to write
+        - write (function) : writes the units without committing
+        - sizer (ChunkSizer) : sizes the chunks
+        ### Returns
+        - int : rows written
+        """
+        retries = 0
+        while True:
+            started = time.perf_counter()
+            try:
+                written = write(cur, chunk)
+                self.commit(conn)
+                sizer.observe(len(chunk), time.perf_counter() - started)
+                return written
+            except (IntegrityError, DataError, OperationalError) as error:
+                try:
+                    conn.rollback()
+                except Exception as rollbackError:
+                    raise InterfaceError(f'Rollback failed after {error}: {rollbackError}') from error
+                if not self.lockWait(error) or retries >= self.lockRetries: raise
+                retries += 1
+                sizer.contended()
+                # BACK OFF SO THE SESSION HOLDING THE LOCK CAN FINISH
+                time.sleep(min(0.1 * 2 ** retries, 5) * random.uniform(0.5, 1.5))
+
+    def bisect(self, conn, cur, chunk:list, write:function, sizer:ChunkSizer, error:Exception, offset:int=0, committed:function=None, stage:str=None, record:function=None) -> tuple:
+        """ Write the halves of a rejected chunk, and split the halves that are rejected in turn, until the units the server rejects are isolated. An isolated unit is recorded under stage before committed moves past it
+        ### Parameters
+        - conn (Connection) : connection checked out from the pool
+        - cur (Cursor) : cursor on conn
+        - chunk (list) : units of the rejected chunk
+        - write (function) : writes the units without committing
+        - sizer (ChunkSizer) : sizes the chunks
+        - error (Exception) : error the chunk was rejected with
+        - offset (int) : position of the chunk in the units of writeChunks (default=0)
+        - committed (function) : called with the number of units handled so far after each commit (default=None)
+        - stage (str) : stage under which rejected rows are recorded (default=None)
+        - record (function) : gives the record of a rejected unit (default=None, the unit itself)
+        ### Returns
+        - tuple : rows written, and (record, error) for every unit that was rejected
+        """
+        if len(chunk) == 1:
+            rejected = [(chunk[0] if record is None else record(chunk[0]), error)]
+            self.reject(stage, rejected)
+            return 0, rejected
+        written, rejected, mid = 0, [], len(chunk) // 2
+        for part, at in ((chunk[:mid], offset), (chunk[mid:], offset + mid)):
+            try:
+                written += self.attempt(conn, cur, part, write, sizer)
+            except (IntegrityError, DataError, OperationalError) as partError:
+                if not self.rowError(partError): raise
+                n, bad = self.bisect(conn, cur, part, write, sizer, partError, at, committed, stage, record)
+                written += n
+                rejected.extend(bad)
+            if committed is not None: committed(at + len(part))
+        return written, rejected
+
+    def rowError(self, error:Exception) -> bool:
+        """ Tell an error caused by the values of a row, which bisecting the chunk can isolate, from an error of the connection or the statement
+        ### Parameters
+        - error (Exception) : error raised by the MS Server
+        ### Returns
+        - bool : True if the server rejected rows of the chunk
+        """
+        if isinstance(error, (IntegrityError, DataError)): return True
+        code = error.args[0] if error.args and isinstance(error.args[0], int) else None
+        return isinstance(error, OperationalError) and code in ROWERRORS
+
+    def lockWait(self, error:Exception) -> bool:
+        """ Tell a deadlock or lock timeout, after which a chunk can be retried, from a rejected row
+        ### Parameters
+        - error (Exception) : error raised by the MS Server
+        ### Returns
+        - bool : True if the chunk waited on a lock held by another session
+        """
+        code = error.args[0] if error.args and isinstance(error.args[0], int) else None
+        message = str(error).lower()
+        return code in (1205, 1222) or 'deadlock' in message or 'lock request time out' in message or 'database is locked' in message
+
+    def reject(self, stage:str, rejected:list) -> None:
+        """ Record the rows the MS Server rejected in a stage, here and in the journal; the pipeline moves the items they belong to into the problem records. Rows already recorded, for example by a staging insert repeated on resume, are left out
+        ### Parameters
+        - stage (str) : name of the stage
+        - rejected (list) : (record, error) tuples
+        """
+        known = { record for record, error in self.rejected.get(stage, []) }
+        rejected = [(record, error) for record, error in rejected if record not in known]
+        if not rejected: return
+        self.rejected.setdefault(stage, []).extend(rejected)
+        if stage is not None and self.journal is not None: self.journal.reject(stage, rejected)
+        for record, error in rejected:
+            self.logger.logToSystemLog(f'DB: {stage} rejected {record}: {error}')
+
+    def rejects(self, stage:str) -> list:
+        """ List the rows the MS Server rejected in a stage of this run
         ### Parameters
-        - idx (int) : random number for connection
+        - stage (str) : name of the stage
         ### Returns
-        - Any : pointer to the pymssql cursor on the class
+        - list : (record, error) tuples
         """
+        return self.rejected.get(stage, [])
+
+    def updateMediaRenditions(self, records:list) -> bool:
+        """ Updates the MediaRenditions table to set new MediaFile for thumbnails
+        ### Parameters
+        - records (list) : list with new records to be updated
+        ### Returns
+        - bool : True if the renditions were updated
+        """
+        self.rejected['updateMediaRenditions'] = self.journal.rejects().get('updateMediaRenditions', []) if self.journal is not None else []
         try:
-            self.connect(idx)
-            
-            cnx = f'connection{idx}'
-            cid = f'cursor{idx}'
+            if self.bulk:
+                self.output(f'DB.UPDATEMEDIARENDITIONS: Updating {len(records)} {"rendition" if len(records) == 1 else "renditions"} through a staging table...')
+                return isinstance(self.bulkUpdateMediaRenditions(records), int)
+            # THE JOURNAL KEEPS THE LAST MEDIAMASTERID COMMITTED ON BOTH PATHS, SO EITHER CAN RESUME A RUN THE OTHER STARTED
+            latest = { record[4] : record for record in records }
+            return self.queryBuilder(f"UPDATE MediaRenditions SET PrimaryFileID = %s, ThumbPathID = %s, ThumbFileName = %s, ThumbExtensionID = %s WHERE MediaMasterID = %s", [latest[key] for key in sorted(latest)], 'updateMediaRenditions', lambda record: record[4]) is True
+        except (InterfaceError, OperationalError, DatabaseError, ProgrammingError, PoolTimeout) as error:
+            self.errorHandler.handle(error)
+            return False
 
-            conn = getattr(self, cnx)
-            
-            cur = conn.cursor(as_dict=True)
-            setattr(self, cid, cur)
+    def bulkUpdateMediaRenditions(self, records:list) -> int:
+        """ Load the updates into a staging table and apply them with one UPDATE ... FROM ... JOIN per range of MediaMasterIDs. Ranges stay below the lock escalation threshold, are sized to commit in about chunkTarget seconds and are committed one by one; a range the server rejects is bisected down to the renditions that fail
+        ### Parameters
+        - records (list) : (FileID, ThumbPathID, ThumbFileName, ThumbExtensionID, MediaMasterID) tuples
+        ### Returns
+        - int : number of renditions updated
+        """
+        # THE LAST RECORD FOR A MEDIAMASTERID WINS, AS IT DID WITH ONE UPDATE PER RECORD
+        latest = { record[4] : record for record in records }
+        # RANGES COMMITTED BY AN UNFINISHED RUN ARE NOT STAGED AGAIN
+        committed = self.journal.progress('updateMediaRenditions') if self.journal is not None else None
+        if committed is not None: latest = { key : record for key, record in latest.items() if key > committed }
+        updated = 0
+        try:
+            with self.getPool().connection() as conn:
+                cur = conn.cursor()
+                try:
+                    self.execute(cur, "IF OBJECT_ID('tempdb..#RenditionUpdates') IS NOT NULL DROP TABLE #RenditionUpdates")
+                    self.execute(cur, "CREATE TABLE #RenditionUpdates (FileID INT, ThumbPathID INT, ThumbFileName NVARCHAR(MAX), ThumbExtensionID INT, MediaMasterID INT PRIMARY KEY)")
+                    self.insertChunks(conn, cur, "INSERT INTO #RenditionUpdates (FileID, ThumbPathID, ThumbFileName, ThumbExtensionID, MediaMasterID) VALUES", "(%d, %d, %s, %d, %d)", list(latest.values()), rejectAs='updateMediaRenditions')
+                    self.commit(conn)
+                    keys = sorted(key for key in latest if key not in { record[4] for record, error in self.rejects('updateMediaRenditions') })
+
+                    def update(cur, chunk):
+                        self.execute(cur, "UPDATE r SET r.PrimaryFileID = u.FileID, r.ThumbPathID = u.ThumbPathID, r.ThumbFileName = u.ThumbFileName, r.ThumbExtensionID = u.ThumbExtensionID FROM MediaRenditions r JOIN #RenditionUpdates u ON r.MediaMasterID = u.MediaMasterID WHERE u.MediaMasterID BETWEEN %d AND %d", (chunk[0], chunk[-1]))
+                        return cur.rowcount
 
-            return getattr(self, cid)
-        except (AssertionError, OperationalError) as error:
+                    # RANGES STAY BELOW THE LOCK ESCALATION THRESHOLD
+                    sizer = ChunkSizer(self.updateRangeSize, maxSize=self.updateRangeSize, target=self.chunkTarget, adaptive=self.adaptiveChunks)
+                    updated, rejected = self.writeChunks(conn, cur, keys, update, sizer, (lambda end: self.journal.advance('updateMediaRenditions', keys[end - 1])) if self.journal is not None else None, 'updateMediaRenditions', lambda key: latest[key])
+                    self.execute(cur, "DROP TABLE #RenditionUpdates")
+                    self.commit(conn)
+                finally:
+                    cur.close()
+            return updated
+        except (InterfaceError, OperationalError, DatabaseError, ProgrammingError, PoolTimeout) as error:
             return self.errorHandler.handle(error)
 
-    def close(self, idx:int) -> None:
-        """ Closes and removes a database connection to the MS Server on the class
+    def getPool(self) -> ConnectionPool:
+        """ Get the pool of connections to the MS Server, starting it on first use
+        ### Returns
+        - ConnectionPool : pool shared by all methods of this class
+        """
+        with self.poolLock:
+            if self.pool is None or self.pool.closed:
+                self.pool = ConnectionPool(self.connect, *self.poolSize)
+            return self.pool
+
+    def connect(self) -> pymssql.Connection:
+        """ Sets up a new database connection to the MS Server for the pool
+        ### Returns
+        - Connection : new connection of the backend
+        """
+        self.metrics.add('roundTrips', 1)
+        with self.tracer.span('connect'):
+            return self.backend.connect(self.host, self.user, self.password, self.db)
+    
+    def cursor(self, conn) -> pymssql.Cursor:
+        """ Opens a cursor on a pooled database connection
         ### Parameters
-        - idx (int) : random number for connection
+        - conn (Connection) : connection checked out from the pool
+        ### Returns
+        - Any : pymssql cursor returning rows as dictionaries
         """
-        cursorID = f'cursor{idx}'
-        cursor = getattr(self, cursorID)
-        cursor.close()
-        cnx = f'connection{idx}'
-        conn = getattr(self, cnx)
-        conn.close()
+        return conn.cursor(as_dict=True)
 
-    def commit(self, idx:int) -> None:
+    def commit(self, conn) -> None:
         """ Commits data assigned to a database connection
         ### Parameters
-        - idx (int) : random number for connection
+        - conn (Connection) : connection checked out from the pool
         """
-        cnx = f'connection{idx}'
-        connection = getattr(self, cnx)
-        connection.commit()
\ No newline at end of file
+        with self.tracer.span('commit'):
+            conn.commit()
+        self.metrics.add('roundTrips', 1)
+
+    def close(self) -> None:
+        """ Closes all pooled database connections to the MS Server """
+        with self.poolLock:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
@@ -124,6 +124,15 @@ class ErrorHandler:
             self.logger.logToSystemLog(f'{self.exception["code"]}')
         return res
 
+    def timeoutError(self) -> dict:
+        """ Process timeouts waiting for a database connection
+        """
+        res['msg'] = f'{self.exception["code"][0]}. The TMS server may be overloaded or unreachable.'
+        if self.verbose:
+            self.logger.logToSystemLog(self.setException('TimeoutError'))
+            self.logger.logToSystemLog(f'{self.exception["code"]}')
+        return res
+
     def permissionError(self) -> dict:
         res = {}
         res['res'] = False
@@ -173,5 +182,6 @@ class ErrorHandler:
         if isinstance(e, IndexError): return self.indexError()
         if isinstance(e, gaierror): return self.gaiError('gaierror')
         if isinstance(e, PermissionError): return self.permissionError()
+        if isinstance(e, TimeoutError): return self.timeoutError()
         if isinstance(e, JSONDecodeError): return self.JSONDecodeError()
         if 'ConnectionError' in e: return self.connectionError()
\ No newline at end of file
@@ -1,7 +1,59 @@
-import os
+from __future__ import annotations
+
+import os, sys, mmap
+import logger
+from multiprocessing import Pool
+from item import Item
+
+class EntryLog:
+    """ Collects log entries in a worker process and sends them in batches through the log-collector queue, so the parent process, as the single writer, can route them to the log of each report. Every entry keeps the time it was logged at """
+
+    def __init__(self, queue, origin:str, keep:bool=True):
+        self.queue = queue
+        self.origin = origin
+        self.keep = keep
+        self.entries = []   # (KIND, ORIGIN, TIME STAMP, ENTRY) TUPLES IN LOGGING ORDER
+        self.sent = 0       # BATCHES PUT ON THE QUEUE
+
+    def log(self, entry:str, origin:str=None) -> None:
+        if self.keep: self.add('log', entry, origin)
+
+    def logError(self, entry:str, origin:str=None) -> None:
+        self.add('error', entry, origin)
+
+    def add(self, kind:str, entry:str, origin:str=None) -> None:
+        self.entries.append((kind, origin or self.origin, logger.timestamp(), entry))
+        if len(self.entries) >= logger.LogWriter.batchSize: self.send()
+
+    def send(self) -> None:
+        if not self.entries: return
+        self.queue.put(self.entries)
+        self.entries = []
+        self.sent += 1
+
+def extractRange(task:tuple) -> tuple:
+    """
+    Extract the items from a byte range of a report in a worker process
+
+    Args:
+        task (tuple): file name, first byte, end byte, whether the file has a header and whether to keep log entries
+
+    Returns:
+        tuple: file name, items and the number of batches of log entries sent to the log-collector queue
+    """
+    file, start, end, header, log = task
+    extractor = Extractor()
+    extractor.setLogger(EntryLog(logger.collector, file, log))
+    extractor.setHeader(header)
+    items = list(extractor.records(file, start, end))
+    extractor.logger.send()
+    return file, items, extractor.logger.sent
 
 class Extractor:
 
+    COLUMNS = 14                    # HIGHEST COLUMN INDEX READ FROM A ROW IS 13
+    SPLITSIZE = 64 * 1024 * 1024    # REPORTS LARGER THAN THIS ARE SPLIT ACROSS WORKERS
+
     def __init__(self):
         self.counter = 0
         self.items = []
@@ -69,6 +121,79 @@ class Extractor:
         """        
         return self.items
 
+    def lines(self, file:str, start:int=0, end:int=None):
+        """
+        Iterate over the lines of a file through a read-only memory map, so the report is never read into memory as a whole
+
+        Args:
+            file (str): File name to read
+            start (int, optional): byte offset of the first line. Defaults to 0.
+            end (int, optional): byte offset at which to stop. Defaults to None (end of file).
+
+        Yields:
+            str: each line without its line ending
+        """
+        with open(file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0: return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                mm.seek(start)
+                end = len(mm) if end is None else end
+                while mm.tell() < end:
+                    yield mm.readline().rstrip(b'\r\n').decode('utf8')
+
+    def ranges(self, file:str, size:int=None) -> list:
+        """
+        Split a file into byte ranges of roughly size bytes that start and end on line boundaries
+
+        Args:
+            file (str): File name to split
+            size (int, optional): target size of a range in bytes. Defaults to SPLITSIZE.
+
+        Returns:
+            list: (start, end) byte offsets
+        """
+        size = size or self.SPLITSIZE
+        ranges, start = [], 0
+        with open(file, 'rb') as f:
+            length = os.fstat(f.fileno()).st_size
+            if length == 0: return [(0, 0)]
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                while start < length:
+                    newline = mm.find(b'\n', min(start + size, length) - 1)
+                    end = length if newline < 0 else newline + 1
+                    ranges.append((start, end))
+                    start = end
+        return ranges
+
+    def records(self, file:str, start:int=0, end:int=None):
+        """
+        Lazily extract the items of a file, or of a byte range of it, one row at a time
+
+        Args:
+            file (str): File name to extract data from
+            start (int, optional): byte offset of the first line. Defaults to 0.
+            end (int, optional): byte offset at which to stop. Defaults to None (end of file).
+
+        Yields:
+            Item: one item per unique row
+        """
+        filePath = file.split('/')[-1]
+        if start == 0:
+            self.logger.log(f'Starting new log for {file}')
+            self.logger.log(f'><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>')
+            self.logger.log(f'Skipping first line (header)') if self.header else self.logger.log(f'Looking for header')
+            self.logger.log(f'><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>')
+        else:
+            self.logger.log(f'Continuing from byte {start}; row numbers below count from there')
+
+        # ITERATE OVER ALL DATA IN FILE, SPLITTING NO FURTHER THAN THE LAST COLUMN WE NEED
+        for idx, line in enumerate(self.lines(file, start, end)):
+            if self.header and start == 0 and idx <= 1: continue ### SKIP HEADER
+            item = self.parse(line.split('\t', self.COLUMNS), idx, filePath)
+            if item is not None:
+                self.counter += 1
+                yield item
+
     def extract(self, file:str) -> None:
         """
         Extract ID, URN and Giza ID from the file
@@ -80,34 +205,52 @@ class Extractor:
         self.items = []
         try: 
             if os.access(file, os.R_OK):
-                with open(file, 'r', encoding="utf8") as f:
-                    filePath = file.split('/')[-1]
-                    # firstLine = f.readline().split('\t')
-                    # try:
-                    #     if int(firstLine[0]):
-                    #         self.header = False
-                    # except (OSError, ValueError) as error:
-                    #     self.header = True
-                    rows = f.read().splitlines()
-                    self.logger.log(f'Starting new log for {file}')
-                    self.logger.log(f'><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>')
-                    self.logger.log(f'Skipping first line (header)') if self.header else self.logger.log(f'Looking for header')
-                    self.logger.log(f'><><><><><><><><><><><><><><><><><><><><><><><><><><><><><>')
-
-                    # ITERATE OVER ALL DATA IN FILE
-                    for idx, str in enumerate(rows):
-                        strings = str.split('\t')
-                        if self.header:
-                            if idx > 1: ### SKIP HEADER
-                                self.pull(strings, idx, filePath)
-                        else:
-                            self.pull(strings, idx, filePath)
-                # self.output(f'EXTRACTOR.EXTRACT: Extracted {self.counter} items from {filePath}')
+                self.items.extend(self.records(file))
+                # self.output(f'EXTRACTOR.EXTRACT: Extracted {self.counter} items from {file.split("/")[-1]}')
                 
             if self.backupFlag:
                 self.backupFile.backup(file)
-        except (OSError) as error:
+        except (OSError, ValueError) as error:
+            self.error.handle(error)
+
+    def extractAll(self, files:list, pool:Pool=None, log:bool=False) -> dict:
+        """
+        Extract several reports in parallel. Each report, split into byte ranges if it is large, is handed to a worker process; the results are merged per report in file order. The workers send their log entries through the log-collector queue while they run, so the entries of the ranges of a large report may interleave; each keeps the time it was logged at.
+
+        Args:
+            files (list): File names to extract data from
+            pool (Pool, optional): process pool to run on. Defaults to None (a pool is started for this call).
+            log (bool, optional): write the per-row log entries to the log of each report. Defaults to False.
+
+        Returns:
+            dict: file name -> list of items, in the order of files
+        """
+        results = { file : [] for file in files }
+        # START THE LOGS BEFORE ANY WORKER SENDS AN ENTRY TO THEM
+        queue = self.logger.collect()
+        if log:
+            for file in files: self.logger.newLog(file)
+        sent = self.logger.writer.received
+        try:
+            tasks = [(file, start, end, self.header, log) for file in files if os.access(file, os.R_OK) for start, end in self.ranges(file)]
+            ownPool = pool is None
+            if ownPool: pool = Pool(initializer=logger.setCollector, initargs=(queue,))
+            try:
+                for file, items, batches in pool.imap(extractRange, tasks):
+                    results[file].extend(items)
+                    sent += batches
+            finally:
+                if ownPool:
+                    pool.close()
+                    pool.join()
+        except (OSError, ValueError) as error:
             self.error.handle(error)
+        self.logger.writer.settle(sent)
+
+        for file in files:
+            if self.backupFlag:
+                self.backupFile.backup(file)
+        return results
 
     def pull(self, strings:list, idx:int, origin:str) -> None:
         """
@@ -118,24 +261,40 @@ class Extractor:
             idx (int): number of item in process
             origin (str): original filepath
         """        
+        item = self.parse(strings, idx, origin)
+        if item is not None:
+            self.items.append(item)
+            self.counter += 1
+
+    def parse(self, strings:list, idx:int, origin:str) -> Item:
+        """
+        Extracts all relevant parts from a list of strings
+
+        Args:
+            strings (list): list of strings
+            idx (int): number of item in process
+            origin (str): original filepath
+
+        Returns:
+            Item: the item, or None if the row does not describe a unique item
+        """        
         try:
             ### MAKE SURE WE GET ONE UNIQUE ROW PER ITEM
-            if len(strings[10]) is not 0 and strings[13] is not None:
+            if len(strings[10]) != 0 and strings[13] is not None:
                 self.logger.log(f'Extracting data for {strings[0]}@{idx} : {strings[10]}/{strings[13]}')
                 self.logger.log(f'\tFound: {strings[4]}, {strings[7]}, {strings[10]}, {strings[11]} and {strings[12]}')
-                item = {}
-                item['RenditionNumber'] = strings[4]
-                item['Type'] = strings[7]
-                item['File-ID'] = strings[9]
-                item['FileName'] = strings[10]
                 form = strings[11].split(' ')
                 form.pop()
-                f = ''.join(form)
-                item['Format'] = f
-                item['Size'] = strings[12]
-                item['ThumbnailPath'] = strings[10]
-                item['Origin'] = origin.split('.')[0]
-                self.items.append(item)
-                self.counter += 1
+                ### REPEATED VALUES ARE INTERNED SO ALL ITEMS SHARE ONE COPY
+                item = Item(
+                    RenditionNumber=strings[4],
+                    Type=sys.intern(strings[7]),
+                    DRSFileID=strings[9],
+                    FileName=strings[10],
+                    Format=sys.intern(''.join(form)),
+                    Size=strings[12],
+                    ThumbnailPath=strings[10],
+                    Origin=sys.intern(origin.split('.')[0]))
+                return item
         except IndexError as error:
-            print(idx, origin, strings, error)
\ No newline at end of file
+            print(idx, origin, strings, error)
@@ -0,0 +1,115 @@
+class _Unset:
+    """ Marks a field of an Item that was never set, so a field set to None, such as a NULL read from TMS, is kept as a value """
+    __slots__ = ()
+
+    def __reduce__(self):
+        # UNPICKLE AS THE ONE INSTANCE, SO IDENTITY CHECKS HOLD IN THE WORKERS
+        return '_UNSET'
+
+    def __repr__(self) -> str:
+        return '_UNSET'
+
+_UNSET = _Unset()
+
+class Item:
+    """ This class holds one DRS item and the TMS ids joined onto it. Fields live in __slots__ instead of a per-item dict, and the class reads like a dict so item['RenditionNumber'] keeps working through the pipeline. A field that was never set counts as missing; a field set to None does not.
+    ## Methods (9)
+    - slot : key (str) -> str
+    - __getitem__ : key (str) -> Any
+    - __setitem__ : key (str), value (Any) -> None
+    - __contains__ : key (str) -> bool
+    - get : key (str), default (Any) -> Any
+    - update : record (dict) -> None
+    - keys : () -> list
+    - values : () -> tuple
+    - asDict : () -> dict
+    """
+
+    # FIELDS EXTRACTED FROM THE DRS REPORT, THEN THE IDS JOINED FROM TMS
+    __slots__ = ('RenditionNumber', 'Type', 'DRSFileID', 'FileName', 'Format', 'Size', 'ThumbnailPath', 'Origin',
+                 'MediaMasterID', 'RenditionID', 'PrimaryFileID', 'FormatID', 'MediaTypeID', 'FileID')
+
+    # KEYS THAT ARE NOT VALID ATTRIBUTE NAMES
+    KEYS = { 'File-ID' : 'DRSFileID' }
+    NAMES = { v : k for k, v in KEYS.items() }
+
+    def __init__(self, *values, **fields):
+        """
+        ### Parameters
+        - values (Any) : field values in __slots__ order
+        - fields (Any) : field values by attribute name
+        """
+        for slot, value in zip(self.__slots__, values): setattr(self, slot, value)
+        for slot in self.__slots__[len(values):]: setattr(self, slot, fields.get(slot, _UNSET))
+
+    def slot(self, key:str) -> str:
+        """ Map a dict key on the attribute that holds it
+        ### Parameters
+        - key (str) : dict key of the field
+        ### Returns
+        - str : name of the attribute
+        """
+        slot = self.KEYS.get(key, key)
+        if slot not in self.__slots__: raise KeyError(key)
+        return slot
+
+    def __getitem__(self, key:str):
+        value = getattr(self, self.slot(key))
+        if value is _UNSET: raise KeyError(key)
+        return value
+
+    def __setitem__(self, key:str, value) -> None:
+        setattr(self, self.slot(key), value)
+
+    def __contains__(self, key:str) -> bool:
+        slot = self.KEYS.get(key, key)
+        return slot in self.__slots__ and getattr(self, slot) is not _UNSET
+
+    def get(self, key:str, default=None):
+        """ Read a field, or default if it is missing
+        ### Parameters
+        - key (str) : dict key of the field
+        - default (Any) : returned for a missing field (default=None)
+        ### Returns
+        - Any : value of the field
+        """
+        slot = self.KEYS.get(key, key)
+        value = getattr(self, slot) if slot in self.__slots__ else _UNSET
+        return default if value is _UNSET else value
+
+    def update(self, record:dict) -> None:
+        """ Copy the fields of a TMS record onto the item
+        ### Parameters
+        - record (dict) : fields to set; unknown fields raise a KeyError
+        """
+        for key, value in record.items(): self[key] = value
+
+    def keys(self) -> list:
+        """ List the keys of the fields that are set
+        ### Returns
+        - list : dict keys
+        """
+        return [self.NAMES.get(slot, slot) for slot in self.__slots__ if getattr(self, slot) is not _UNSET]
+
+    def values(self) -> tuple:
+        """ Read all fields in __slots__ order, leaving off missing fields at the end
+        ### Returns
+        - tuple : field values
+        """
+        values = [getattr(self, slot) for slot in self.__slots__]
+        while values and values[-1] is _UNSET: values.pop()
+        return tuple(values)
+
+    def asDict(self) -> dict:
+        """ Copy the fields that are set into a dict
+        ### Returns
+        - dict : dict key -> value
+        """
+        return { key : self[key] for key in self.keys() }
+
+    def __reduce__(self):
+        # PICKLE AS A FLAT TUPLE OF VALUES; NO KEYS ARE SENT TO THE WORKERS
+        return (Item, self.values())
+
+    def __repr__(self) -> str:
+        return f'Item({self.asDict()})'
@@ -0,0 +1,147 @@
+from sharedtable import SharedTable
+
+class Joiner:
+    """ This class joins extracted DRS items against the TMS tables downloaded by DB. Each table is indexed once per stage so every item resolves in constant time.
+    ## Methods (11)
+    - indexRenditions : records (list) -> None
+    - indexFormats : records (list) -> None
+    - indexFiles : records (list) -> None
+    - index : records (list), field (str) -> dict
+    - resolveItems : items (list) -> tuple
+    - resolveFileIDs : items (list) -> tuple
+    - verifyItems : items (list) -> tuple
+    - share : () -> Joiner
+    - tables : () -> list
+    - close : () -> None
+    - release : () -> None
+    """
+
+    RENDITIONFIELDS = ['MediaMasterID', 'RenditionID', 'PrimaryFileID']
+    FORMATFIELDS = ['FormatID', 'MediaTypeID']
+    FILEFIELDS = ['FileID']
+
+    def __init__(self):
+        self.renditions = {}
+        self.formats = {}
+        self.files = {}
+
+    def index(self, records:list, field:str) -> dict:
+        """ Build a keyed index over a list of records. The first record for a key wins, as it did with list.index
+        ### Parameters
+        - records (list) : records downloaded from TMS
+        - field (str) : name of the field to key the index on
+        ### Returns
+        - dict : field value -> record
+        """
+        index = {}
+        for record in records:
+            index.setdefault(record[field], record)
+        return index
+
+    def indexRenditions(self, records:list) -> None:
+        """ Index the MediaRenditions records on RenditionNumber
+        ### Parameters
+        - records (list) : MMIDS records
+        """
+        self.renditions = self.index(records, 'RenditionNumber')
+
+    def indexFormats(self, records:list) -> None:
+        """ Index the MediaFormats records on Format
+        ### Parameters
+        - records (list) : MTIDS records
+        """
+        self.formats = self.index(records, 'Format')
+
+    def indexFiles(self, records:list) -> None:
+        """ Index the scratch table records on RenditionID
+        ### Parameters
+        - records (list) : IIDS records
+        """
+        self.files = self.index(records, 'RenditionID')
+
+    def resolveItems(self, items:list) -> tuple:
+        """ Join each item with its rendition and format records
+        ### Parameters
+        - items (list) : items extracted from the DRS reports
+        ### Returns
+        - tuple : matched items and problem items
+        """
+        matched, problemRecs = [], []
+        for item in items:
+            try:
+                rendition = self.renditions.get(item["RenditionNumber"])
+                form = self.formats.get(item["Format"])
+                if rendition is None or form is None:
+                    problemRecs.append(item)
+                    continue
+                item.update(rendition)
+                item.update(form)
+                matched.append(item)
+            except (KeyError, TypeError):
+                problemRecs.append(item)
+        return matched, problemRecs
+
+    def resolveFileIDs(self, items:list) -> tuple:
+        """ Join each item with the FileID of the MediaFile record inserted for its rendition
+        ### Parameters
+        - items (list) : items resolved by resolveItems
+        ### Returns
+        - tuple : matched items and problem items
+        """
+        matched, problemRecs = [], []
+        for item in items:
+            try:
+                record = self.files.get(item["RenditionID"])
+                if record is None:
+                    problemRecs.append(item)
+                    continue
+                item.update(record)
+                matched.append(item)
+            except (KeyError, TypeError):
+                problemRecs.append(item)
+        return matched, problemRecs
+
+    def verifyItems(self, items:list) -> tuple:
+        """ Check the PrimaryFileID of each rendition in TMS matches the FileID of the item
+        ### Parameters
+        - items (list) : items updated in TMS
+        ### Returns
+        - tuple : verified items and problem items
+        """
+        matched, problemRecs = [], []
+        for item in items:
+            try:
+                rendition = self.renditions.get(item["RenditionNumber"])
+                if rendition is None or rendition["PrimaryFileID"] != item["FileID"]:
+                    problemRecs.append(item)
+                    continue
+                matched.append(item)
+            except (KeyError, TypeError):
+                problemRecs.append(item)
+        return matched, problemRecs
+
+    def share(self):
+        """ Copy the indexes into shared memory. The returned Joiner pickles as a handful of block names, so workers attach to the tables instead of receiving a copy
+        ### Returns
+        - Joiner : join engine backed by SharedTable instances
+        """
+        shared = Joiner()
+        if self.renditions: shared.renditions = SharedTable.create(self.renditions.values(), 'RenditionNumber', self.RENDITIONFIELDS)
+        if self.formats: shared.formats = SharedTable.create(self.formats.values(), 'Format', self.FORMATFIELDS)
+        if self.files: shared.files = SharedTable.create(self.files.values(), 'RenditionID', self.FILEFIELDS)
+        return shared
+
+    def tables(self) -> list:
+        """ List the indexes that live in shared memory
+        ### Returns
+        - list : SharedTable instances of this Joiner
+        """
+        return [t for t in (self.renditions, self.formats, self.files) if isinstance(t, SharedTable)]
+
+    def close(self) -> None:
+        """ Detach from the shared memory tables in this process """
+        for table in self.tables(): table.close()
+
+    def release(self) -> None:
+        """ Free the shared memory tables; only the process that called share() should call this """
+        for table in self.tables(): table.unlink()
@@ -0,0 +1,188 @@
+try:
+    import os, json, pickle, sqlite3, threading
+    from datetime import datetime
+except ImportError as error:
+    print(error)
+
+class Journal:
+    """ This class keeps a durable record of each batch run in a SQLite file: the stages that completed, the state of the pipeline after each of them, and how far the chunked writes to TMS got. A run over the same reports that did not finish is resumed instead of started over.
+    ## Methods (14)
+    - open : () -> None
+    - close : () -> None
+    - signature : files (list) -> str
+    - pending : files (list) -> int
+    - begin : files (list), resume (bool) -> bool
+    - done : () -> set
+    - stageDone : stage (str), state (dict) -> None
+    - state : () -> dict
+    - progress : stage (str), default (Any) -> Any
+    - advance : stage (str), value (Any) -> None
+    - reject : stage (str), rejected (list) -> None
+    - rejects : () -> dict
+    - finish : () -> None
+    - discard : () -> None
+    """
+
+    def __init__(self, path:str):
+        self.path = path
+        self.conn = None
+        self.run = None
+        self.lock = threading.RLock()
+
+    def open(self) -> None:
+        """ Open the journal and create its tables """
+        with self.lock:
+            if self.conn is not None: return
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=FULL')
+            with self.conn:
+                self.conn.execute('CREATE TABLE IF NOT EXISTS Runs (RunID INTEGER PRIMARY KEY AUTOINCREMENT, Signature TEXT, Started TEXT, Finished TEXT)')
+                self.conn.execute('CREATE TABLE IF NOT EXISTS Stages (RunID INTEGER, Stage TEXT, Finished TEXT, State BLOB, PRIMARY KEY (RunID, Stage))')
+                self.conn.execute('CREATE TABLE IF NOT EXISTS Progress (RunID INTEGER, Stage TEXT, Value TEXT, PRIMARY KEY (RunID, Stage))')
+                self.conn.execute('CREATE TABLE IF NOT EXISTS Rejects (RunID INTEGER, Stage TEXT, Record BLOB, Error TEXT)')
+
+    def close(self) -> None:
+        """ Close the journal """
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def signature(self, files:list) -> str:
+        """ Identify a set of reports by name, size and modification time, so a report moved to the backup folder still matches
+        ### Parameters
+        - files (list) : paths of the DRS reports
+        ### Returns
+        - str : signature of the reports
+        """
+        described = []
+        for file in files:
+            try:
+                stat = os.stat(file)
+                described.append([os.path.basename(file), stat.st_size, int(stat.st_mtime)])
+            except OSError:
+                described.append([os.path.basename(file), None, None])
+        return json.dumps(described)
+
+    def pending(self, files:list) -> int:
+        """ Find an unfinished run over the same reports
+        ### Parameters
+        - files (list) : paths of the DRS reports
+        ### Returns
+        - int : RunID of the unfinished run, or None
+        """
+        self.open()
+        with self.lock:
+            row = self.conn.execute('SELECT RunID FROM Runs WHERE Signature = ? AND Finished IS NULL ORDER BY RunID DESC LIMIT 1', (self.signature(files),)).fetchone()
+            return row[0] if row else None
+
+    def begin(self, files:list, resume:bool=True) -> bool:
+        """ Resume the unfinished run over the same reports, or start a new run
+        ### Parameters
+        - files (list) : paths of the DRS reports
+        - resume (bool) : resume an unfinished run if there is one (default=True)
+        ### Returns
+        - bool : True if a run is resumed
+        """
+        self.open()
+        with self.lock:
+            self.run = self.pending(files) if resume else None
+            if self.run is not None: return True
+            with self.conn:
+                self.run = self.conn.execute('INSERT INTO Runs (Signature, Started) VALUES (?, ?)', (self.signature(files), datetime.now().isoformat())).lastrowid
+            return False
+
+    def done(self) -> set:
+        """ List the stages the current run has completed
+        ### Returns
+        - set : names of the stages
+        """
+        if self.run is None: return set()
+        with self.lock:
+            return { row[0] for row in self.conn.execute('SELECT Stage FROM Stages WHERE RunID = ?', (self.run,)) }
+
+    def stageDone(self, stage:str, state:dict=None) -> None:
+        """ Record that a stage completed, with the state of the pipeline after it
+        ### Parameters
+        - stage (str) : name of the stage
+        - state (dict) : state to restore when resuming after this stage (default=None)
+        """
+        if self.run is None: return
+        blob = None if state is None else pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO Stages (RunID, Stage, Finished, State) VALUES (?, ?, ?, ?)', (self.run, stage, datetime.now().isoformat(), blob))
+
+    def state(self) -> dict:
+        """ Read the state saved by the last stage that completed
+        ### Returns
+        - dict : state of the pipeline, or None if no stage saved one
+        """
+        if self.run is None: return None
+        with self.lock:
+            row = self.conn.execute('SELECT State FROM Stages WHERE RunID = ? AND State IS NOT NULL ORDER BY rowid DESC LIMIT 1', (self.run,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def progress(self, stage:str, default=None):
+        """ Read how far a chunked stage got
+        ### Parameters
+        - stage (str) : name of the stage
+        - default (Any) : returned if nothing was committed yet (default=None)
+        ### Returns
+        - Any : last value recorded with advance
+        """
+        if self.run is None: return default
+        with self.lock:
+            row = self.conn.execute('SELECT Value FROM Progress WHERE RunID = ? AND Stage = ?', (self.run, stage)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def advance(self, stage:str, value) -> None:
+        """ Record how far a chunked stage got, right after a chunk was committed on the MS Server
+        ### Parameters
+        - stage (str) : name of the stage
+        - value (Any) : rows written or last key committed
+        """
+        if self.run is None: return
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO Progress (RunID, Stage, Value) VALUES (?, ?, ?)', (self.run, stage, json.dumps(value)))
+
+    def reject(self, stage:str, rejected:list) -> None:
+        """ Record the rows the MS Server rejected in a chunked stage. This is called before the chunk is recorded with advance, so a resumed run still knows about rows it will not write again
+        ### Parameters
+        - stage (str) : name of the stage
+        - rejected (list) : (record, error) tuples
+        """
+        if self.run is None or not rejected: return
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT INTO Rejects (RunID, Stage, Record, Error) VALUES (?, ?, ?, ?)', [(self.run, stage, pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL), str(error)) for record, error in rejected])
+
+    def rejects(self) -> dict:
+        """ Read the rows the MS Server rejected in the current run
+        ### Returns
+        - dict : stage -> list of (record, error) tuples; the error is its message
+        """
+        if self.run is None: return {}
+        rejected = {}
+        with self.lock:
+            rows = self.conn.execute('SELECT Stage, Record, Error FROM Rejects WHERE RunID = ? ORDER BY rowid', (self.run,)).fetchall()
+        for stage, record, error in rows:
+            rejected.setdefault(stage, []).append((pickle.loads(record), error))
+        return rejected
+
+    def finish(self) -> None:
+        """ Mark the current run as finished and drop its saved states """
+        if self.run is None: return
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE Runs SET Finished = ? WHERE RunID = ?', (datetime.now().isoformat(), self.run))
+            self.conn.execute('UPDATE Stages SET State = NULL WHERE RunID = ?', (self.run,))
+            self.conn.execute('DELETE FROM Rejects WHERE RunID = ?', (self.run,))
+        self.run = None
+
+    def discard(self) -> None:
+        """ Give up on the unfinished runs so the next run starts over """
+        self.open()
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE Runs SET Finished = ? WHERE Finished IS NULL', (datetime.now().isoformat(),))
+            self.conn.execute('UPDATE Stages SET State = NULL WHERE RunID IN (SELECT RunID FROM Runs WHERE Finished IS NOT NULL)')
+            self.conn.execute('DELETE FROM Rejects WHERE RunID IN (SELECT RunID FROM Runs WHERE Finished IS NOT NULL)')
+        self.run = None
@@ -1,23 +1,234 @@
-import os
+from __future__ import annotations
+
+import os, atexit, threading, multiprocessing
+from queue import Queue, Full, Empty
 from datetime import datetime
 
 path = os.getcwd()
 logFile = None
+writer = None   # LOG WRITER SHARED BY ALL LOGGERS IN THIS PROCESS
+collector = None    # LOG-COLLECTOR QUEUE OF THE PARENT PROCESS, IN A WORKER PROCESS
+
+class LogWriter:
+    """ This class writes log entries from a background thread. Entries are queued with their target file, kept in a bounded queue, and written in batches through one open handle per file. Worker processes send their entries through the log-collector queue, which a second thread hands to onEntries.
+    ## Methods (10)
+    - start : () -> None
+    - write : file (str), entry (str) -> None
+    - remove : file (str) -> None
+    - flush : timeout (float) -> bool
+    - close : () -> None
+    - run : () -> None
+    - sync : () -> None
+    - collect : onEntries (function) -> Queue
+    - drain : () -> None
+    - settle : batches (int), timeout (float) -> bool
+    """
+
+    maxEntries = 10000  # QUEUED ENTRIES BEFORE LOGGING BLOCKS THE CALLER
+    interval = 0.5      # SECONDS BETWEEN FLUSHES TO DISK
+    batchSize = 1000    # ENTRIES WRITTEN BETWEEN TWO LOOKS AT THE QUEUE, AND SENT AT ONCE BY A WORKER PROCESS
+
+    def __init__(self, onError=None):
+        """
+        ### Parameters
+        - onError (function) : called with the OSError if a log file cannot be written (default=None)
+        """
+        self.queue = Queue(self.maxEntries)
+        self.files = {}
+        self.onError = onError
+        self.thread = None
+        self.pid = os.getpid()
+        self.collector = None
+        self.collectorThread = None
+        self.onEntries = None
+        self.received = 0   # BATCHES HANDED ON BY THE COLLECTOR THREAD
+        self.arrived = threading.Condition()
+
+    def start(self) -> None:
+        """ Start the flusher thread if it is not running """
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, name='LogWriter', daemon=True)
+            self.thread.start()
+
+    def write(self, file:str, entry:str) -> None:
+        """ Queue a line for a log file
+        ### Parameters
+        - file (str) : path of the log file
+        - entry (str) : line to write, including the line ending
+        """
+        if threading.current_thread() is self.thread:
+            # ERRORS LOGGED WHILE WRITING MUST NOT WAIT ON THE QUEUE THIS THREAD DRAINS
+            try: self.queue.put_nowait(('write', file, entry))
+            except Full: pass
+            return
+        self.start()
+        self.queue.put(('write', file, entry))
+
+    def remove(self, file:str) -> None:
+        """ Delete a log file once all entries queued before this call are written
+        ### Parameters
+        - file (str) : path of the log file
+        """
+        self.start()
+        self.queue.put(('remove', file, None))
+
+    def flush(self, timeout:float=None) -> bool:
+        """ Wait until all entries queued before this call are on disk
+        ### Parameters
+        - timeout (float) : seconds to wait (default=None, wait for ever)
+        ### Returns
+        - bool : True if everything was written in time
+        """
+        if self.thread is None or not self.thread.is_alive(): return True
+        done = threading.Event()
+        try:
+            self.queue.put(('flush', None, done), timeout=timeout)
+        except Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self) -> None:
+        """ Hand on the entries of the worker processes, write all queued entries, stop the flusher and collector threads and close the files """
+        if self.collectorThread is not None and self.collectorThread.is_alive():
+            self.collector.put(None)
+            self.collectorThread.join()
+        self.collectorThread = None
+        if self.thread is not None and self.thread.is_alive():
+            self.queue.put(('close', None, None))
+            self.thread.join()
+        self.thread = None
+
+    def run(self) -> None:
+        """ Body of the flusher thread """
+        while True:
+            try:
+                commands = [self.queue.get(timeout=self.interval)]
+                while len(commands) < self.batchSize and not self.queue.empty():
+                    commands.append(self.queue.get_nowait())
+            except Empty:
+                commands = []
+
+            for command, file, arg in commands:
+                try:
+                    if command == 'write':
+                        handle = self.files.get(file)
+                        if handle is None: handle = self.files[file] = open(file, 'a', encoding='utf8')
+                        handle.write(arg)
+                    elif command == 'remove':
+                        handle = self.files.pop(file, None)
+                        if handle is not None: handle.close()
+                        if os.path.isfile(file): os.remove(file)
+                    elif command == 'flush':
+                        self.sync()
+                        arg.set()
+                    elif command == 'close':
+                        self.sync()
+                        for handle in self.files.values(): handle.close()
+                        self.files = {}
+                        return
+                except OSError as error:
+                    self.files.pop(file, None)
+                    if self.onError is not None: self.onError(error)
+
+            # FLUSH ONCE THE QUEUE RUNS DRY SO ENTRIES REACH DISK IN BATCHES
+            if self.queue.empty(): self.sync()
+
+    def sync(self) -> None:
+        """ Flush the open handles to disk """
+        for file, handle in list(self.files.items()):
+            try:
+                handle.flush()
+            except OSError as error:
+                self.files.pop(file, None)
+                if self.onError is not None: self.onError(error)
+
+    def collect(self, onEntries=None):
+        """ Open the log-collector queue. Worker processes receive it when their pool starts and send batches of (kind, origin, time stamp, entry) tuples through it
+        ### Parameters
+        - onEntries (function) : called in the collector thread with each batch (default=None, keep the current one)
+        ### Returns
+        - Queue : the log-collector queue
+        """
+        if onEntries is not None: self.onEntries = onEntries
+        if self.collector is None:
+            self.collector = multiprocessing.Queue(self.maxEntries // self.batchSize)
+        if self.collectorThread is None or not self.collectorThread.is_alive():
+            self.collectorThread = threading.Thread(target=self.drain, name='LogCollector', daemon=True)
+            self.collectorThread.start()
+        return self.collector
+
+    def drain(self) -> None:
+        """ Body of the collector thread """
+        while True:
+            batch = self.collector.get()
+            if batch is None: return
+            try:
+                if self.onEntries is not None: self.onEntries(batch)
+            except OSError as error:
+                if self.onError is not None: self.onError(error)
+            finally:
+                with self.arrived:
+                    self.received += 1
+                    self.arrived.notify_all()
+
+    def settle(self, batches:int, timeout:float=None) -> bool:
+        """ Wait until the collector thread has handed on a number of batches since the queue was opened
+        ### Parameters
+        - batches (int) : batches in total
+        - timeout (float) : seconds to wait (default=None, wait for ever)
+        ### Returns
+        - bool : True if the batches arrived in time
+        """
+        with self.arrived:
+            return self.arrived.wait_for(lambda: self.received >= batches, timeout)
+
+def timestamp() -> str:
+    """ Stamp an entry with the time it is logged at
+    ### Returns
+    - str : hours, minutes, seconds and microseconds
+    """
+    return datetime.now().strftime("%H:%M:%S.%f")
+
+def setCollector(queue) -> None:
+    """ Keep the log-collector queue of the parent process in a worker process; called when the pool starts
+    ### Parameters
+    - queue (Queue) : log-collector queue
+    """
+    global collector
+    collector = queue
+
+def getWriter() -> LogWriter:
+    """ Get the log writer of this process, starting one if needed. Forked worker processes start their own writer
+    ### Returns
+    - LogWriter : shared log writer
+    """
+    global writer
+    if writer is None or writer.pid != os.getpid():
+        writer = LogWriter()
+        atexit.register(writer.close)
+    return writer
 
 class Logger:
     """ This class controls logging messages and writing them to file.
-    ## Methods (11)
+    ## Methods (18)
     - outputToConsole : outputToConsole (function) -> None
     - setErrorHandler : errorHandler (ErrorHandler) -> None
     - shouldWeLog : log (bool) -> None
     - setLogStartTime : start (datetime) -> None
     - setLog : file (str) -> None
     - setErrorLog : file (str) -> None
+    - route : origin (str) -> tuple
     - startSystemLog : file (str) -> None
     - logToSystemLog : entry (str) -> None
+    - logSlowQuery : entry (str) -> None
     - newLog : logFile (str) -> None
-    - log : entry (str) -> None
-    - logError : entry (str) -> None
+    - log : entry (str), origin (str) -> None
+    - logError : entry (str), origin (str) -> None
+    - collect : () -> Queue
+    - replay : entries (list), origin (str) -> None
+    - write : file (str), entry (str), stamp (str) -> None
+    - flush : () -> None
+    - reportError : error (OSError) -> None
     """
 
     def __init__(self):
@@ -29,6 +240,9 @@ class Logger:
         self.errorLog = None
         self.errCounter = 0      # ERROR COUNTER
         self.logPath = os.path.join(os.getcwd(), 'logs')
+        self.routes = {}         # ORIGIN -> (LOG FILE, ERROR LOG)
+        self.writer = getWriter()
+        self.writer.onError = self.reportError
 
     def outputToConsole(self, outputToConsole:function) -> None:
         """ Assign the outputToConsole method to this class 
@@ -49,8 +263,8 @@ class Logger:
         ### Parameters
         - log (bool) : to log (true) or not (false)
         """
+        self.logging = log
         if log: 
-            self.logging = True
             self.logToSystemLog(f'You will have a log for each DRS report')
         else:
             self.logToSystemLog(f'You will not have a log for each DRS report')
@@ -63,20 +277,32 @@ class Logger:
         self.start = start
 
     def setLog(self, file:str) -> None:
-        """ Method that starts a log file and sets it at default on the class
+        """ Method that sets the default log file on the class
         ### Parameters
-        - file (str) : file name for the log
+        - file (str) : report or origin the log belongs to
         """
-        file = file.split("\\")[-1]
-        self.errorLog = os.path.join(self.logPath, f'{file}.log')
+        self.logFile = self.route(file)[0]
 
     def setErrorLog(self, file:str):
-        """ Method that starts an error log file and sets it at default on the class
+        """ Method that sets the default error log file on the class
         ### Parameters
-        - file (str) : file name for the error log
+        - file (str) : report or origin the error log belongs to
         """
-        file = file.split("\\")[-1]
-        self.errorLog = os.path.join(self.logPath, f'{file}.error')
+        self.errorLog = self.route(file)[1]
+
+    def route(self, origin:str) -> tuple:
+        """ Find the log files of a DRS report. Paths are cached per origin so entries can name their report on every call
+        ### Parameters
+        - origin (str) : path of the report, or its file name without extension as kept in item['Origin']
+        ### Returns
+        - tuple : paths of the .log- and .errors-file
+        """
+        files = self.routes.get(origin)
+        if files is None:
+            name = os.path.splitext(origin.replace('\\', '/').split('/')[-1])[0]
+            if not os.path.isdir(self.logPath): os.makedirs(self.logPath, exist_ok=True)
+            files = self.routes[origin] = (os.path.join(self.logPath, f'{name}.log'), os.path.join(self.logPath, f'{name}.errors'))
+        return files
 
     def startSystemLog(self, file:str) -> None:
         """ Method that starts a system log file and sets it at default on the class
@@ -91,7 +317,7 @@ class Logger:
             self.systemLogFile = os.path.join(self.logPath, file)
     
             # Delete optional old log file with same name if exists
-            if os.path.isfile(self.systemLogFile): os.remove(self.systemLogFile)
+            self.writer.remove(self.systemLogFile)
     
             self.logToSystemLog(f'Program started ({self.start.strftime("%A, %d. %B %Y %I:%M%p")})')
             self.logToSystemLog(f'System log generated ({datetime.now().strftime("%A, %d. %B %Y %I:%M%p")})')
@@ -105,12 +331,15 @@ class Logger:
         - entry (str) : entry for the system log
         """
         if self.systemLogFile is not None:
-            try:
-                file = open(self.systemLogFile, "a", encoding="utf8")
-                file.write(datetime.now().strftime("%H:%M:%S.%f") + '\t' + entry + '\n')
-                file.close()
-            except OSError as error:
-                self.errorHandler.handle(error)
+            self.write(self.systemLogFile, entry)
+
+    def logSlowQuery(self, entry) -> None:
+        """ Method that logs a statement that took longer than the threshold of the tracer to slowQueries.log
+        ### Parameters
+        - entry (str) : entry for the slow-query log
+        """
+        if not os.path.isdir(self.logPath): os.makedirs(self.logPath, exist_ok=True)
+        self.write(os.path.join(self.logPath, 'slowQueries.log'), entry)
 
     def newLog(self, logFile:str) -> None:
         """ Start .log- and .errors-files for each DRS report to be processed.
@@ -122,39 +351,68 @@ class Logger:
 
         # Check folder for write access
         if os.access(self.logPath, os.W_OK):
-            extension = '.' + logFile.split('.')[1]
-            log = logFile.split('/')[-1].replace(extension, '.log')
-            err = logFile.split('/')[-1].replace(extension, '.errors')
-            
-            self.logFile = os.path.join(self.logPath, log)
-            self.errorLog = os.path.join(self.logPath, err)
-            
-            if os.path.isfile(self.logFile): os.remove(self.logFile)
+            self.logFile, self.errorLog = self.route(logFile)
+            self.writer.remove(self.logFile)
         else:
             self.logFile = None
 
-    def log(self, entry:str) -> None:
+    def log(self, entry:str, origin:str=None) -> None:
         """ Log a new entry to the log file
         ### Parameters
         - entry (str) : entry for the log file
+        - origin (str) : report the entry belongs to; entries with an origin are only written when logging is enabled (default=None, the current log file)
         """
-        if self.logFile is not None:
-            try:
-                file = open(self.logFile, "a", encoding="utf8")
-                file.write(datetime.now().strftime("%H:%M:%S.%f") + '\t' + entry + '\n')
-                file.close()
-            except OSError as error:
-                return self.errorHandler.handle(error)
+        if origin is not None:
+            if self.logging: self.write(self.route(origin)[0], entry)
+        elif self.logFile is not None:
+            self.write(self.logFile, entry)
 
-    def logError(self, entry:str) -> None:
+    def logError(self, entry:str, origin:str=None) -> None:
         """ Log a new error to the log file
         ### Parameters
         - entry (str) : entry for the log file
+        - origin (str) : report the error belongs to (default=None, the current error log)
         """
-        if self.errorLog is not None:
-            try: 
-                file = open(self.errorLog, "a", encoding="utf8")
-                file.write(datetime.now().strftime("%H:%M:%S.%f") + '\t' + entry + '\n')
-                file.close()
-            except OSError as error:
-                return self.errorHandler.handle(error)
\ No newline at end of file
+        if origin is not None:
+            self.write(self.route(origin)[1], entry)
+        elif self.errorLog is not None:
+            self.write(self.errorLog, entry)
+
+    def collect(self):
+        """ Open the log-collector queue of the background writer and route the entries of the worker processes through this logger
+        ### Returns
+        - Queue : the log-collector queue
+        """
+        return self.writer.collect(self.replay)
+
+    def replay(self, entries:list, origin:str=None) -> None:
+        """ Write the entries sent by an EntryLog in a worker process with the time they were logged at
+        ### Parameters
+        - entries (list) : (kind, origin, time stamp, entry) tuples; kind is log or error
+        - origin (str) : report for entries logged without an origin (default=None)
+        """
+        for kind, entryOrigin, stamp, entry in entries:
+            files = self.route(entryOrigin or origin)
+            if kind == 'error': self.write(files[1], entry, stamp)
+            elif self.logging: self.write(files[0], entry, stamp)
+
+    def write(self, file:str, entry:str, stamp:str=None) -> None:
+        """ Queue a time stamped entry for a log file on the background writer
+        ### Parameters
+        - file (str) : path of the log file
+        - entry (str) : entry for the log file
+        - stamp (str) : time the entry was logged at (default=None, now)
+        """
+        self.writer.write(file, (stamp or timestamp()) + '\t' + entry + '\n')
+
+    def flush(self) -> None:
+        """ Wait until all queued entries are written to the log files """
+        self.writer.flush()
+
+    def reportError(self, error:OSError) -> None:
+        """ Hand errors of the background writer to the errorHandler
+        ### Parameters
+        - error (OSError) : error raised while writing a log file
+        """
+        if hasattr(self, 'errorHandler'): self.errorHandler.handle(error)
+        else: print(error)
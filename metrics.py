@@ -0,0 +1,222 @@
+try:
+    import os, sys, json, time, threading
+    from contextlib import contextmanager
+    from datetime import datetime
+except ImportError as error:
+    print(error)
+
+# PEAK RSS COMES FROM RESOURCE ON UNIX AND FROM PSUTIL, IF INSTALLED, ON WINDOWS
+try:
+    import resource
+except ImportError:
+    resource = None
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+def peakRSS() -> int:
+    """ Read the high-water mark of the resident memory of this process
+    ### Returns
+    - int : bytes, or None if neither resource nor psutil is available
+    """
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KILOBYTES ON LINUX, BYTES ON MACOS
+        return peak if sys.platform == 'darwin' else peak * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss)
+    return None
+
+def payload(rows) -> int:
+    """ Estimate how many bytes a batch of rows takes on the wire: the length of strings and bytes, 8 bytes for any other value
+    ### Parameters
+    - rows (list) : tuples or dictionaries with the values of each row
+    ### Returns
+    - int : estimated bytes
+    """
+    size = 0
+    for row in rows:
+        if isinstance(row, dict): row = row.values()
+        elif not isinstance(row, (tuple, list)): row = (row,)
+        size += sum(len(v) if isinstance(v, (str, bytes)) else 8 for v in row)
+    return size
+
+class StageMetrics:
+    """ What one stage of a run did: how long it took, how many rows and bytes it moved, how many round trips it made to the MS Server and how much memory the process held """
+
+    def __init__(self, name:str):
+        """
+        ### Parameters
+        - name (str) : name of the stage
+        """
+        self.name = name
+        self.status = 'running'     # RUNNING, DONE OR FAILED
+        self.started = time.monotonic()
+        self.finished = None
+        self.rows = 0
+        self.bytes = 0
+        self.roundTrips = 0
+        self.peakRSS = None
+
+    @property
+    def seconds(self) -> float:
+        """ Wall time of the stage so far """
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def rowsPerSecond(self) -> float:
+        """ Throughput of the stage, or None if it took no measurable time """
+        return self.rows / self.seconds if self.seconds > 0 else None
+
+    def asDict(self, origin:float=None) -> dict:
+        """ Describe the stage for the run report
+        ### Parameters
+        - origin (float) : monotonic time the run started, to give the start of the stage as an offset (default=None)
+        ### Returns
+        - dict : name, status, start offset, seconds, rows, rows/s, bytes, round trips and peak RSS
+        """
+        return {
+            'name' : self.name,
+            'status' : self.status,
+            'start' : None if origin is None else round(self.started - origin, 3),
+            'seconds' : round(self.seconds, 3),
+            'rows' : self.rows,
+            'rowsPerSecond' : None if self.rowsPerSecond is None else round(self.rowsPerSecond, 1),
+            'bytes' : self.bytes,
+            'roundTrips' : self.roundTrips,
+            'peakRSS' : self.peakRSS,
+        }
+
+class Metrics:
+    """ This class instruments the stages of a run. A stage is measured while it runs in a thread; whatever DB and Pipeline count in that thread is added to it, so stages that run side by side are kept apart. The measurements are written to a JSON run report.
+    ## Methods (9)
+    - reset : () -> None
+    - stage : name (str) -> StageMetrics
+    - current : () -> StageMetrics
+    - add : field (str), n (int) -> None
+    - transfer : rows (list), trips (int), sent (int) -> None
+    - find : name (str) -> StageMetrics
+    - describe : name (str) -> str
+    - report : extra (Any) -> dict
+    - write : path (str), extra (Any) -> str
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        """ Forget the stages of the previous run """
+        with self.lock:
+            self.stages = []
+            self.started = time.monotonic()
+            self.startedAt = datetime.now()
+
+    @contextmanager
+    def stage(self, name:str):
+        """ Measure the stage that runs in this thread until the block ends. A stage that raises, or that sets its status to failed, is reported as failed
+        ### Parameters
+        - name (str) : name of the stage
+        ### Returns
+        - StageMetrics : record of the stage
+        """
+        record = StageMetrics(name)
+        with self.lock:
+            self.stages.append(record)
+        stack = self.local.__dict__.setdefault('stack', [])
+        stack.append(record)
+        try:
+            yield record
+            if record.status == 'running': record.status = 'done'
+        except BaseException:
+            record.status = 'failed'
+            raise
+        finally:
+            record.finished = time.monotonic()
+            record.peakRSS = peakRSS()
+            stack.pop()
+
+    def current(self) -> StageMetrics:
+        """ Find the innermost stage measured in this thread
+        ### Returns
+        - StageMetrics : record of the stage, or None outside of a stage
+        """
+        stack = getattr(self.local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def add(self, field:str, n:int) -> None:
+        """ Count towards the stage measured in this thread; outside of a stage nothing is counted
+        ### Parameters
+        - field (str) : rows, bytes or roundTrips
+        - n (int) : amount to add
+        """
+        record = self.current()
+        if record is not None: setattr(record, field, getattr(record, field) + n)
+
+    def transfer(self, rows:list=(), trips:int=0, sent:int=0) -> None:
+        """ Count rows received from the MS Server, the bytes of a statement sent to it and its round trips
+        ### Parameters
+        - rows (list) : rows received (default=())
+        - trips (int) : round trips made (default=0)
+        - sent (int) : bytes sent (default=0)
+        """
+        record = self.current()
+        if record is None: return
+        record.bytes += sent + (payload(rows) if rows else 0)
+        record.roundTrips += trips
+
+    def find(self, name:str) -> StageMetrics:
+        """ Find the last measurement of a stage
+        ### Parameters
+        - name (str) : name of the stage
+        ### Returns
+        - StageMetrics : record of the stage, or None if it was not measured
+        """
+        with self.lock:
+            return next((s for s in reversed(self.stages) if s.name == name), None)
+
+    def describe(self, name:str) -> str:
+        """ Summarise a stage in one line for the console and the system log
+        ### Parameters
+        - name (str) : name of the stage
+        ### Returns
+        - str : rows, rows/s, bytes, round trips and peak RSS, or an empty string if the stage was not measured
+        """
+        record = self.find(name)
+        if record is None: return ''
+        rate = '' if record.rowsPerSecond is None else f' ({record.rowsPerSecond:,.0f} rows/s)'
+        rss = '' if record.peakRSS is None else f', peak RSS {record.peakRSS / 2**20:,.0f} MB'
+        return f'{record.rows:,} rows{rate}, {record.bytes / 2**20:,.1f} MB, {record.roundTrips:,} round trips{rss}'
+
+    def report(self, **extra) -> dict:
+        """ Collect the measurements of the run
+        ### Parameters
+        - extra (Any) : further fields of the report, such as the summary of the pipeline
+        ### Returns
+        - dict : start, wall time, peak RSS and the measurements of every stage
+        """
+        with self.lock:
+            stages = [s.asDict(self.started) for s in self.stages]
+        return {
+            'started' : self.startedAt.isoformat(timespec='seconds'),
+            'seconds' : round(time.monotonic() - self.started, 3),
+            'peakRSS' : peakRSS(),
+            'stages' : stages,
+            **extra,
+        }
+
+    def write(self, path:str, **extra) -> str:
+        """ Write the run report as JSON
+        ### Parameters
+        - path (str) : file to write; a folder gets a file named after the start of the run
+        - extra (Any) : further fields of the report
+        ### Returns
+        - str : path of the report
+        """
+        if os.path.isdir(path): path = os.path.join(path, f'run_{self.startedAt.strftime("%Y%m%d_%H%M%S")}.json')
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(**extra), f, indent=2, default=str)
+        return path
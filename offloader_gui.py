@@ -1,11 +1,13 @@
+from __future__ import annotations
+
 try:
     import os, json, asyncio, multiprocessing, sys, random, time
     
     from multiprocessing.pool import ThreadPool
     from multiprocessing import Queue, Process
     from multiprocessing.queues import Empty
-    from thread import ThreadedTask
-    from threading import Thread
+    from queue import SimpleQueue
+    from threading import Thread, current_thread, main_thread
     
     from tkinter import simpledialog, filedialog, messagebox, END, Tk, StringVar, BooleanVar, Label, LabelFrame, Checkbutton, Button, Entry, NORMAL, DISABLED, Scrollbar, Text, HORIZONTAL, BOTH, X, Y, LEFT, RIGHT, TOP, Frame, ttk, DoubleVar
     from tkinter.ttk import Progressbar
@@ -19,118 +21,49 @@ try:
     from errorHandler import ErrorHandler
     from backup import Backup
     from logger import Logger
+    from workers import WorkerPool
+    from scheduler import Scheduler
+    from pipeline import Pipeline
+    from journal import Journal
+    from metrics import Metrics
+    from tracer import Tracer
 
 except ImportError as error:
     print(error)
 
-def updateItem(Q:Queue, PP:Queue, items:list, mmids:list, mtids:list, mmidsonly:list, mtidsonly:list) -> None:
+def formatDuration(seconds:float) -> str:
     """
-    Updates a single item in items based on mmids and mtids
+    Format a duration for the progress bar
 
     Args:
-        Q (Queue): Queue to be updated
-        PP (Queue): Temporary queue
-        items (list): all items to be processed
-        mmids (list): mmids and other data
-        mtids (list): mtids and other data
-        mmidsonly (list): only mmids
-        mtidsonly (list): only mtids
-    """    
-    problemRecs = []
-    i = 0
-    while i < len(items):
-        try:
-            item = items[i]
-            PP.put([item["RenditionNumber"], item["Origin"]])
-            if item["RenditionNumber"] in mmidsonly:
-                idx = mmidsonly.index(item["RenditionNumber"])
-                item.update(mmids[idx])
-                if item["Format"] in mtidsonly:
-                    idx = mtidsonly.index(item["Format"])
-                    item.update(mtids[idx])
-                else:
-                    problemRecs.append(items.pop(i))
-            else:
-                problemRecs.append(items.pop(i))
-            i += 1
-        except:
-            problemRecs.append(items.pop(i))
-    Q.put([items, problemRecs])
+        seconds (float): duration in seconds
 
-def updateFileID(Q:Queue, PP:Queue, items:list, iids:list, iidsonly:list) -> None:
-    """
-    Update the fileID for each item
-
-    Args:
-        Q (Queue): Queue to be updated
-        PP (Queue): Temporary queue
-        items (list): all items to be processed
-        iids (list): iids and other data
-        iidsonly (list): iids only
-    """    
-    problemRecs = []
-    i = 0
-    while i < len(items):
-        try:
-            item = items[i]
-            PP.put([item["RenditionNumber"], item["Origin"]])
-            if item["RenditionID"] in iidsonly:
-                idx = iidsonly.index(item["RenditionID"])
-                item.update(iids[idx])
-            else:
-                problemRecs.append(items.pop(i))
-        except:
-            problemRecs.append(items.pop(i))
-        i += 1
-    Q.put([items, problemRecs])
-
-def verifyItem(Q:Queue, PP:Queue, items:list, mmidsonly:list) -> None:
+    Returns:
+        str: M:SS, or H:MM:SS from an hour on
     """
-    Join up each item and double-check the rendition numbers and file ids match up
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02d}:{seconds:02d}' if hours else f'{minutes}:{seconds:02d}'
 
-    Args:
-        Q (Queue): Queue to be updated
-        PP (Queue): Temporary queue
-        items (list): all items to be processed
-        mmidsonly (list): mmidsonly
-    """
-    problemRecs = []
-    i = 0
-    while i < len(items):
-        try:
-            item = items[i]
-            PP.put([item["RenditionNumber"], item["Origin"]])
-            mmidx = mmidsonly["RenditionNumbers"].index(item["RenditionNumber"])
-            fidx = mmidsonly["PrimaryFileIDs"][mmidx]
-            if fidx != item["FileID"]:
-                problemRecs.append(items.pop(i))
-        except OSError as error:
-            print(error)
-            problemRecs.append(items.pop(i))
-        i += 1
-    Q.put([items, problemRecs])
-
-def calcProcessTime(starttime:int, cur_iter:int, max_iter:int) -> tuple:
+def calcProcessTime(starttime:float, cur_iter:int, max_iter:int) -> tuple:
     """
-    Not implemented. Purpose is to calculate overall processing time.
+    Estimate how long an operation has left from the rate it has made progress at so far
 
     Args:
-        starttime (int): the time of starting the operation
-        cur_iter (int): the current interation
+        starttime (float): the time of starting the operation, as returned by time.time()
+        cur_iter (int): the current iteration
         max_iter (int): the maximum number of iterations
 
     Returns:
-        tuple: three values: how much time elapsed, how much left and estimated time to completion.
+        tuple: three values: how much time elapsed, how much is left and the estimated time of completion. The last two are None until the first iteration is done.
     """
     telapsed = time.time() - starttime
-    testimated = (telapsed/cur_iter)*(max_iter)
-    elapsed = datetime.fromtimestamp(telapsed).strftime("%M:%S")
-
-    lefttime = testimated-telapsed  # in seconds
-    left = datetime.fromtimestamp(lefttime).strftime("%M:%S")
+    elapsed = formatDuration(telapsed)
+    if cur_iter <= 0: return (elapsed, None, None)
 
-    finishtime = starttime + testimated
-    finishtime = datetime.fromtimestamp(finishtime).strftime("%H:%M:%S")  # in time
+    testimated = (telapsed/cur_iter)*(max_iter)
+    left = formatDuration(max(testimated-telapsed, 0))   # in seconds
+    finishtime = datetime.fromtimestamp(starttime + testimated).strftime("%H:%M:%S")  # in time
 
     return (elapsed, left, finishtime)
 
@@ -162,10 +95,14 @@ class GUIConverter(Tk):
         # self.connectionVerified = False
         self.verbosity = False
         self.busy = False
+        self.connection = False
+        self.resume = False         # CONTINUE THE UNFINISHED RUN RECORDED IN THE JOURNAL
         self.items = []
         self.cpuCount = multiprocessing.cpu_count()
+        self.workers = WorkerPool(self.cpuCount)
         self.newRecords = []
         self.pBarSteps = 100
+        self.pBarStart = time.time()    # START OF THE OPERATION THE PROGRESS BAR FOLLOWS, FOR THE ETA
         self.Q1 = Queue()
         self.Q2 = Queue()
         self.Q1Result = False
@@ -173,8 +110,10 @@ class GUIConverter(Tk):
         self.Q1Func = None
         self.Q2Func = None
         self.problemRecs = []
-        self.Queues = []
-        self.Qs = []
+        self.events = SimpleQueue()     # CALLBACKS FROM STAGE THREADS TO RUN ON THE TK THREAD
+        self.scheduler = None
+        self.pollInterval = 50          # MILLISECONDS BETWEEN TWO DRAINS OF THE EVENTS QUEUE
+        self.after(self.pollInterval, self.runEvents)
         # self.Ps = []
 
         """ DEFINE KEY VARIABLES """
@@ -189,6 +128,8 @@ class GUIConverter(Tk):
         self.flags['tFlag'] = BooleanVar()
         self.flags['hFlag'] = BooleanVar()
         self.flags['mFlag'] = BooleanVar()
+        self.flags['fFlag'] = BooleanVar()
+        self.flags['sFlag'] = BooleanVar()
 
         """ INITIALIZE DEPENDENCIES """
         self.settings = Settings()
@@ -196,24 +137,29 @@ class GUIConverter(Tk):
         self.errorHandler = ErrorHandler()
         self.extractor = Extractor()
         self.backup = Backup()
+        self.pipeline = Pipeline()
+        self.journal = Journal(os.path.join(os.getcwd(), 'offloader.journal'))
+        self.metrics = Metrics()
+        self.tracer = Tracer()
         
         self.DB = DB()
         self.DB.askQuestion(self.askQuestion)
-        self.DB.notifyUser(self.notify)
-        self.DB.verification(self.verifyConnection)
+        self.DB.notifyUser(self.onTkThread(self.notify))
+        self.DB.verification(self.onTkThread(self.verifyConnection))
         # self.DB.beginUpdate(self.batchUpdate)
 
         """ CONFIGURE DEPENDENCIES """
         self.preferences = self.settings.loadSettings()
         
         self.logger.setErrorHandler(self.errorHandler)
-        self.logger.outputToConsole(self.outputToConsole)
+        self.logger.outputToConsole(self.onTkThread(self.outputToConsole))
         
         self.errorHandler.setLogger(self.logger)
+        self.tracer.setLogger(self.logger)
         
         self.extractor.setLogger(self.logger)
         self.extractor.setErrorHandler(self.errorHandler)
-        self.extractor.outputToConsole(self.outputToConsole)
+        self.extractor.outputToConsole(self.onTkThread(self.outputToConsole))
 
         self.backup.setLogger(self.logger)
         self.backup.errorHandler(self.errorHandler)
@@ -236,7 +182,10 @@ class GUIConverter(Tk):
         self.flags['tFlag'].set(self.preferences['flags']['tFlag'])    # PUSH UPDATES TO TMS
         self.flags['hFlag'].set(self.preferences['flags']['hFlag'])    # PROCESS FILE WITH HEADER ROW
         self.flags['mFlag'].set(self.preferences['flags']['mFlag'])    # SUPPRESS ALL MESSAGES
+        self.flags['fFlag'].set(self.preferences['flags'].get('fFlag', False))    # FULLY REFRESH LOCAL TMS TABLES
+        self.flags['sFlag'].set(self.preferences['flags'].get('sFlag', False))    # MATCH RECORDS ON THE TMS SERVER
 
+        self.logger.shouldWeLog(self.flags['lFlag'].get())
         self.extractor.setHeader(self.flags['hFlag'].get())
         self.extractor.setBackup(self.flags['bFlag'].get())
         self.extractor.setBackupFile(self.backup)
@@ -248,7 +197,18 @@ class GUIConverter(Tk):
         self.DB.setUser(self.db['user'].get())
         self.DB.setScratchTable(self.db['scratchTable'].get())
         self.DB.setDBUpdate(self.flags['tFlag'].get())
-        self.DB.outputToConsole(self.updatePBar, self.outputToConsole)
+        self.DB.setSyncMode('full' if self.flags['fFlag'].get() else 'incremental')
+        self.DB.outputToConsole(self.onTkThread(self.updatePBar), self.onTkThread(self.outputToConsole))
+        self.DB.setJournal(self.journal)
+        self.DB.setMetrics(self.metrics)
+        self.DB.setTracer(self.tracer)
+        self.pipeline.setDB(self.DB)
+        self.pipeline.setExtractor(self.extractor)
+        self.pipeline.setLogger(self.logger)
+        self.pipeline.setWorkers(self.workers)
+        self.pipeline.setJournal(self.journal)
+        self.pipeline.setMetrics(self.metrics)
+        self.pipeline.outputToConsole(self.onTkThread(self.updatePBar), self.onTkThread(self.outputToConsole))
 
         """ BIND SHORTCUT TO EXIT BUTTON """
         self.focus_set()
@@ -309,6 +269,12 @@ class GUIConverter(Tk):
         self.SettingsLog = Checkbutton(self.SettingsLF, text="Verbose error logging", underline=0, variable=self.flags['eFlag'], command=self.verboseErrors)
         self.SettingsLog.pack(anchor='w')
 
+        self.SettingsRefresh = Checkbutton(self.SettingsLF, text="Fully refresh local TMS tables", underline=0, variable=self.flags['fFlag'], command=self.fullRefresh)
+        self.SettingsRefresh.pack(anchor='w')
+
+        self.SettingsServer = Checkbutton(self.SettingsLF, text="Match records on the TMS server", underline=0, variable=self.flags['sFlag'], command=self.serverMatching)
+        self.SettingsServer.pack(anchor='w')
+
         """ LABELFRAME FOR TMS SETTINGS """
         self.TMSSettingsLF = LabelFrame(self.Frame, text="3. ADJUST CONNECTION SETTINGS IF NECESSARY", padx=5, pady=5)
         self.TMSSettingsLF.pack(fill=BOTH, side=TOP)
@@ -436,19 +402,23 @@ class GUIConverter(Tk):
 
     def updatePBar(self, steps:int=None) -> None:
         """
-        Update the progress bar element
+        Update the progress bar element. Once steps have been counted, the bar shows the time left and the estimated time of completion.
 
         Args:
             steps (int, optional): how many steps out of 100 to update the progress bar. Defaults to None.
         """        
         if steps is None:
             self.progressBar.step()
-            self.style.configure('text.Horizontal.TProgressbar', text='{:g} %'.format(self.progressVar.get() * (100/self.pBarSteps)))
-            self.update()
+            percent = self.progressVar.get() * (100/self.pBarSteps)
+            elapsed, left, finish = calcProcessTime(self.pBarStart, self.progressVar.get(), self.pBarSteps)
+            eta = '' if left is None or percent >= 100 else f' – {left} left, done at {finish}'
+            self.style.configure('text.Horizontal.TProgressbar', text='{:g} %{}'.format(round(percent, 1), eta))
         elif steps == 0:
             self.progressBar['value'] = 0
+            self.style.configure('text.Horizontal.TProgressbar', text='0 %')
         else:
             self.pBarSteps = steps
+            self.pBarStart = time.time()
             self.progressBar.config(maximum=steps)
 
     def askQuestion(self, title:str, msg:str) -> bool:
@@ -521,7 +491,7 @@ class GUIConverter(Tk):
 
     def checkConnection(self) -> None:
         """
-        Set controls, check TinyDB is good and the connection to the TMS instance
+        Set controls, check the local store is good and the connection to the TMS instance
         """        
         self.toggleControls(self.Frame, DISABLED)
         self.toggleBindings('Control', ['o', 'p', 's', 'l', 'm', 'g', 'u', 'v', 'c'], False)
@@ -531,10 +501,19 @@ class GUIConverter(Tk):
 
         self.DB.checkTinyDB()
 
+        # AN UNFINISHED RUN OVER THE SAME REPORTS CAN PICK UP WHERE IT STOPPED
+        self.resume = False
+        if self.input and self.journal.pending(self.input) is not None:
+            self.resume = self.askQuestion('Resume', 'The last run over the selected reports did not finish. Do you want to resume it? Choose No to start over.')
+            if not self.resume: self.journal.discard()
+        self.DB.setResume(self.resume)
+
         self.outputToConsole('OFFLOADER: Verifying connection settings')
         self.updatePBar(5)
 
-        self.makeQueue(self.getRandInt(), self.DB.checkAccess, (password,))
+        self.scheduler = self.newScheduler()
+        self.scheduler.add('checkAccess', self.DB.checkAccess, args=(password,))
+        self.scheduler.run()
 
     def verifyConnection(self, verification:bool) -> None:
         """
@@ -590,6 +569,19 @@ class GUIConverter(Tk):
         self.errorHandler.setVerbosity(self.flags['eFlag'].get())
         self.logger.logToSystemLog('OFFLOADER: Verbose logging enabled') if self.flags['eFlag'].get() else self.logger.logToSystemLog('OFFLOADER: Verbose logging disabled')
     
+    def fullRefresh(self) -> None:
+        """
+        Download whole TMS tables instead of only the ranges changed since the last run
+        """
+        self.DB.setSyncMode('full' if self.flags['fFlag'].get() else 'incremental')
+        self.logger.logToSystemLog('OFFLOADER: Local TMS tables will be fully refreshed') if self.flags['fFlag'].get() else self.logger.logToSystemLog('OFFLOADER: Local TMS tables will be synchronised incrementally')
+
+    def serverMatching(self) -> None:
+        """
+        Match records on the TMS server instead of downloading MediaRenditions and MediaFormats
+        """
+        self.logger.logToSystemLog('OFFLOADER: Records will be matched on the TMS server') if self.flags['sFlag'].get() else self.logger.logToSystemLog('OFFLOADER: Records will be matched locally')
+
     def pushToTMS(self) -> None:
         """
         Should we try to push data to the TMS tables?
@@ -623,531 +615,116 @@ class GUIConverter(Tk):
         self.toggleBindings('Control', ['o', 'p', 's', 'l', 'm', 'g', 'u', 'v'], False)
         self.toggleBindings('Alt', ['c'], False)
 
-        for i in self.input:
-            if self.flags['lFlag'].get():
-                self.logger.newLog(i)
-            self.extractor.extract(i)
-            self.items.append(self.extractor.getItems())
-
-        if self.connection:
-            self.makeQueue(self.getRandInt(), self.DB.getMTIDs)
-            # self.setQ1(self.DB.getMTIDs)
-        else:
+        if not self.connection:
             self.outputToConsole('OFFLOADER: Connection not verified; exiting update process', False)
+            self.toggleControls(self.Frame, 'normal')
+            self.toggleBindings('Control', ['o', 'p', 's', 'l', 'm', 'g', 'u', 'v'])
+            return
+
+        self.workers.start()
+        self.tracer.reset()
+        self.pipeline.setInput(self.input)
+        self.pipeline.setFlags(self.flags['lFlag'].get(), self.flags['sFlag'].get(), self.resume)
+        self.scheduler = self.pipeline.build(self.newScheduler())
+        self.scheduler.run()
 
         # ENABLE ALL SHORT CUT BINDINGS
         self.toggleBindings('Control', ['o', 'p', 's', 'l', 'm', 'g', 'u', 'v'])
 
-    def updateItems(self) -> None:
+    def finishProcessing(self) -> None:
         """
-        Batch update self.items in memory with multiprocessing to speed up overall progress. Data is split and chunks assigned to different processes. Processes are queued and processed until all have been completed.
+        Finish up after processing is complete: 
+        - release toggle bindings
+        - update user
         """        
-        self.outputToConsole('>>>>>> BATCH UPDATING RECORDS <<<<<<', True)
-        items = [item for sublist in self.items for item in sublist]
-        
-        if len(items) > 100: self.outputToConsole('OFFLOADER: This might take a while...')
-
-        # begin = time.time()
-
-        allMMIDs = self.DB.getAllMMIDS()
-        allMTIDs = self.DB.getAllMTIDS()
-        MMIDsOnly = [id["RenditionNumber"] for id in allMMIDs]
-        MTIDsOnly = [id["Format"] for id in allMTIDs]
-
-        loadLength = round(len(items) / self.cpuCount)
-
-        batch = []
-        processes = []
-        batchedItems = []
-        problemItems = []
-        self.outputToConsole(f'OFFLOADER: Your system has {self.cpuCount} available CPUs. Processing {len(items)} {"item" if (len(items) == 1) else "items"} in {round(len(items)/loadLength) if (loadLength > 0) else 1} {"batch" if (loadLength == 0) else "batches"}...')
-
-        i = 0
-
-        self.updatePBar(len(items))
-        
-        while i < len(items):
-            try:
-                batch.append(items[i])
-                if loadLength > 0:
-                    if i % loadLength == 0 and i > 0 or i == len(items)-1:
-                        self.outputToConsole(f'OFFLOADER: Compiling {len(batch)}/{len(items)}')
-
-                        ## REMOVE ITEMS TO BE BATCHED FROM ITEMS LIST AND RESET COUNTER
-                        items = [item for idx, item in enumerate(items) if idx > loadLength]
-                        i = 0
-
-                        ## GENERATE NEW QUEUES
-                        QID = self.getRandInt()
-                        PID = self.getRandInt()
-                        self.makeQueue(QID)
-                        self.makeQueue(PID)
-                        
-                        Que = getattr(self, f'Q{QID}')
-                        PP = getattr(self, f'Q{PID}')
-
-                        p = Process(target=updateItem, args=(Que, PP, batch, allMMIDs, allMTIDs, MMIDsOnly, MTIDsOnly,))
-                        processes.append(p)
-
-                        ## EMPTY BATCH LIST
-                        batch = []
-
-                        ## BEGIN BATCH JOB
-                        p.start()
-
-                        time.sleep(.1)
-
-                        while not PP.empty():
-                            p = PP.get()
-                            self.logger.setLog(p[1])
-                            self.logger.log(f'OFFLOADER: Successfully compiled a local record for {p[0]}')
-                            self.updatePBar()
-
-                        while not Que.empty():
-                            q = Que.get()
-                            batchedItems.append(q[0])
-                            problemItems.append(q[1])
-                    else:
-                        i += 1
-                else:
-                    self.outputToConsole(f'OFFLOADER: Compiling {len(batch)}/{len(items)}')
-
-                    ## REMOVE ITEMS TO BE BATCHED FROM ITEMS LIST AND RESET COUNTER
-                    items = [item for idx, item in enumerate(items) if idx > loadLength]
-                    i = 0
-
-                    ## GENERATE NEW QUEUES
-                    QID = self.getRandInt()
-                    PID = self.getRandInt()
-                    self.makeQueue(QID)
-                    self.makeQueue(PID)
-                    
-                    Que = getattr(self, f'Q{QID}')
-                    PP = getattr(self, f'Q{PID}')
-
-                    p = Process(target=updateItem, args=(Que, PP, batch, allMMIDs, allMTIDs, MMIDsOnly, MTIDsOnly,))
-                    processes.append(p)
-
-                    ## EMPTY BATCH LIST
-                    batch = []
-
-                    ## BEGIN BATCH JOB
-                    p.start()
-
-                    time.sleep(.5)
-
-                    while not PP.empty():
-                        p = PP.get()
-                        self.logger.setLog(p[1])
-                        self.logger.log(f'OFFLOADER: Successfully compiled a local record for {p[0]}')
-                        self.updatePBar()
-
-                    while not Que.empty():
-                        q = Que.get()
-                        batchedItems.append(q[0])
-                        problemItems.append(q[1])
-            except (OSError, AttributeError) as error:
-                self.outputToConsole(f'OFFLOADER ERROR: {error}. Process stopped.', False)
-                break
-
-        try:
-            for process in processes:
-                process.join()
-        except:
-            print('error with process joining!')
-
-        try:
-            problemItems = [item for items in problemItems for item in items]
-            batchedItems = [item for items in batchedItems for item in items]
-        except:
-            print('error with converting problem items and batched items')
-
-        try:
-            i = 0
-            while i < len(batchedItems):
-                if not 'RenditionID' in batchedItems[i]:
-                    problemItems.append(batchedItems.pop(i))
-                else:
-                    i += 1
-        except (OSError, ValueError) as error:
-            print(error)
-            # print(f'{item["RenditionNumber"]} has an error with rendition ID!')
-        
-        try:
-            if len(problemItems):
-                for item in problemItems:
-                    self.logger.setErrorLog(item['Origin'])
-                    self.logger.logError(f'{item["RenditionNumber"]} does not appear in MMIDS or MTIDS tables and has no RenditionID associated. This file has not been further processed')
-        except:
-            print('error with logging problem items to log!')
-
-        self.items = batchedItems
-        self.problemRecs = problemItems
-
-        try:
-            self.newRecords = [(tuple([item['RenditionID'], 2327, item['FileName'], item['FormatID'], 'Offloader', item['File-ID'], datetime.now()])) for item in batchedItems]
-        except (KeyError, OSError) as error:
-            print('Error with compiling new records!', item["RenditionNumber"])
-    
-        self.outputToConsole(f'OFFLOADER: Local records have been updated and compiled')
-        self.updatePBar(0)
-        self.makeQueue(self.getRandInt(), self.DB.addMediaFiles, (self.newRecords,))
+        self.toggleBindings('Control', ['p', 'o', 'l', 'm', 'g', 'u', 'v', 's'])
+        self.outputToConsole('>>>>>> ALL DONE! <<<<<<', True)
 
-    def batchUpdate(self) -> None:
+    def newScheduler(self) -> Scheduler:
         """
-        Like updateItems this method will update dependent records in memory using multiprocessing.
-        """        
-        # print('batchUpdate', self.items)
-
-        items = [item for item in self.items]
-
-        batch = []
-        processes = []
-        batchedItems = []
-        problemItems = []
-
-        allIIDs = self.DB.getAllIIDS()
-        
-        IIDsOnly = [id["RenditionID"] for id in allIIDs]
-
-        self.outputToConsole('OFFLOADER: Retrieved IDs of new records. Batching local records...')
-
-        loadLength = round(len(items) / self.cpuCount)
-
-        self.updatePBar(len(items))
-
-        # UPDATE ITEMS WITH NEW FILE IDS
-        i = 0
-        while i < len(items):
-            try:
-                batch.append(items[i])
-                if loadLength == 0: loadLength = 1
-                if i % loadLength == 0 and i > 0 or i == len(items)-1:
-                    # self.outputToConsole(f'OFFLOADER: Loading {len(batch)}/{len(items)}')
-
-                    ## REMOVE ITEMS TO BE BATCHED FROM ITEMS LIST AND RESET COUNTER
-                    items = [item for idx, item in enumerate(items) if idx > loadLength]
-
-                    i = 0
-
-                    ## GENERATE NEW QUEUES
-                    QID = self.getRandInt()
-                    PID = self.getRandInt()
-                    self.makeQueue(QID)
-                    self.makeQueue(PID)
-                    
-                    Que = getattr(self, f'Q{QID}')
-                    PP = getattr(self, f'Q{PID}')
-
-                    p = Process(target=updateFileID, args=(Que, PP, batch, allIIDs, IIDsOnly,))
-                    processes.append(p)
-
-                    ## EMPTY BATCH LIST
-                    batch = []
-
-                    ## BEGIN BATCH JOB
-                    p.start()
-
-                    time.sleep(1)
-
-                    while not PP.empty():
-                        p = PP.get()
-                        self.logger.setLog(p[1])
-                        self.logger.log(f'OFFLOADER: Successfully updated local record with FileID for {p[0]}')
-                        self.updatePBar()
-
-                    while not Que.empty():
-                        q = Que.get()
-                        batchedItems.append(q[0])
-                        problemItems.append(q[1])
-                else:
-                    i += 1
-                # else:
-                #     items = [item for idx, item in enumerate(items) if idx > loadLength]
-
-                #     i = 0
-
-                #     ## GENERATE NEW QUEUES
-                #     QID = self.getRandInt()
-                #     PID = self.getRandInt()
-                #     self.makeQueue(QID)
-                #     self.makeQueue(PID)
-                    
-                #     Que = getattr(self, f'Q{QID}')
-                #     PP = getattr(self, f'Q{PID}')
-
-                #     p = Process(target=updateFileID, args=(Que, PP, batch, allIIDs, IIDsOnly,))
-                #     processes.append(p)
-
-                #     ## EMPTY BATCH LIST
-                #     batch = []
-
-                #     ## BEGIN BATCH JOB
-                #     p.start()
-
-                #     time.sleep(1)
-
-                #     while not PP.empty():
-                #         p = PP.get()
-                #         self.logger.setLog(p[1])
-                #         self.logger.log(f'OFFLOADER: Successfully updated local record with FileID for {p[0]}')
-                #         self.updatePBar()
-
-                #     while not Que.empty():
-                #         q = Que.get()
-                #         batchedItems.append(q[0])
-                #         problemItems.append(q[1])
-                # # else:
-                    # i += 1
-
-            except OSError as error:
-                print(error)
-
-        self.updatePBar(0)
-
-        try:
-            for process in processes:
-                process.join()
-        except:
-            print('error with process joining!')
+        Make a scheduler for a new run of stages that reports back on the Tk thread
 
-        try:
-            problemItems = [item for items in problemItems for item in items]
-            batchedItems = [item for items in batchedItems for item in items]
-        except:
-            print('error with converting problem items and batched items')
-
-        try:
-            i = 0
-            while i < len(batchedItems):
-                if not 'FileID' in batchedItems[i]:
-                    problemItems.append(batchedItems.pop(i))
-                else:
-                    i += 1
-        except (OSError, ValueError) as error:
-            print(error)
-
-        self.items = batchedItems
-
-        try:
-            if len(problemItems):
-                for item in problemItems:
-                    self.logger.setErrorLog(item['Origin'])
-                    self.logger.logError(f'{item["RenditionNumber"]} does not appear in IIDS table and has no FileID associated. This file has not been further processed')
-        except:
-            print('error with logging problem items to log!')
-
-        self.outputToConsole('OFFLOADER: Batching successful!')
-
-        try:
-            self.newRecords = [tuple([item['FileID'], 2327, item['ThumbnailPath'] + '?width=170&height=170', 0, item['MediaMasterID']]) for item in self.items]
-            # self.newRecords = [tuple([i['FileID'], 2290, i["ThumbnailPath"], i['ThumbnailPath'] + '?width=170&height=170', 0, i['MediaMasterID']]) for item in self.items for i in item]
-            # self.newRecords = [tuple(item['FileID'], 2290, item['ThumbnailPath'] + '?width=170&height=170', 0, item['MediaMasterID']) for item in self.items]
-            print(self.newRecords)
-        except:
-            print('error with newRecords!')
-
-        self.makeQueue(self.getRandInt(), self.DB.updateMediaRenditions, (self.newRecords,))
-
-    def verified(self) -> None:
+        Returns:
+            Scheduler: scheduler without stages
         """
-        Final stage of the processing to verify everything was done successfully
-        """        
-        items = [item for item in self.items]
-        allMMIDs = self.DB.getAllMMIDS()
-        MMIDsOnly = {}
-        MMIDsOnly["RenditionNumbers"] = []
-        MMIDsOnly["PrimaryFileIDs"] = []
-        MMIDsOnly["RenditionNumbers"] = [id["RenditionNumber"] for id in allMMIDs]
-        MMIDsOnly["PrimaryFileIDs"] = [id["PrimaryFileID"] for id in allMMIDs]
-
-        self.updatePBar(len(self.items))
-        loadLength = round(len(self.items) / self.cpuCount)
-
-        batch = []
-        processes = []
-        batchedItems = []
-        problemItems = []
-
-        # UPDATE ITEMS WITH NEW FILE IDS
-        i = 0
-        while i < len(items):
-            try:
-                batch.append(items[i])
-                if loadLength == 0: loadLength = 1
-                if i % loadLength == 0 and i > 0 or i == len(items)-1:
-                    # self.outputToConsole(f'OFFLOADER: Loading {len(batch)}/{len(items)}')
-
-                    ## REMOVE ITEMS TO BE BATCHED FROM ITEMS LIST AND RESET COUNTER
-                    items = [item for idx, item in enumerate(self.items) if idx > loadLength]
-
-                    i = 0
-
-                    ## GENERATE NEW QUEUES
-                    QID = self.getRandInt()
-                    PID = self.getRandInt()
-                    self.makeQueue(QID)
-                    self.makeQueue(PID)
-                    
-                    Que = getattr(self, f'Q{QID}')
-                    PP = getattr(self, f'Q{PID}')
-
-                    p = Process(target=verifyItem, args=(Que, PP, batch, MMIDsOnly,))
-                    processes.append(p)
-
-                    ## EMPTY BATCH LIST
-                    batch = []
-
-                    ## BEGIN BATCH JOB
-                    p.start()
-
-                    time.sleep(1)
-
-                    while not PP.empty():
-                        p = PP.get()
-                        self.logger.setLog(p[1])
-                        self.logger.log(f'OFFLOADER: Local copy of {p[0]} now corresponds to remote copy')
-                        self.updatePBar()
-
-                    while not Que.empty():
-                        q = Que.get()
-                        batchedItems.append(q[0])
-                        problemItems.append(q[1])
-                else:
-                    i += 1
-                # else:
-                #     # self.outputToConsole(f'OFFLOADER: Loading {len(batch)}/{len(items)}')
-
-                #     ## REMOVE ITEMS TO BE BATCHED FROM ITEMS LIST AND RESET COUNTER
-                #     items = [item for idx, item in enumerate(self.items) if idx > loadLength]
-
-                #     i = 0
-
-                #     ## GENERATE NEW QUEUES
-                #     QID = self.getRandInt()
-                #     PID = self.getRandInt()
-                #     self.makeQueue(QID)
-                #     self.makeQueue(PID)
-                    
-                #     Que = getattr(self, f'Q{QID}')
-                #     PP = getattr(self, f'Q{PID}')
-
-                #     p = Process(target=verifyItem, args=(Que, PP, batch, MMIDsOnly,))
-                #     processes.append(p)
-
-                #     ## EMPTY BATCH LIST
-                #     batch = []
-
-                #     ## BEGIN BATCH JOB
-                #     p.start()
-
-                #     time.sleep(1)
-
-                #     while not PP.empty():
-                #         p = PP.get()
-                #         self.logger.setLog(p[1])
-                #         self.logger.log(f'OFFLOADER: Local copy of {p[0]} now corresponds to remote copy')
-                #         self.updatePBar()
-
-                #     while not Que.empty():
-                #         q = Que.get()
-                #         batchedItems.append(q[0])
-                #         problemItems.append(q[1])
-            except OSError as error:
-                print(error)
-        
-        try:
-            if len(problemItems[0]):
-                for idx, item in enumerate(problemItems):
-                    self.problemRecs.append(batchedItems.pop(idx))
-                    self.logger.setErrorLog(item[0]['Origin'])
-                    self.logger.logError(f'{item[0]["RenditionNumber"]} does not appear in MMIDS or MTIDS tables and has no RenditionID associated. This file has not been further processed')
-        except OSError as error:
-            print('error with logging problem items to log!')
+        scheduler = Scheduler(self.dispatch)
+        scheduler.onStage(self.stageFinished)
+        scheduler.onDone(self.stagesFinished)
+        return scheduler
 
-        self.updatePBar(0)
+    def dispatch(self, func:function, *args) -> None:
+        """
+        Hand a callback from a stage thread to the Tk thread. The callback is only queued; runEvents picks it up on the Tk thread, so the stage thread never calls into Tk.
 
-        self.outputToConsole(f'OFFLOADER: {len(self.problemRecs)} records from the files you selected have not been updated. Check the error logs for more information!')
+        Args:
+            func (function): callback to run on the Tk thread
+            args (tuple): arguments for the callback
+        """
+        self.events.put((func, args))
 
-        self.outputToConsole(">>>>>> CLEANING UP <<<<<<", True)
+    def onTkThread(self, func:function) -> function:
+        """
+        Wrap a callback that touches widgets, so that calls from a stage thread are dispatched to the Tk thread. Calls from the Tk thread run directly.
 
-        self.finishProcessing()
+        Args:
+            func (function): callback that updates the GUI
 
-    def finishProcessing(self) -> None:
+        Returns:
+            function: callback that is safe to call from any thread; its return value is lost when it is dispatched
         """
-        Finish up after processing is complete: 
-        - drop scratchtable
-        - remove local instance of TinyDB with data
-        - reset progress bar
-        - release toggle bindings
-        - update user
-        """        
-        self.DB.dropScratchTable()
-        self.DB.removeTinyDB()
-        self.updatePBar()
-        self.toggleBindings('Control', ['p', 'o', 'l', 'm', 'g', 'u', 'v', 's'])
-        self.outputToConsole('>>>>>> ALL DONE! <<<<<<', True)
+        def call(*args):
+            if current_thread() is main_thread(): return func(*args)
+            self.dispatch(func, *args)
+        return call
 
-    def getRandInt(self) -> None: 
+    def runEvents(self) -> None:
         """
-        Returns a random integer that is not yet used by the queues to process data
-
-        Returns:
-            int: some random integer
-        """        
-        i = random.randint(1, 100000)
-        if i not in self.Queues:
-            self.Queues.append(i)
-            return i
-        else:
-            self.getRandInt()
+        Run all callbacks queued by dispatch, then check the queue again after pollInterval milliseconds
+        """
+        try:
+            while not self.events.empty():
+                func, args = self.events.get()
+                func(*args)
+        finally:
+            self.after(self.pollInterval, self.runEvents)    # KEEP POLLING EVEN IF A CALLBACK RAISED
 
-    def makeQueue(self, idx:int, func:function=None, args:tuple=()) -> None:
+    def stageFinished(self, stage) -> None:
         """
-        This function makes a queue and starts the function assigned to it in a separate ThreadedTask
+        Log the outcome and wall time of a stage
 
         Args:
-            idx (int): Some random integer for a new Queue instance
-            func (function, optional): function to be run for that Queue. Defaults to None.
-            args (tuple, optional): arguments to be passed into the function. Defaults to ().
-        """        
-        try:
-            Q = f'Q{idx}'
-            setattr(self, Q, Queue())
-            setattr(self, f'{Q}fn', func)
-            self.Qs.append(getattr(self, Q))
-            if func is not None:
-                ThreadedTask(getattr(self, Q), self, getattr(self, f'{Q}fn'), args).start()
-                self.checkQueue(idx)
-        except:
-            print('Error in queue construction')
-
-    def checkQueue(self, idx:int) -> None:
+            stage (Stage): stage that finished, failed or was skipped
         """
-        Processes the result of ThreadedTask. Result is a string that identifies the next stage in the batch process pipeline.
+        if stage.status == 'skipped':
+            self.logger.logToSystemLog(f'OFFLOADER: Stage {stage.name} skipped')
+            return
+        measured = self.metrics.describe(stage.name)
+        self.logger.logToSystemLog(f'OFFLOADER: Stage {stage.name} {stage.status} in {stage.seconds:.3f} seconds{"; " + measured if measured else ""}')
+        if stage.error is not None:
+            self.outputToConsole(f'OFFLOADER ERROR: {stage.name} raised {type(stage.error).__name__}: {stage.error}', False)
+
+    def stagesFinished(self, failed:list) -> None:
+        """
+        Clean up when a run of stages stops and write the run report to the logs folder
 
         Args:
-            idx (int): number of the queue
+            failed (list): stages that failed
         """
-        try:
-            Q = f'Q{idx}'
-            Que = getattr(self, Q)
-            QResult = Que.get(0)
-            for attr in (Q, f'{Q}fn'):
-                self.__dict__.pop(attr, None)
-            self.Qs.pop(self.Qs.index(Que))
-            self.Queues.pop(self.Queues.index(idx))
-            if QResult is not None:
-                if 'getMMIDs' in QResult: self.makeQueue(self.getRandInt(), self.DB.getMMIDs)
-                if 'updateItems' in QResult: self.makeQueue(self.getRandInt(), self.updateItems)
-                if 'getIIDs' in QResult: self.makeQueue(self.getRandInt(), self.DB.getIIDs)
-                if 'batchUpdate' in QResult: self.makeQueue(self.getRandInt(), self.batchUpdate)
-                if 'verify' in QResult: self.makeQueue(self.getRandInt(), self.DB.getMMIDs, (True,))
-                if 'verified' in QResult: self.makeQueue(self.getRandInt(), self.verified)
-            # if QResult is not None and '()' in QResult:
-                # self.makeQueue(self.getRandInt(), exec(QResult))
-        except Empty:
-            self.after(100, self.checkQueue, idx)
+        if len(self.scheduler.stages) > 1:
+            for query in self.tracer.top(5):
+                self.logger.logToSystemLog(f'OFFLOADER: {query["seconds"]:.3f} seconds in {query["calls"]} {"call" if query["calls"] == 1 else "calls"} of {query["template"]}')
+            try:
+                report = self.metrics.write(self.logger.logPath, summary=self.pipeline.summary(), failed=[s.name for s in failed], resumed=self.pipeline.resumed, queries=self.tracer.summary(), slowQueries=self.tracer.slowest())
+                self.outputToConsole(f'OFFLOADER: Run report written to {report}')
+            except OSError as error:
+                self.outputToConsole(f'OFFLOADER: Could not write the run report: {error}', False)
+        if 'finishProcessing' in self.scheduler.stages and not failed:
+            self.finishProcessing()
+        elif failed and len(self.scheduler.stages) > 1:
+            self.outputToConsole(f'OFFLOADER: Process stopped because {", ".join(s.name for s in failed)} failed', False)
+            self.workers.close()
+            self.toggleControls(self.Frame, 'normal')
+            self.toggleBindings('Control', ['p', 'o', 'l', 'm', 'g', 'u', 'v', 's'])
 
     def outputToConsole(self, msg:str, res:str/bool='normal') -> None:
         """
@@ -1173,6 +750,9 @@ class GUIConverter(Tk):
         Save the state of the program and exit
         """        
         self.save()
+        self.workers.close()
+        self.DB.close()
+        self.journal.close()
         self.logger.log('Program finished with code 0')
         exit(0)
 
@@ -0,0 +1,522 @@
+from __future__ import annotations
+
+try:
+    import os
+    from datetime import datetime
+    from joiner import Joiner
+    from workers import WorkerPool, updateItem, updateFileID, verifyItem
+    from scheduler import Scheduler
+    from metrics import Metrics
+except ImportError as error:
+    print(error)
+
+class Pipeline:
+    """ This class holds the stages of a batch update: extract, resolve, insert, update and verify. It has no ties to Tk, so the GUI and the headless runner both drive it through a Scheduler.
+    ## Methods (25)
+    - setDB : db (DB) -> None
+    - setExtractor : extractor (Extractor) -> None
+    - setLogger : logger (Logger) -> None
+    - setWorkers : workers (WorkerPool) -> None
+    - setJournal : journal (Journal) -> None
+    - setMetrics : metrics (Metrics) -> None
+    - outputToConsole : pbar (function), outputToConsole (function) -> None
+    - setInput : files (list) -> None
+    - setFlags : log (bool), serverMatching (bool), resume (bool) -> None
+    - build : scheduler (Scheduler) -> Scheduler
+    - addStage : scheduler (Scheduler), done (set), name (str), func (function), after (tuple), args (tuple), neededBy (str) -> Stage
+    - state : () -> dict
+    - restore : state (dict) -> None
+    - extractFiles : () -> bool
+    - getTables : () -> bool
+    - updateItems : () -> None
+    - matchOnServer : () -> bool
+    - batchUpdate : () -> None
+    - mediaFileRecords : items (list) -> list
+    - renditionRecords : items (list) -> list
+    - reject : stage (str), items (list), itemKey (function), recordKey (function) -> list
+    - verified : () -> None
+    - finishProcessing : () -> None
+    - logProgress : p (list), msg (str) -> None
+    - summary : () -> dict
+    """
+
+    def __init__(self):
+        self.input = []
+        self.items = []
+        self.problemRecs = []
+        self.newRecords = []
+        self.tables = {}        # SNAPSHOT OF THE TMS TABLES FOR THE NEXT JOIN
+        self.log = False
+        self.serverMatching = False
+        self.resume = False
+        self.resumed = False
+        self.journal = None     # DURABLE RECORD OF THE STAGES AND CHUNKS OF THE RUN
+        self.metrics = Metrics()
+        self.output = print
+        self.updatePBar = lambda steps=None: None
+
+    def setDB(self, db) -> None:
+        """
+        Assign the DB to this class
+
+        Args:
+            db (DB): DB instance
+        """
+        self.DB = db
+
+    def setExtractor(self, extractor) -> None:
+        """
+        Assign the extractor to this class
+
+        Args:
+            extractor (Extractor): Extractor instance
+        """
+        self.extractor = extractor
+
+    def setLogger(self, logger) -> None:
+        """
+        Assign the logger to this class
+
+        Args:
+            logger (Logger): logger instance
+        """
+        self.logger = logger
+
+    def setWorkers(self, workers:WorkerPool) -> None:
+        """
+        Assign the worker pool to this class
+
+        Args:
+            workers (WorkerPool): worker processes kept alive for the run
+        """
+        self.workers = workers
+
+    def setJournal(self, journal) -> None:
+        """
+        Assign the run journal to this class
+
+        Args:
+            journal (Journal): Journal instance
+        """
+        self.journal = journal
+
+    def setMetrics(self, metrics) -> None:
+        """
+        Assign the run metrics to this class; share them with DB so the round trips of each stage are counted
+
+        Args:
+            metrics (Metrics): Metrics instance
+        """
+        self.metrics = metrics
+
+    def outputToConsole(self, pbar:function, outputToConsole:function) -> None:
+        """
+        Assign the progress and output methods to this class
+
+        Args:
+            pbar (function): called with the number of steps to start counting, 0 to reset, or nothing to advance one step
+            outputToConsole (function): called with a message and optionally True (heading) or False (error)
+        """
+        self.updatePBar = pbar
+        self.output = outputToConsole
+
+    def setInput(self, files:list) -> None:
+        """
+        Select the DRS reports to process and clear the results of a previous run
+
+        Args:
+            files (list): paths of the DRS reports
+        """
+        self.input = list(files)
+        self.items, self.problemRecs, self.newRecords, self.tables = [], [], [], {}
+        self.resumed = False
+
+    def setFlags(self, log:bool=False, serverMatching:bool=False, resume:bool=False) -> None:
+        """
+        Choose how the reports are processed
+
+        Args:
+            log (bool, optional): write a log for each report. Defaults to False.
+            serverMatching (bool, optional): match the items on the TMS server instead of downloading the tables. Defaults to False.
+            resume (bool, optional): continue the unfinished run over the same reports recorded in the journal. Defaults to False.
+        """
+        self.log = log
+        self.serverMatching = serverMatching
+        self.resume = resume
+
+    def build(self, scheduler:Scheduler) -> Scheduler:
+        """
+        Add the stages of a batch update to a scheduler. Extraction and the downloads of the TMS tables do not depend on each other and run side by side. With a journal, a run over reports whose last run did not finish picks up after the last stage that completed.
+
+        Args:
+            scheduler (Scheduler): scheduler without stages
+
+        Returns:
+            Scheduler: the scheduler, ready to run
+        """
+        done = set()
+        self.metrics.reset()
+        if self.journal is not None:
+            self.resumed = self.journal.begin(self.input, self.resume)
+            if self.resumed:
+                done = self.journal.done()
+                self.restore(self.journal.state())
+                self.output(f'OFFLOADER: Resuming run {self.journal.run}; {len(done)} {"stage has" if len(done) == 1 else "stages have"} already completed', True)
+
+        self.addStage(scheduler, done, 'extract', self.extractFiles)
+        if self.serverMatching:
+            self.addStage(scheduler, done, 'matchOnServer', self.matchOnServer, after=('extract',))
+            self.addStage(scheduler, done, 'getIIDs', self.DB.getIIDs, after=('matchOnServer',), neededBy='batchUpdate')
+        else:
+            self.addStage(scheduler, done, 'getTables', self.getTables, neededBy='updateItems')
+            self.addStage(scheduler, done, 'updateItems', self.updateItems, after=('extract', 'getTables'))
+            self.addStage(scheduler, done, 'addMediaFiles', self.DB.addMediaFiles, after=('updateItems',), args=lambda: (self.newRecords,))
+            self.addStage(scheduler, done, 'getIIDs', self.DB.getIIDs, after=('addMediaFiles',), neededBy='batchUpdate')
+        self.addStage(scheduler, done, 'batchUpdate', self.batchUpdate, after=('getIIDs',))
+        self.addStage(scheduler, done, 'updateMediaRenditions', self.DB.updateMediaRenditions, after=('batchUpdate',), args=lambda: (self.newRecords,))
+        self.addStage(scheduler, done, 'getVerification', self.DB.getVerification, after=('updateMediaRenditions',), neededBy='verified')
+        self.addStage(scheduler, done, 'verified', self.verified, after=('getVerification',))
+        self.addStage(scheduler, done, 'finishProcessing', self.finishProcessing, after=('verified',))
+        return scheduler
+
+    def addStage(self, scheduler:Scheduler, done:set, name:str, func:function, after:tuple=(), args=(), neededBy:str=None):
+        """
+        Add a stage that is measured and reports to the journal. A stage that completed in the run being resumed is replaced by one that does nothing. Downloads only fill the local store for the next stage, so they are run again unless that stage has completed.
+
+        Args:
+            scheduler (Scheduler): scheduler to add the stage to
+            done (set): stages completed by the run being resumed
+            name (str): unique name of the stage
+            func (function): runs the stage
+            after (tuple, optional): names of the stages to wait for. Defaults to ().
+            args (tuple|function, optional): arguments for func, or a function returning them. Defaults to ().
+            neededBy (str, optional): stage that uses the result of a download; downloads are not recorded in the journal. Defaults to None.
+
+        Returns:
+            Stage: the new stage
+        """
+        if (neededBy or name) in done:
+            return scheduler.add(name, lambda *args: True, after)
+
+        def measured(*args):
+            with self.metrics.stage(name) as record:
+                result = func(*args)
+                if result is False: record.status = 'failed'
+                return result
+        if neededBy is not None or self.journal is None:
+            return scheduler.add(name, measured, after, args)
+
+        def checkpoint(*args):
+            result = measured(*args)
+            # THE STATE IS SAVED BEFORE THE STAGES WAITING FOR THIS ONE CAN CHANGE IT
+            if result is not False: self.journal.stageDone(name, self.state())
+            return result
+        return scheduler.add(name, checkpoint, after, args)
+
+    def state(self) -> dict:
+        """
+        Collect what the stages hand to each other, for the journal
+
+        Returns:
+            dict: items, problem items and new records
+        """
+        return { 'items' : self.items, 'problemRecs' : self.problemRecs, 'newRecords' : self.newRecords }
+
+    def restore(self, state:dict) -> None:
+        """
+        Continue from a state saved in the journal, together with the rows the TMS server rejected before the run stopped
+
+        Args:
+            state (dict): state saved after the last stage that completed, or None
+        """
+        if self.journal is not None: self.DB.rejected = self.journal.rejects()
+        if not state: return
+        self.items = state['items']
+        self.problemRecs = state['problemRecs']
+        self.newRecords = state['newRecords']
+
+    def extractFiles(self) -> bool:
+        """
+        Extract all selected reports in parallel on the worker pool, keeping the items of each report together and in order
+
+        Returns:
+            bool: True once the reports have been extracted
+        """
+        self.output(f'OFFLOADER: Extracting {len(self.input)} {"report" if (len(self.input) == 1) else "reports"}...')
+        self.workers.start()
+        # SIZES ARE TAKEN BEFORE THE REPORTS MAY BE MOVED TO THE BACKUP FOLDER
+        self.metrics.add('bytes', sum(os.path.getsize(f) for f in self.input if os.path.isfile(f)))
+        results = self.extractor.extractAll(self.input, self.workers.pool, self.log)
+        self.items.extend(results[i] for i in self.input)
+        self.metrics.add('rows', sum(len(results[i]) for i in self.input))
+        return True
+
+    def getTables(self) -> bool:
+        """
+        Download MediaFormats and MediaRenditions concurrently and keep the snapshot for updateItems
+
+        Returns:
+            bool: True if both tables were downloaded
+        """
+        self.tables = self.DB.getTables(['MTIDS', 'MMIDS'])
+        return self.tables is not False
+
+    def updateItems(self) -> None:
+        """
+        Batch update self.items in memory with multiprocessing to speed up overall progress. Data is split and chunks assigned to different processes. Processes are queued and processed until all have been completed.
+        """
+        self.output('>>>>>> BATCH UPDATING RECORDS <<<<<<', True)
+        items = [item for sublist in self.items for item in sublist]
+
+        if len(items) > 100: self.output('OFFLOADER: This might take a while...')
+
+        joiner = Joiner()
+        joiner.indexRenditions(self.tables['MMIDS'])
+        joiner.indexFormats(self.tables['MTIDS'])
+        self.tables = {}
+
+        self.output(f'OFFLOADER: Your system has {self.workers.processes} available CPUs. Processing {len(items)} {"item" if (len(items) == 1) else "items"} in chunks of {self.workers.chunkSize(len(items))}...')
+
+        self.updatePBar(len(items))
+        self.metrics.add('rows', len(items))
+
+        batchedItems, problemItems = [], []
+        tables = joiner.share()
+        try:
+            self.workers.load(tables)
+            batchedItems, problemItems = self.workers.run(updateItem, items, lambda p: self.logProgress(p, f'OFFLOADER: Successfully compiled a local record for {p[0]}'))
+        except (OSError, AttributeError) as error:
+            self.output(f'OFFLOADER ERROR: {error}. Process stopped.', False)
+        finally:
+            tables.release()
+
+        try:
+            i = 0
+            while i < len(batchedItems):
+                if not 'RenditionID' in batchedItems[i]:
+                    problemItems.append(batchedItems.pop(i))
+                else:
+                    i += 1
+        except (OSError, ValueError) as error:
+            print(error)
+
+        try:
+            if len(problemItems):
+                for item in problemItems:
+                    self.logger.logError(f'{item["RenditionNumber"]} does not appear in MMIDS or MTIDS tables and has no RenditionID associated. This file has not been further processed', item['Origin'])
+        except:
+            print('error with logging problem items to log!')
+
+        self.items = batchedItems
+        self.problemRecs = problemItems
+
+        try:
+            self.newRecords = self.mediaFileRecords(batchedItems)
+        except (KeyError, OSError) as error:
+            print('Error with compiling new records!', error)
+
+        self.output(f'OFFLOADER: Local records have been updated and compiled')
+        self.updatePBar(0)
+
+    def matchOnServer(self) -> bool:
+        """
+        Alternative to getTables, updateItems and addMediaFiles: match the items on the TMS server and insert their MediaFiles there. Only unmatched items come back for the error logs.
+
+        Returns:
+            bool: True once the matched items have been added to MediaFiles
+        """
+        self.output('>>>>>> MATCHING RECORDS ON THE TMS SERVER <<<<<<', True)
+        items = [item for sublist in self.items for item in sublist]
+        self.output(f'OFFLOADER: Uploading {len(items)} {"item" if (len(items) == 1) else "items"} to the TMS server...')
+
+        self.items, self.problemRecs = self.DB.matchOnServer(items)
+        self.reject('matchOnServer', items, lambda item: (item['RenditionNumber'], item['FileName']), lambda row: (row[1], row[3]))
+
+        try:
+            for item in self.problemRecs:
+                self.logger.logError(f'{item["RenditionNumber"]} does not appear in MMIDS or MTIDS tables and has no RenditionID associated. This file has not been further processed', item['Origin'])
+        except:
+            print('error with logging problem items to log!')
+
+        self.output(f'OFFLOADER: Matched and added MediaFiles for {len(self.items)} {"item" if (len(self.items) == 1) else "items"} on the TMS server')
+        return True
+
+    def batchUpdate(self) -> None:
+        """
+        Like updateItems this method will update dependent records in memory using multiprocessing.
+        """
+        self.items = self.reject('addMediaFiles', self.items, lambda item: (item['RenditionID'], item['FileName']), lambda record: (record[0], record[2]))
+        items = [item for item in self.items]
+
+        joiner = Joiner()
+        joiner.indexFiles(self.DB.getAllIIDS())
+
+        self.output('OFFLOADER: Retrieved IDs of new records. Batching local records...')
+
+        self.updatePBar(len(items))
+        self.metrics.add('rows', len(items))
+
+        # UPDATE ITEMS WITH NEW FILE IDS
+        batchedItems, problemItems = [], []
+        tables = joiner.share()
+        try:
+            self.workers.load(tables)
+            batchedItems, problemItems = self.workers.run(updateFileID, items, lambda p: self.logProgress(p, f'OFFLOADER: Successfully updated local record with FileID for {p[0]}'))
+        except OSError as error:
+            print(error)
+        finally:
+            tables.release()
+
+        self.updatePBar(0)
+
+        try:
+            i = 0
+            while i < len(batchedItems):
+                if not 'FileID' in batchedItems[i]:
+                    problemItems.append(batchedItems.pop(i))
+                else:
+                    i += 1
+        except (OSError, ValueError) as error:
+            print(error)
+
+        self.items = batchedItems
+
+        try:
+            if len(problemItems):
+                for item in problemItems:
+                    self.problemRecs.append(item)
+                    self.logger.logError(f'{item["RenditionNumber"]} does not appear in IIDS table and has no FileID associated. This file has not been further processed', item['Origin'])
+        except:
+            print('error with logging problem items to log!')
+
+        self.output('OFFLOADER: Batching successful!')
+
+        try:
+            self.newRecords = self.renditionRecords(self.items)
+        except:
+            print('error with newRecords!')
+
+    def mediaFileRecords(self, items:list) -> list:
+        """
+        Compile the MediaFiles rows for items resolved by updateItems
+
+        Args:
+            items (list): items with RenditionID and FormatID
+
+        Returns:
+            list: (RenditionID, PathID, FileName, FormatID, LoginID, ArchIDNum, EnteredDate) tuples
+        """
+        return [(tuple([item['RenditionID'], 2327, item['FileName'], item['FormatID'], 'Offloader', item['File-ID'], datetime.now()])) for item in items]
+
+    def renditionRecords(self, items:list) -> list:
+        """
+        Compile the MediaRenditions updates for items that have a FileID
+
+        Args:
+            items (list): items with FileID and MediaMasterID
+
+        Returns:
+            list: (FileID, ThumbPathID, ThumbFileName, ThumbExtensionID, MediaMasterID) tuples
+        """
+        return [tuple([item['FileID'], 2327, item['ThumbnailPath'] + '?width=170&height=170', 0, item['MediaMasterID']]) for item in items]
+
+    def reject(self, stage:str, items:list, itemKey:function, recordKey:function) -> list:
+        """
+        Move the items whose rows the TMS server rejected in a stage to the problem records and log the error of the server to the error log of their report
+
+        Args:
+            stage (str): name of the stage
+            items (list): items written in the stage
+            itemKey (function): gives the key of an item
+            recordKey (function): gives the key of a rejected record
+
+        Returns:
+            list: the items that were not rejected
+        """
+        rejected = { recordKey(record) : error for record, error in self.DB.rejects(stage) }
+        if not rejected: return items
+        kept = []
+        for item in items:
+            error = rejected.get(itemKey(item))
+            if error is None:
+                kept.append(item)
+                continue
+            self.problemRecs.append(item)
+            self.logger.logError(f'{item["RenditionNumber"]} was rejected by the TMS server in {stage}: {error}. This file has not been further processed', item['Origin'])
+        return kept
+
+    def verified(self) -> None:
+        """
+        Final stage of the processing to verify everything was done successfully
+        """
+        self.items = self.reject('updateMediaRenditions', self.items, lambda item: item['MediaMasterID'], lambda record: record[4])
+        items = [item for item in self.items]
+        joiner = Joiner()
+        joiner.indexRenditions(self.DB.getAllVERIFY())
+
+        self.updatePBar(len(self.items))
+        self.metrics.add('rows', len(items))
+
+        batchedItems, problemItems = [], []
+        tables = joiner.share()
+        try:
+            self.workers.load(tables)
+            batchedItems, problemItems = self.workers.run(verifyItem, items, lambda p: self.logProgress(p, f'OFFLOADER: Local copy of {p[0]} now corresponds to remote copy'))
+        except OSError as error:
+            print(error)
+        finally:
+            tables.release()
+
+        self.items = batchedItems
+
+        try:
+            for item in problemItems:
+                self.problemRecs.append(item)
+                self.logger.logError(f'{item["RenditionNumber"]} does not have the PrimaryFileID {item.get("FileID")} in MediaRenditions. This file has not been verified', item['Origin'])
+        except OSError as error:
+            print('error with logging problem items to log!')
+
+        self.updatePBar(0)
+
+        self.output(f'OFFLOADER: {len(self.problemRecs)} records from the files you selected have not been updated. Check the error logs for more information!')
+
+        self.output(">>>>>> CLEANING UP <<<<<<", True)
+
+    def finishProcessing(self) -> None:
+        """
+        Finish up after processing is complete:
+        - drop scratchtable
+        - release local store (the MediaRenditions snapshot is kept for incremental syncs)
+        - mark the run as finished in the journal
+        - stop the worker processes
+        - write all queued log entries to disk
+        - reset progress bar
+
+        Only a run that got through verification gets here; a run that stopped earlier keeps its scratch table and journal so it can be resumed.
+        """
+        self.DB.dropScratchTable()
+        self.DB.releaseStore()
+        if self.journal is not None: self.journal.finish()
+        self.workers.close()
+        self.logger.flush()
+        self.updatePBar()
+
+    def logProgress(self, p:list, msg:str) -> None:
+        """
+        Log an item processed by the worker pool and advance the progress bar
+
+        Args:
+            p (list): rendition number and origin of the processed item
+            msg (str): entry for the log of the origin
+        """
+        self.logger.log(msg, p[1])
+        self.updatePBar()
+
+    def summary(self) -> dict:
+        """
+        Count the results of the run
+
+        Returns:
+            dict: number of reports, updated items and problem items
+        """
+        return { 'reports' : len(self.input), 'updated' : len(self.items), 'problems' : len(self.problemRecs) }
@@ -0,0 +1,161 @@
+import time, threading
+
+class Stage:
+    """ One step of the processing pipeline and the stages it has to wait for """
+
+    def __init__(self, name:str, func, after:tuple=(), args=()):
+        """
+        ### Parameters
+        - name (str) : unique name of the stage
+        - func (function) : runs the stage; returning False marks the stage as failed
+        - after (tuple) : names of the stages that must succeed first (default=())
+        - args (tuple|function) : arguments for func, or a function returning them when the stage starts (default=())
+        """
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.args = args
+        self.status = 'waiting'     # WAITING, RUNNING, DONE, FAILED OR SKIPPED
+        self.result = None
+        self.error = None
+        self.started = None
+        self.finished = None
+
+    @property
+    def seconds(self) -> float:
+        """ Wall time of the stage, or None if it has not finished """
+        if self.started is None or self.finished is None: return None
+        return self.finished - self.started
+
+class Scheduler:
+    """ This class runs the stages of a pipeline as a graph: every stage starts in its own thread as soon as the stages it depends on have succeeded, so independent stages run side by side. Completion is handed to dispatch, which the GUI uses to get back on the Tk thread.
+    ## Methods (8)
+    - add : name (str), func (function), after (tuple), args (tuple) -> Stage
+    - onStage : callback (function) -> None
+    - onDone : callback (function) -> None
+    - run : () -> None
+    - launch : stage (Stage) -> None
+    - complete : name (str), result (Any), error (Exception) -> None
+    - wait : timeout (float) -> bool
+    - timings : () -> list
+    """
+
+    def __init__(self, dispatch=None):
+        """
+        ### Parameters
+        - dispatch (function) : called from the stage thread with a function and its arguments; it must run them on the thread that owns the scheduler (default=None, run them directly)
+        """
+        self.stages = {}
+        self.dispatch = dispatch
+        self.stageCallback = None
+        self.doneCallback = None
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+        self.done = False
+        self.started = None
+
+    def add(self, name:str, func, after:tuple=(), args=()) -> Stage:
+        """ Add a stage to the graph
+        ### Parameters
+        - name (str) : unique name of the stage
+        - func (function) : runs the stage
+        - after (tuple) : names of the stages to wait for (default=())
+        - args (tuple|function) : arguments for func, or a function returning them (default=())
+        ### Returns
+        - Stage : the new stage
+        """
+        if name in self.stages: raise ValueError(f'Stage {name} already exists')
+        missing = [a for a in after if a not in self.stages]
+        if missing: raise ValueError(f'Stage {name} depends on unknown stages {", ".join(missing)}')
+        stage = self.stages[name] = Stage(name, func, after, args)
+        return stage
+
+    def onStage(self, callback) -> None:
+        """ Assign a function that is called with each Stage once it has finished, failed or been skipped
+        ### Parameters
+        - callback (function) : callback
+        """
+        self.stageCallback = callback
+
+    def onDone(self, callback) -> None:
+        """ Assign a function that is called with the failed stages once no stage is left to run
+        ### Parameters
+        - callback (function) : callback
+        """
+        self.doneCallback = callback
+
+    def run(self) -> None:
+        """ Start every stage whose dependencies are met """
+        if self.started is None: self.started = time.monotonic()
+        with self.lock:
+            ready = []
+            for stage in self.stages.values():
+                if stage.status != 'waiting': continue
+                states = [self.stages[a].status for a in stage.after]
+                if any(s in ('failed', 'skipped') for s in states):
+                    stage.status = 'skipped'
+                elif all(s == 'done' for s in states):
+                    stage.status = 'running'
+                    ready.append(stage)
+            skipped = [s for s in self.stages.values() if s.status == 'skipped' and s.finished is None]
+            for stage in skipped: stage.finished = time.monotonic()
+            done = not skipped and not self.done and not any(s.status in ('waiting', 'running') for s in self.stages.values())
+            if done: self.done = True
+
+        for stage in skipped:
+            if self.stageCallback is not None: self.stageCallback(stage)
+        for stage in ready: self.launch(stage)
+        # SKIPPING A STAGE MAY SKIP THE STAGES WAITING FOR IT
+        if skipped: return self.run()
+        if done:
+            if self.doneCallback is not None: self.doneCallback([s for s in self.stages.values() if s.status == 'failed'])
+            self.finished.set()
+
+    def launch(self, stage:Stage) -> None:
+        """ Run a stage in a new thread
+        ### Parameters
+        - stage (Stage) : stage to run
+        """
+        def task():
+            result, error = None, None
+            try:
+                args = stage.args() if callable(stage.args) else stage.args
+                result = stage.func(*args)
+            except Exception as e:
+                error = e
+            if self.dispatch is None: self.complete(stage.name, result, error)
+            else: self.dispatch(self.complete, stage.name, result, error)
+
+        stage.started = time.monotonic()
+        threading.Thread(target=task, name=f'Stage-{stage.name}', daemon=True).start()
+
+    def complete(self, name:str, result=None, error:Exception=None) -> None:
+        """ Record the outcome of a stage and start the stages that were waiting for it
+        ### Parameters
+        - name (str) : name of the stage
+        - result (Any) : value returned by the stage (default=None)
+        - error (Exception) : exception raised by the stage (default=None)
+        """
+        stage = self.stages[name]
+        with self.lock:
+            stage.finished = time.monotonic()
+            stage.result, stage.error = result, error
+            stage.status = 'failed' if error is not None or result is False else 'done'
+        if self.stageCallback is not None: self.stageCallback(stage)
+        self.run()
+
+    def wait(self, timeout:float=None) -> bool:
+        """ Block until no stage is left to run; for use without a GUI
+        ### Parameters
+        - timeout (float) : seconds to wait (default=None, wait for ever)
+        ### Returns
+        - bool : True if all stages have finished
+        """
+        return self.finished.wait(timeout)
+
+    def timings(self) -> list:
+        """ List the wall time of each stage
+        ### Returns
+        - list : name, status and seconds of each stage in the order they were added
+        """
+        return [{ 'name' : s.name, 'status' : s.status, 'seconds' : s.seconds } for s in self.stages.values()]
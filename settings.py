@@ -54,7 +54,7 @@ class Settings:
                 result = {}
                 result['msg'] = error
                 result['db'] = { 'host' : '', 'name' : '', 'user' : '', 'scratchTable' : ''}
-                result['flags'] = { 'lFlag' : False, 'eFlag' : False, 'bFlag' : False, 'tFlag' : False, 'hFlag' : False, 'mFlag' : False }
+                result['flags'] = { 'lFlag' : False, 'eFlag' : False, 'bFlag' : False, 'tFlag' : False, 'hFlag' : False, 'mFlag' : False, 'fFlag' : False, 'sFlag' : False }
                 return result
             # else:
             #     result = {}
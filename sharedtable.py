@@ -0,0 +1,170 @@
+import sys
+from array import array
+from multiprocessing import shared_memory, resource_tracker
+
+class SharedTable:
+    """ This class holds a read-only snapshot of a TMS table in shared memory. The key column is kept sorted for binary search and every other column is an int64 array, so worker processes attach to the same block instead of receiving a pickled copy.
+    ## Methods (7)
+    - create : records (list), keyField (str), fields (list) -> SharedTable
+    - attach : descriptor (dict) -> SharedTable
+    - descriptor : () -> dict
+    - find : key (str/int) -> int
+    - get : key (str/int), default (Any) -> dict
+    - close : () -> None
+    - unlink : () -> None
+    """
+
+    NULL = -2**63   # STANDS IN FOR NULL IN THE INTEGER COLUMNS
+    ITEMSIZE = 8
+
+    def __init__(self, shm:shared_memory.SharedMemory, descriptor:dict):
+        self.shm = shm
+        self.keyField = descriptor['keyField']
+        self.keyType = descriptor['keyType']
+        self.fields = descriptor['fields']
+        self.rows = descriptor['rows']
+        self.blobSize = descriptor['blobSize']
+        n = self.rows
+        pos = 0
+        if self.keyType == 'str':
+            self.offsets = shm.buf[pos:pos + (n + 1) * self.ITEMSIZE].cast('q')
+            pos += (n + 1) * self.ITEMSIZE
+            self.blob = shm.buf[pos:pos + self.blobSize]
+            pos += self.blobSize + (-self.blobSize % self.ITEMSIZE)
+        else:
+            self.keys = shm.buf[pos:pos + n * self.ITEMSIZE].cast('q')
+            pos += n * self.ITEMSIZE
+        self.columns = {}
+        for field in self.fields:
+            self.columns[field] = shm.buf[pos:pos + n * self.ITEMSIZE].cast('q')
+            pos += n * self.ITEMSIZE
+
+    @classmethod
+    def create(cls, records:list, keyField:str, fields:list):
+        """ Copy records into a new shared memory block. The first record for a key wins
+        ### Parameters
+        - records (list) : records downloaded from TMS
+        - keyField (str) : name of the field to look records up by
+        - fields (list) : names of the integer fields to keep
+        ### Returns
+        - SharedTable : table owning the new block
+        """
+        index = {}
+        for record in records:
+            index.setdefault(record[keyField], record)
+        keyType = 'str' if any(isinstance(k, str) for k in index) else 'int'
+        if keyType == 'str':
+            encoded = sorted((str(k).encode('utf8'), r) for k, r in index.items())
+            blob = b''.join(k for k, _ in encoded)
+            offsets = array('q', [0])
+            for k, _ in encoded: offsets.append(offsets[-1] + len(k))
+            rows = [r for _, r in encoded]
+            keyBytes = offsets.tobytes() + blob + bytes(-len(blob) % cls.ITEMSIZE)
+        else:
+            ordered = sorted(index.items())
+            blob = b''
+            rows = [r for _, r in ordered]
+            keyBytes = array('q', [k for k, _ in ordered]).tobytes()
+        data = [keyBytes]
+        for field in fields:
+            data.append(array('q', [cls.NULL if r[field] is None else int(r[field]) for r in rows]).tobytes())
+        size = sum(len(d) for d in data)
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        pos = 0
+        for d in data:
+            shm.buf[pos:pos + len(d)] = d
+            pos += len(d)
+        return cls(shm, { 'name' : shm.name, 'keyField' : keyField, 'keyType' : keyType, 'fields' : list(fields), 'rows' : len(rows), 'blobSize' : len(blob) })
+
+    @classmethod
+    def attach(cls, descriptor:dict):
+        """ Attach to an existing shared memory block without copying it
+        ### Parameters
+        - descriptor (dict) : descriptor of the table returned by descriptor()
+        ### Returns
+        - SharedTable : table reading from the existing block
+        """
+        # ONLY THE CREATING PROCESS OWNS THE BLOCK. WORKERS FORKED AFTER THE TRACKER STARTED SHARE IT WITH THAT PROCESS, SO ATTACHING MUST NOT REGISTER THE BLOCK AT ALL
+        if sys.version_info >= (3, 13):
+            return cls(shared_memory.SharedMemory(name=descriptor['name'], track=False), descriptor)
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            shm = shared_memory.SharedMemory(name=descriptor['name'])
+        finally:
+            resource_tracker.register = register
+        return cls(shm, descriptor)
+
+    def descriptor(self) -> dict:
+        """ Describe the layout of the block so another process can attach to it
+        ### Returns
+        - dict : name and layout of the shared memory block
+        """
+        return { 'name' : self.shm.name, 'keyField' : self.keyField, 'keyType' : self.keyType, 'fields' : self.fields, 'rows' : self.rows, 'blobSize' : self.blobSize }
+
+    def __reduce__(self):
+        return (SharedTable.attach, (self.descriptor(),))
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def key(self, idx:int):
+        """ Read the key at a position
+        ### Parameters
+        - idx (int) : position in the sorted key column
+        ### Returns
+        - bytes/int : encoded key
+        """
+        if self.keyType == 'str':
+            return bytes(self.blob[self.offsets[idx]:self.offsets[idx + 1]])
+        return self.keys[idx]
+
+    def find(self, key) -> int:
+        """ Binary search the key column
+        ### Parameters
+        - key (str/int) : key to look up
+        ### Returns
+        - int : position of the key or -1 if it is missing
+        """
+        try:
+            probe = str(key).encode('utf8') if self.keyType == 'str' else int(key)
+        except (TypeError, ValueError):
+            return -1
+        lo, hi = 0, self.rows
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.key(mid) < probe: lo = mid + 1
+            else: hi = mid
+        return lo if lo < self.rows and self.key(lo) == probe else -1
+
+    def get(self, key, default=None) -> dict:
+        """ Look up a record by its key
+        ### Parameters
+        - key (str/int) : key to look up
+        - default (Any) : returned if the key is missing (default=None)
+        ### Returns
+        - dict : the record with the key field and all integer fields
+        """
+        idx = self.find(key)
+        if idx < 0: return default
+        record = { self.keyField : key }
+        for field in self.fields:
+            value = self.columns[field][idx]
+            record[field] = None if value == self.NULL else value
+        return record
+
+    def close(self) -> None:
+        """ Release the views on the block in this process """
+        if self.keyType == 'str':
+            self.offsets.release()
+            self.blob.release()
+        else:
+            self.keys.release()
+        for column in self.columns.values(): column.release()
+        self.columns = {}
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """ Close and free the block; only the process that created it should call this """
+        self.close()
+        self.shm.unlink()
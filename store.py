@@ -0,0 +1,400 @@
+try:
+    import os, sqlite3, tempfile, threading
+    from contextlib import contextmanager
+    from tinydb import TinyDB, where
+except ImportError as error:
+    print(error)
+
+# LOCAL SNAPSHOTS OF THE TMS TABLES: COLUMNS IN ORDER AND THE COLUMNS TO INDEX
+TABLES = {
+    'MMIDS' : { 'columns' : { 'RenditionNumber' : 'TEXT', 'MediaMasterID' : 'INTEGER', 'RenditionID' : 'INTEGER', 'PrimaryFileID' : 'INTEGER' }, 'indexes' : ['RenditionNumber', 'RenditionID', 'MediaMasterID'] },
+    'MTIDS' : { 'columns' : { 'Format' : 'TEXT', 'FormatID' : 'INTEGER', 'MediaTypeID' : 'INTEGER' }, 'indexes' : ['Format'] },
+    'IIDS' : { 'columns' : { 'RenditionID' : 'INTEGER', 'FileID' : 'INTEGER' }, 'indexes' : ['RenditionID'] },
+    'VERIFY' : { 'columns' : { 'RenditionNumber' : 'TEXT', 'MediaMasterID' : 'INTEGER', 'RenditionID' : 'INTEGER', 'PrimaryFileID' : 'INTEGER' }, 'indexes' : ['RenditionNumber'] },
+    'SYNC' : { 'columns' : { 'TableName' : 'TEXT', 'Bucket' : 'INTEGER', 'Checksum' : 'INTEGER', 'Rows' : 'INTEGER' }, 'indexes' : ['TableName'] },
+}
+
+class Staging:
+    """ This class holds the rows of a download from the MS Server in a SQLite file of its own. Downloads of several tables fill their staging files side by side without the lock of the store, which is only taken for the short transaction that loads the rows into the store.
+    ## Methods (3)
+    - insert : rows (list) -> int
+    - batches : size (int) -> generator
+    - close : () -> None
+    """
+
+    def __init__(self, table:str, folder:str=None):
+        """
+        ### Parameters
+        - table (str) : name of the table in the local store the rows are meant for
+        - folder (str) : folder for the staging file (default=None, the temporary folder)
+        """
+        self.table = table
+        self.columns = list(TABLES[table]['columns'])
+        self.rows = 0
+        handle, self.path = tempfile.mkstemp(prefix=f'{table}_', suffix='.staging', dir=folder)
+        os.close(handle)
+        # THE FILE IS THROWN AWAY AFTER THE LOAD, SO IT NEEDS NO JOURNAL
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode=OFF')
+        self.conn.execute('PRAGMA synchronous=OFF')
+        self.conn.execute(f'CREATE TABLE {table} ({", ".join(f"{c} {t}" for c, t in TABLES[table]["columns"].items())})')
+
+    def insert(self, rows:list) -> int:
+        """ Add downloaded rows to the staging file
+        ### Parameters
+        - rows (list) : dictionaries keyed on the columns of the table, or tuples in column order
+        ### Returns
+        - int : number of rows added
+        """
+        cur = self.conn.executemany(f'INSERT INTO {self.table} ({", ".join(self.columns)}) VALUES ({", ".join("?" * len(self.columns))})', (row if isinstance(row, tuple) else tuple(row[c] for c in self.columns) for row in rows))
+        self.rows += cur.rowcount
+        return cur.rowcount
+
+    def batches(self, size:int=10000):
+        """ Read the rows back in the order they were added
+        ### Parameters
+        - size (int) : rows per batch (default=10000)
+        ### Returns
+        - generator : lists of up to size row tuples
+        """
+        self.conn.commit()
+        cur = self.conn.execute(f'SELECT {", ".join(self.columns)} FROM {self.table} ORDER BY rowid')
+        while True:
+            rows = cur.fetchmany(size)
+            if not rows: break
+            yield rows
+
+    def close(self) -> None:
+        """ Close and delete the staging file """
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if os.path.isfile(self.path): os.remove(self.path)
+
+class SQLiteStore:
+    """ This class keeps the local snapshots of the TMS tables in an indexed SQLite database.
+    ## Methods (12)
+    - open : () -> None
+    - check : () -> bool
+    - remove : () -> None
+    - close : () -> None
+    - transaction : () -> None
+    - purge : table (str) -> None
+    - insert : table (str), rows (list) -> int
+    - load : table (str), staging (Staging) -> int
+    - delete : table (str), field (str), lo (int), hi (int) -> None
+    - all : table (str) -> list
+    - find : table (str), field (str), id (str) -> list
+    - count : table (str), field (str), id (str) -> int
+    """
+
+    def __init__(self, path:str):
+        self.path = path
+        self.conn = None
+        self.lock = threading.RLock()
+        self.depth = 0     # NESTED TRANSACTION BLOCKS OPEN IN THE THREAD THAT HOLDS THE LOCK
+
+    def open(self) -> None:
+        """ Open the database and create missing tables and indexes """
+        with self.lock:
+            if self.conn is not None: return
+            self.conn = sqlite3.connect(self.path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('PRAGMA synchronous=OFF')
+            with self.conn:
+                for table, schema in TABLES.items():
+                    columns = ', '.join(f'{c} {t}' for c, t in schema['columns'].items())
+                    self.conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+                    for column in schema['indexes']:
+                        self.conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})')
+
+    def check(self) -> bool:
+        """ Open the database and check its integrity
+        ### Returns
+        - bool : True if the database is corrupted
+        """
+        try:
+            self.open()
+            with self.lock:
+                return self.conn.execute('PRAGMA quick_check').fetchone()[0] != 'ok'
+        except sqlite3.DatabaseError:
+            self.close()
+            return True
+
+    def remove(self) -> None:
+        """ Close and delete the database """
+        self.close()
+        for path in (self.path, f'{self.path}-wal', f'{self.path}-shm'):
+            if os.path.isfile(path): os.remove(path)
+
+    def close(self) -> None:
+        """ Close the connection to the database """
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    @contextmanager
+    def transaction(self):
+        """ Group the writes in the block into one transaction that is committed when the block ends and rolled back if it raises; a nested block joins the transaction around it. The block holds the lock of the store, so it should only write rows that are already at hand, such as those of a Staging file, and never wait on the MS Server """
+        self.open()
+        with self.lock:
+            if self.depth:
+                yield
+                return
+            self.depth += 1
+            try:
+                with self.conn:
+                    yield
+            finally:
+                self.depth -= 1
+
+    def field(self, table:str, field:str) -> str:
+        """ Make sure a field belongs to a table before it is used in a query
+        ### Parameters
+        - table (str) : name of the table
+        - field (str) : name of the field
+        ### Returns
+        - str : the field
+        """
+        if field not in TABLES[table]['columns']: raise KeyError(f'{table} has no field {field}')
+        return field
+
+    def purge(self, table:str) -> None:
+        """ Remove all rows from a table
+        ### Parameters
+        - table (str) : name of the table
+        """
+        self.open()
+        with self.transaction():
+            self.conn.execute(f'DELETE FROM {table}')
+
+    def insert(self, table:str, rows:list) -> int:
+        """ Insert rows in bulk, in a transaction of their own unless the block of a transaction is open
+        ### Parameters
+        - table (str) : name of the table
+        - rows (list) : dictionaries keyed on the columns of the table, or tuples in column order
+        ### Returns
+        - int : number of rows inserted
+        """
+        self.open()
+        columns = list(TABLES[table]['columns'])
+        with self.transaction():
+            cur = self.conn.executemany(f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', (row if isinstance(row, tuple) else tuple(row[c] for c in columns) for row in rows))
+            return cur.rowcount
+
+    def load(self, table:str, staging:Staging) -> int:
+        """ Insert the rows of a staging file in one transaction, batch by batch
+        ### Parameters
+        - table (str) : name of the table
+        - staging (Staging) : rows downloaded for the table
+        ### Returns
+        - int : number of rows inserted
+        """
+        with self.transaction():
+            return sum(self.insert(table, rows) for rows in staging.batches())
+
+    def delete(self, table:str, field:str, lo, hi=None) -> None:
+        """ Delete the rows of a table whose field equals lo, or lies in the range [lo, hi) if hi is given
+        ### Parameters
+        - table (str) : name of the table
+        - field (str) : name of the field
+        - lo (Any) : value or lower bound of the range
+        - hi (Any) : exclusive upper bound of the range (default=None)
+        """
+        self.open()
+        field = self.field(table, field)
+        with self.transaction():
+            if hi is None: self.conn.execute(f'DELETE FROM {table} WHERE {field} = ?', (lo,))
+            else: self.conn.execute(f'DELETE FROM {table} WHERE {field} >= ? AND {field} < ?', (lo, hi))
+
+    def all(self, table:str) -> list:
+        """ Read all rows from a table
+        ### Parameters
+        - table (str) : name of the table
+        ### Returns
+        - list : dictionaries keyed on the columns of the table
+        """
+        self.open()
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(f'SELECT * FROM {table} ORDER BY rowid')]
+
+    def find(self, table:str, field:str, id) -> list:
+        """ Find rows in a table through the index on field
+        ### Parameters
+        - table (str) : name of the table
+        - field (str) : name of the field
+        - id (str) : value to look up
+        ### Returns
+        - list : dictionaries keyed on the columns of the table
+        """
+        self.open()
+        with self.lock:
+            return [dict(row) for row in self.conn.execute(f'SELECT * FROM {table} WHERE {self.field(table, field)} = ?', (id,))]
+
+    def count(self, table:str, field:str, id) -> int:
+        """ Count rows in a table through the index on field
+        ### Parameters
+        - table (str) : name of the table
+        - field (str) : name of the field
+        - id (str) : value to look up
+        ### Returns
+        - int : number of rows
+        """
+        self.open()
+        with self.lock:
+            return self.conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {self.field(table, field)} = ?', (id,)).fetchone()[0]
+
+class TinyDBStore:
+    """ This class keeps the local snapshots of the TMS tables in a TinyDB JSON file, as earlier versions of the program did.
+    ## Methods (12)
+    - open : () -> None
+    - check : () -> bool
+    - remove : () -> None
+    - close : () -> None
+    - transaction : () -> None
+    - purge : table (str) -> None
+    - insert : table (str), rows (list) -> int
+    - load : table (str), staging (Staging) -> int
+    - delete : table (str), field (str), lo (int), hi (int) -> None
+    - all : table (str) -> list
+    - find : table (str), field (str), id (str) -> list
+    - count : table (str), field (str), id (str) -> int
+    """
+
+    def __init__(self, path:str):
+        self.path = path
+        self.tinyDB = None
+        self.lock = threading.RLock()
+        self.depth = 0     # NESTED TRANSACTION BLOCKS OPEN IN THE THREAD THAT HOLDS THE LOCK
+
+    def open(self) -> None:
+        """ Load the TinyDB instance """
+        if self.tinyDB is None:
+            self.tinyDB = TinyDB(self.path, sort_keys=True, indent=4, separators=(',', ': '))
+
+    def check(self) -> bool:
+        """ Load the TinyDB instance to verify it works
+        ### Returns
+        - bool : True if the file is corrupted
+        """
+        try:
+            self.open()
+            return False
+        except:
+            self.tinyDB = None
+            return True
+
+    def remove(self) -> None:
+        """ Close and delete the TinyDB file """
+        self.close()
+        if os.path.isfile(self.path): os.remove(self.path)
+
+    def close(self) -> None:
+        """ Close the TinyDB instance """
+        if self.tinyDB is not None:
+            self.tinyDB.close()
+            self.tinyDB = None
+
+    @contextmanager
+    def transaction(self):
+        """ Group the writes in the block so they are undone together if it raises; a nested block joins the transaction around it. TinyDB writes the file on every change, so the contents are copied when the block starts and written back on a failure. The block holds the lock of the store, so it should only write rows that are already at hand, such as those of a Staging file, and never wait on the MS Server """
+        self.open()
+        with self.lock:
+            if self.depth:
+                yield
+                return
+            self.depth += 1
+            snapshot = self.tinyDB.storage.read()
+            try:
+                yield
+            except BaseException:
+                # REOPEN AFTERWARDS SO THE TABLES DO NOT SERVE CACHED ROWS OF THE FAILED BLOCK
+                self.tinyDB.storage.write(snapshot or {})
+                self.close()
+                raise
+            finally:
+                self.depth -= 1
+
+    def purge(self, table:str) -> None:
+        """ Drop a table with all its rows
+        ### Parameters
+        - table (str) : name of the table
+        """
+        self.open()
+        with self.lock:
+            self.tinyDB.drop_table(table) if hasattr(self.tinyDB, 'drop_table') else self.tinyDB.purge_table(table)
+
+    def insert(self, table:str, rows:list) -> int:
+        """ Insert rows in bulk with one write of the file
+        ### Parameters
+        - table (str) : name of the table
+        - rows (list) : dictionaries keyed on the columns of the table, or tuples in column order
+        ### Returns
+        - int : number of rows inserted
+        """
+        self.open()
+        columns = list(TABLES[table]['columns'])
+        with self.lock:
+            return len(self.tinyDB.table(table).insert_multiple(dict(zip(columns, row)) if isinstance(row, tuple) else { c : row[c] for c in columns } for row in rows))
+
+    def load(self, table:str, staging:Staging) -> int:
+        """ Insert the rows of a staging file with one write of the file
+        ### Parameters
+        - table (str) : name of the table
+        - staging (Staging) : rows downloaded for the table
+        ### Returns
+        - int : number of rows inserted
+        """
+        return self.insert(table, [row for rows in staging.batches() for row in rows])
+
+    def delete(self, table:str, field:str, lo, hi=None) -> None:
+        """ Delete the documents of a table whose field equals lo, or lies in the range [lo, hi) if hi is given
+        ### Parameters
+        - table (str) : name of the table
+        - field (str) : name of the field
+        - lo (Any) : value or lower bound of the range
+        - hi (Any) : exclusive upper bound of the range (default=None)
+        """
+        self.open()
+        with self.lock:
+            if hi is None: self.tinyDB.table(table).remove(where(field) == lo)
+            else: self.tinyDB.table(table).remove((where(field) >= lo) & (where(field) < hi))
+
+    def all(self, table:str) -> list:
+        """ Read all documents from a table
+        ### Parameters
+        - table (str) : name of the table
+        ### Returns
+        - list : documents keyed on the columns of the table
+        """
+        self.open()
+        with self.lock:
+            return self.tinyDB.table(table).all()
+
+    def find(self, table:str, field:str, id) -> list:
+        """ Find the documents of a table whose field equals id; TinyDB scans the whole table
+        ### Parameters
+        - table (str) : name of the table
+        - field (str) : name of the field
+        - id (str) : value to look up
+        ### Returns
+        - list : documents keyed on the columns of the table
+        """
+        self.open()
+        with self.lock:
+            return self.tinyDB.table(table).search(where(field) == id)
+
+    def count(self, table:str, field:str, id) -> int:
+        """ Count the documents of a table whose field equals id
+        ### Parameters
+        - table (str) : name of the table
+        - field (str) : name of the field
+        - id (str) : value to look up
+        ### Returns
+        - int : number of documents
+        """
+        self.open()
+        with self.lock:
+            return self.tinyDB.table(table).count(where(field) == id)
@@ -0,0 +1,158 @@
+try:
+    import re, time, threading
+    from collections import deque
+    from contextlib import contextmanager
+    from functools import lru_cache
+except ImportError as error:
+    print(error)
+
+SPACE = re.compile(r'\s+')
+LITERALS = re.compile(r"N?'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+ROWS = re.compile(r'(\([^()]*\))(?:\s*,\s*\1)+')     # REPEATED ROWS OF A MULTI-ROW VALUES LIST
+
+@lru_cache(maxsize=1024)
+def template(query:str) -> str:
+    """ Reduce a statement to its template, so statements that differ only in their values are traced together: whitespace is collapsed, literals become ? and the rows of a multi-row VALUES list become one row
+    ### Parameters
+    - query (str) : SQL query
+    ### Returns
+    - str : template of the query
+    """
+    query = LITERALS.sub('?', SPACE.sub(' ', query.strip()))
+    return ROWS.sub(r'\1, ...', query)
+
+class Span:
+    """ One call to the MS Server: a connect, the execution of a statement, a fetch of its rows or a commit """
+
+    def __init__(self, kind:str, query:str=None):
+        """
+        ### Parameters
+        - kind (str) : connect, execute, fetch or commit
+        - query (str) : SQL query of an execute (default=None)
+        """
+        self.kind = kind
+        self.query = query
+        self.rows = 0
+        self.error = None
+
+class Tracer:
+    """ This class traces the calls DB makes to the MS Server. Every connect, execute, fetch and commit is timed as a span and added up per statement template; fetches and commits count towards the last statement executed in the same thread. Spans that take longer than the threshold are written to the slow-query log.
+    ## Methods (8)
+    - setLogger : logger (Logger) -> None
+    - setThreshold : seconds (float) -> None
+    - reset : () -> None
+    - span : kind (str), query (str) -> Span
+    - record : span (Span), seconds (float) -> None
+    - summary : () -> list
+    - top : n (int) -> list
+    - slowest : () -> list
+    """
+
+    def __init__(self, threshold:float=1.0):
+        """
+        ### Parameters
+        - threshold (float) : seconds after which a span goes to the slow-query log (default=1.0)
+        """
+        self.threshold = threshold
+        self.logger = None
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def setLogger(self, logger) -> None:
+        """ Assign the logger that keeps the slow-query log
+        ### Parameters
+        - logger (Logger) : logger instance
+        """
+        self.logger = logger
+
+    def setThreshold(self, seconds:float) -> None:
+        """ Set how long a span may take before it goes to the slow-query log
+        ### Parameters
+        - seconds (float) : threshold in seconds; None turns the slow-query log off
+        """
+        self.threshold = seconds
+
+    def reset(self) -> None:
+        """ Forget the spans of the previous run """
+        with self.lock:
+            self.templates = {}
+            self.slow = deque(maxlen=100)  # LAST SLOW SPANS, ALSO WRITTEN TO THE SLOW-QUERY LOG
+
+    @contextmanager
+    def span(self, kind:str, query:str=None):
+        """ Time a call to the MS Server until the block ends. Set rows on the span to count the rows it moved
+        ### Parameters
+        - kind (str) : connect, execute, fetch or commit
+        - query (str) : SQL query of an execute (default=None)
+        ### Returns
+        - Span : the span
+        """
+        span = Span(kind, query)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as error:
+            span.error = error
+            raise
+        finally:
+            self.record(span, time.perf_counter() - start)
+
+    def record(self, span:Span, seconds:float) -> None:
+        """ Add a finished span to the totals of its statement template
+        ### Parameters
+        - span (Span) : the span
+        - seconds (float) : wall time of the span
+        """
+        if span.query is not None:
+            key = self.local.template = template(span.query)
+        elif span.kind == 'connect':
+            key = 'CONNECT'
+        else:
+            key = getattr(self.local, 'template', None) or span.kind.upper()
+
+        with self.lock:
+            totals = self.templates.get(key)
+            if totals is None:
+                totals = self.templates[key] = { 'template' : key, 'calls' : 0, 'seconds' : 0.0, 'max' : 0.0, 'rows' : 0, 'errors' : 0, 'connect' : 0.0, 'execute' : 0.0, 'fetch' : 0.0, 'commit' : 0.0 }
+            if span.kind in ('execute', 'connect'): totals['calls'] += 1
+            totals['seconds'] += seconds
+            totals[span.kind] += seconds
+            totals['max'] = max(totals['max'], seconds)
+            totals['rows'] += span.rows
+            if span.error is not None: totals['errors'] += 1
+
+        if self.threshold is None or seconds < self.threshold: return
+        entry = { 'kind' : span.kind, 'seconds' : round(seconds, 3), 'rows' : span.rows, 'thread' : threading.current_thread().name, 'template' : key }
+        with self.lock:
+            self.slow.append(entry)
+        if self.logger is not None:
+            self.logger.logSlowQuery(f'{span.kind.upper()} took {seconds:.3f} seconds, {span.rows} rows, in {entry["thread"]}: {(span.query or key)[:2000]}')
+
+    def summary(self) -> list:
+        """ List the totals of every statement template, slowest first
+        ### Returns
+        - list : template, calls, seconds in total, per kind and for the slowest span, rows and errors of each template
+        """
+        with self.lock:
+            totals = [dict(t) for t in self.templates.values()]
+        for t in totals:
+            for field in ('seconds', 'max', 'connect', 'execute', 'fetch', 'commit'): t[field] = round(t[field], 4)
+        return sorted(totals, key=lambda t: t['seconds'], reverse=True)
+
+    def top(self, n:int=5) -> list:
+        """ List the statement templates that took the most time
+        ### Parameters
+        - n (int) : number of templates (default=5)
+        ### Returns
+        - list : totals of the n slowest templates
+        """
+        return self.summary()[:n]
+
+    def slowest(self) -> list:
+        """ List the last spans that went over the threshold
+        ### Returns
+        - list : kind, seconds, rows, thread and template of each slow span
+        """
+        with self.lock:
+            return list(self.slow)
@@ -0,0 +1,160 @@
+import math, multiprocessing
+from multiprocessing import Pool, Barrier
+from threading import BrokenBarrierError
+from logger import getWriter, setCollector
+
+joiner = None   # JOIN ENGINE LOADED IN EACH WORKER
+barrier = None  # SYNCHRONISES LOADING NEW TABLES ACROSS ALL WORKERS
+
+def initWorker(sync:Barrier, tables=None, logs=None) -> None:
+    """
+    Initialise a worker process once for the whole run
+
+    Args:
+        sync (Barrier): barrier shared by all workers in the pool
+        tables (Joiner, optional): join engine for the first stage. Defaults to None.
+        logs (Queue, optional): log-collector queue of the parent process. Defaults to None.
+    """
+    global barrier, joiner
+    barrier = sync
+    joiner = tables
+    setCollector(logs)
+
+def loadTables(tables) -> None:
+    """
+    Replace the join engine of a worker. Every worker blocks on the barrier until all have loaded, so each worker receives exactly one copy.
+
+    Args:
+        tables (Joiner): join engine for the next stage; shared memory tables are attached while unpickling
+    """
+    global joiner
+    if joiner is not None: joiner.close()
+    joiner = tables
+    barrier.wait(timeout=WorkerPool.timeout)
+
+def progress(items:list) -> list:
+    """
+    List the rendition number and origin of each item in a chunk
+
+    Args:
+        items (list): items in the chunk
+
+    Returns:
+        list: [RenditionNumber, Origin] for each item
+    """
+    return [[item["RenditionNumber"], item["Origin"]] for item in items]
+
+def updateItem(items:list) -> tuple:
+    """
+    Updates each item in a chunk with its rendition and format records
+
+    Args:
+        items (list): chunk of items to be processed
+
+    Returns:
+        tuple: matched items, problem items and progress
+    """
+    processed = progress(items)
+    return (*joiner.resolveItems(items), processed)
+
+def updateFileID(items:list) -> tuple:
+    """
+    Update the fileID for each item in a chunk
+
+    Args:
+        items (list): chunk of items to be processed
+
+    Returns:
+        tuple: matched items, problem items and progress
+    """
+    processed = progress(items)
+    return (*joiner.resolveFileIDs(items), processed)
+
+def verifyItem(items:list) -> tuple:
+    """
+    Double-check the rendition numbers and file ids of each item in a chunk match up
+
+    Args:
+        items (list): chunk of items to be processed
+
+    Returns:
+        tuple: verified items, problem items and progress
+    """
+    processed = progress(items)
+    return (*joiner.verifyItems(items), processed)
+
+class WorkerPool:
+    """ This class keeps a pool of worker processes alive for a whole run. Lookup tables are sent to each worker once per stage and tasks only carry chunks of items.
+    ## Methods (5)
+    - start : tables (Joiner) -> None
+    - load : tables (Joiner) -> None
+    - chunkSize : total (int) -> int
+    - run : func (function), items (list), callback (function) -> tuple
+    - close : () -> None
+    """
+
+    timeout = 300       # SECONDS TO WAIT FOR ALL WORKERS TO LOAD NEW TABLES
+    chunksPerWorker = 4 # CHUNKS PER WORKER TO BALANCE UNEVEN CHUNKS
+    minChunk = 50
+    maxChunk = 5000
+
+    def __init__(self, processes:int=None):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.pool = None
+
+    def start(self, tables=None) -> None:
+        """ Start the worker processes if they are not running yet
+        ### Parameters
+        - tables (Joiner) : join engine for the first stage (default=None)
+        """
+        if self.pool is None:
+            self.pool = Pool(self.processes, initializer=initWorker, initargs=(Barrier(self.processes), tables, getWriter().collect()))
+
+    def load(self, tables) -> None:
+        """ Send the join engine for the next stage to every worker
+        ### Parameters
+        - tables (Joiner) : join engine for the next stage
+        """
+        self.start()
+        try:
+            self.pool.map(loadTables, [tables] * self.processes, chunksize=1)
+        except BrokenBarrierError:
+            self.close()
+            self.start(tables)
+
+    def chunkSize(self, total:int) -> int:
+        """ Size chunks so each worker receives a few of them, within sensible bounds
+        ### Parameters
+        - total (int) : number of items to process
+        ### Returns
+        - int : number of items per chunk
+        """
+        size = math.ceil(total / (self.processes * self.chunksPerWorker))
+        return max(1, min(total, self.maxChunk, max(size, self.minChunk)))
+
+    def run(self, func, items:list, callback=None) -> tuple:
+        """ Process all items in chunks across the workers
+        ### Parameters
+        - func (function) : worker function (updateItem, updateFileID or verifyItem)
+        - items (list) : items to be processed
+        - callback (function) : called with [RenditionNumber, Origin] for each processed item (default=None)
+        ### Returns
+        - tuple : matched items and problem items
+        """
+        self.start()
+        size = self.chunkSize(len(items))
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        matched, problemRecs = [], []
+        for chunkMatched, chunkProblems, processed in self.pool.imap_unordered(func, chunks):
+            matched.extend(chunkMatched)
+            problemRecs.extend(chunkProblems)
+            if callback is not None:
+                for p in processed: callback(p)
+        return matched, problemRecs
+
+    def close(self) -> None:
+        """ Stop the worker processes """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None